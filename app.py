@@ -1,5 +1,5 @@
 import streamlit as st
-from utils.database import get_connection, get_protocols, get_protocol_details
+from utils.database import get_connection, get_protocols, get_protocol_details, invalidate_protocol_catalog, invalidate_history_cache
 from utils.style_loader import load_css
 from tabs.overview import show_overview
 from tabs.test_protocols import show_test_protocols
@@ -46,6 +46,12 @@ with st.sidebar:
     else:
         st.sidebar.warning("No protocol has been found :/ 404")
 
+    # The protocol catalog and the sample history are cached for every session, this picks up edits of the tables now
+    if st.sidebar.button("Reload protocols 🔄"):
+        invalidate_protocol_catalog(conn)
+        invalidate_history_cache(conn)
+        st.rerun()
+
     st.sidebar.markdown("---") 
     
     # AI Chat Widget
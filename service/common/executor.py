@@ -0,0 +1,230 @@
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, jsonify
+import shadow_crypt
+import timing
+
+# CPU heavy shadow_crypt calls can run outside the request thread, in a bounded pool:
+#   CRYPTO_EXECUTOR       inline (the request thread makes the call, as before), thread or process
+#   CRYPTO_LIMITS         calls of a protocol running at once, e.g. rsa=1,ntru=1 (CRYPTO_LIMIT for the rest)
+#   CRYPTO_QUEUE          calls of a protocol allowed to wait for a slot, e.g. rsa=4 (CRYPTO_QUEUE_DEPTH for the rest)
+#   CRYPTO_QUEUE_TIMEOUT  longest wait for a slot in seconds
+# Every protocol is a lane with its own slots and queue, and the pool has as many workers as all
+# lanes have slots together, so a call that got a slot never waits behind another protocol in
+# the pool: a burst of RSA key generations fills the RSA lane and queues there while ECDH keeps
+# its own slots. A call that finds its queue full or waits too long is shed, the request gets a
+# 503 with Retry-After, unless the route answers it itself inside handled() (a batch marks the
+# shed items and keeps the others). Slot waits show up as the "queue" phase of the request.
+#
+# Lanes only matter with several request threads per worker (gunicorn --threads). In a process
+# pool, functions, arguments and results must pickle: shadow_crypt functions and bytes do, RSA
+# key handles do not and are run with portable=False, in threads next to the process pool.
+CRYPTO_EXECUTOR = os.environ.get("CRYPTO_EXECUTOR", "inline")
+CRYPTO_LIMIT = int(os.environ.get("CRYPTO_LIMIT", "2"))
+CRYPTO_QUEUE_DEPTH = int(os.environ.get("CRYPTO_QUEUE_DEPTH", "16"))
+CRYPTO_QUEUE_TIMEOUT = float(os.environ.get("CRYPTO_QUEUE_TIMEOUT", "5"))
+CRYPTO_RETRY_AFTER = int(os.environ.get("CRYPTO_RETRY_AFTER", "1"))
+
+MODES = ("inline", "thread", "process")
+
+# {"rsa": 1, "ntru": 2} from "rsa=1,ntru=2"
+def parse_limits(text):
+    limits = {}
+    for item in text.split(","):
+        protocol, _, value = item.strip().partition("=")
+        if protocol:
+            limits[protocol] = int(value)
+    return limits
+
+# A call shed because its protocol's queue is full or it waited too long for a slot
+class Overloaded(Exception):
+    def __init__(self, protocol, reason):
+        super().__init__(f"Too many {protocol} operations in progress: {reason}")
+        self.protocol = protocol
+
+# Slots, queue and counters of one protocol
+class Lane:
+    def __init__(self, protocol, limit, queue_depth):
+        self.protocol = protocol
+        self.limit = limit
+        self.queue_depth = queue_depth
+        self.slots = threading.Semaphore(limit)
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'limit': self.limit,
+                'queue_depth': self.queue_depth,
+                'waiting': self.waiting,
+                'running': self.running,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'waits': self.waits,
+                'mean_wait_seconds': self.wait_seconds / self.waits if self.waits else 0.0,
+                'max_wait_seconds': self.max_wait_seconds
+            }
+
+class CryptoExecutor:
+    def __init__(self, protocols, mode=CRYPTO_EXECUTOR, limits=None, queues=None, observer=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown CRYPTO_EXECUTOR: {mode}")
+        limits = parse_limits(os.environ.get("CRYPTO_LIMITS", "")) if limits is None else limits
+        queues = parse_limits(os.environ.get("CRYPTO_QUEUE", "")) if queues is None else queues
+        unknown = [name for name in {**limits, **queues} if name not in protocols]
+        if unknown:
+            raise ValueError(f"Unknown protocols in CRYPTO_LIMITS / CRYPTO_QUEUE: {', '.join(unknown)}")
+        self.mode = mode
+        self.lanes = {protocol: Lane(protocol, limits.get(protocol, CRYPTO_LIMIT), queues.get(protocol, CRYPTO_QUEUE_DEPTH))
+                      for protocol in protocols}
+        self.workers = sum(lane.limit for lane in self.lanes.values())
+        # Metrics of the lanes, anything with executor_changed(protocol, queued, running, rejected)
+        self.observer = observer
+        self._lock = threading.Lock()
+        self._owner_pid = None
+        self._pools = {}
+        self._local = threading.local()
+
+    # Pools do not survive a gunicorn fork either, every worker starts its own on first use
+    def pool(self, portable):
+        kind = "process" if portable and self.mode == "process" else "thread"
+        if self._owner_pid != os.getpid() or kind not in self._pools:
+            with self._lock:
+                if self._owner_pid != os.getpid():
+                    self._owner_pid = os.getpid()
+                    self._pools = {}
+                if kind not in self._pools:
+                    if kind == "process":
+                        # Forked workers start with shadow_crypt loaded, nothing is imported again
+                        self._pools[kind] = concurrent.futures.ProcessPoolExecutor(
+                            self.workers, mp_context=multiprocessing.get_context("fork"))
+                    else:
+                        self._pools[kind] = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="crypto")
+        return self._pools[kind]
+
+    def observe(self, protocol, **changes):
+        if self.observer is not None:
+            self.observer.executor_changed(protocol, **changes)
+
+    # function(*args) as a call of the protocol's lane, raises Overloaded when it is shed
+    def run(self, protocol, function, *args, portable=True):
+        if self.mode == "inline" or getattr(self._local, 'bypass', False):
+            return function(*args)
+        lane = self.lanes[protocol]
+        if not lane.slots.acquire(blocking=False):
+            self.wait_for_slot(lane)
+        with lane.lock:
+            lane.running += 1
+        self.observe(protocol, running=1)
+        try:
+            return self.pool(portable).submit(function, *args).result()
+        finally:
+            with lane.lock:
+                lane.running -= 1
+                lane.completed += 1
+            self.observe(protocol, running=-1)
+            lane.slots.release()
+
+    def wait_for_slot(self, lane):
+        with lane.lock:
+            full = lane.waiting >= lane.queue_depth
+            if full:
+                lane.rejected += 1
+            else:
+                lane.waiting += 1
+        if full:
+            self.shed(lane, f"queue of {lane.queue_depth} is full")
+        self.observe(lane.protocol, queued=1)
+
+        start = time.perf_counter()
+        acquired = lane.slots.acquire(timeout=CRYPTO_QUEUE_TIMEOUT)
+        waited = time.perf_counter() - start
+        with lane.lock:
+            lane.waiting -= 1
+            lane.waits += 1
+            lane.wait_seconds += waited
+            lane.max_wait_seconds = max(lane.max_wait_seconds, waited)
+            if not acquired:
+                lane.rejected += 1
+        self.observe(lane.protocol, queued=-1)
+        if has_request_context():
+            timing.current().add('queue', waited)
+        if not acquired:
+            self.shed(lane, f"no slot within {CRYPTO_QUEUE_TIMEOUT:g} seconds")
+
+    # The request is turned into a 503 even if the route catches the error, except inside handled()
+    def shed(self, lane, reason):
+        self.observe(lane.protocol, rejected=1)
+        error = Overloaded(lane.protocol, reason)
+        if has_request_context() and not g.get('crypto_shed_handled'):
+            g.crypto_overloaded = error
+        raise error
+
+    # Calls shed inside only raise Overloaded, the route answers them on its own (e.g. as failed
+    # items of a batch) and the rest of its response stands
+    @contextmanager
+    def handled(self):
+        previous = g.get('crypto_shed_handled', False)
+        g.crypto_shed_handled = True
+        try:
+            yield
+        finally:
+            g.crypto_shed_handled = previous
+
+    # Calls of this thread run right in it, outside the lanes: for background work such as key
+    # pool refills, which must not take the slots and queue places requests need nor count as shed
+    @contextmanager
+    def bypass(self):
+        self._local.bypass = True
+        try:
+            yield
+        finally:
+            self._local.bypass = False
+
+    # Server 1 keeps RSA keys as handles. Those do not pickle, so a process pool runs the PEM
+    # builtin instead, a shadow_crypt function pickles by name wherever this module was loaded from
+    def generate_rsa_key(self):
+        if self.mode == "process":
+            private_pem, _ = self.run('rsa', shadow_crypt.generate_rsa_key)
+            return shadow_crypt.RsaKey.from_pem(private_pem)
+        return self.run('rsa', shadow_crypt.RsaKey.generate, portable=False)
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'queue_timeout_seconds': CRYPTO_QUEUE_TIMEOUT,
+            'lanes': {protocol: lane.stats() for protocol, lane in self.lanes.items()}
+        }
+
+# Executor with a lane per protocol, 503 answers for shed requests and GET /executor with the
+# lanes of this worker. Call after metrics.init_app so the 503 is what gets recorded.
+def init_app(app, protocols, metrics=None):
+    executor = CryptoExecutor(protocols, observer=metrics)
+
+    @app.after_request
+    def answer_overloaded(response):
+        error = g.pop('crypto_overloaded', None)
+        if error is None:
+            return response
+        response = jsonify({'success': False, 'error': str(error), 'overloaded': True})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(CRYPTO_RETRY_AFTER)
+        return response
+
+    @app.route('/executor', methods=['GET'])
+    def executor_route():
+        return jsonify({'success': True, **executor.stats()})
+
+    return executor
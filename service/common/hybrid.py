@@ -0,0 +1,163 @@
+import hashlib
+import os
+import struct
+import shadow_crypt
+
+# Hybrid encryption of arbitrarily large payloads: a fresh 32 byte data key is wrapped for the
+# recipient with RSA, X25519, Kyber or NTRU, then the payload is encrypted in ChaCha20-Poly1305
+# chunks as it streams. Nothing ever holds more than one chunk.
+#
+# Stream layout:
+#   header  "SCH1" | protocol (1 byte) | chunk size (4) | nonce prefix (7) | wrapped key length (2) | wrapped key
+#   frames  ciphertext length (4) | chunk ciphertext with its 16 byte tag, repeated
+# Chunk nonces are the prefix, a 4 byte counter and a last-chunk flag (the STREAM construction), and
+# the header is the associated data of every chunk, so reordered, dropped, truncated or re-wrapped
+# streams fail to decrypt.
+MAGIC = b"SCH1"
+PROTOCOLS = ("rsa", "x25519", "kyber", "ntru")
+CHUNK_BYTES = int(os.environ.get("HYBRID_CHUNK_BYTES", str(64 * 1024)))
+MAX_CHUNK_BYTES = 16 * 1024 * 1024
+NONCE_PREFIX_BYTES = 7
+HEADER = struct.Struct(f">4sBI{NONCE_PREFIX_BYTES}sH")
+FRAME = struct.Struct(">I")
+
+# Recipient key pair as (private part, public bytes sent to the sender)
+def generate_recipient_key(protocol):
+    if protocol == "rsa":
+        rsa_key = shadow_crypt.RsaKey.generate()
+        return rsa_key, rsa_key.public_pem().encode()
+    if protocol == "x25519":
+        return shadow_crypt.generate_ecdh_key()
+    if protocol == "kyber":
+        public_key, secret_key = shadow_crypt.kyber_keygen()
+        return secret_key, public_key
+    if protocol == "ntru":
+        public_key, private_key = shadow_crypt.ntru_generate_keypair()
+        return private_key, public_key
+    raise ValueError(f"Unknown hybrid protocol: {protocol}")
+
+# Sender side: (data key, wrapped key) for the recipient's public key
+def wrap_key(protocol, public_key):
+    if protocol == "rsa":
+        # rsa_encrypt takes text, the key travels as hex (64 characters, far below the padding limit)
+        data_key = os.urandom(shadow_crypt.AEAD_KEY_BYTES)
+        return data_key, shadow_crypt.RsaKey.from_pem(public_key.decode()).encrypt(data_key.hex())
+    if protocol == "x25519":
+        ephemeral_private, ephemeral_public = shadow_crypt.generate_ecdh_key()
+        return hashlib.sha256(shadow_crypt.derive_ecdh_shared_key(ephemeral_private, public_key)).digest(), ephemeral_public
+    if protocol == "kyber":
+        ciphertext, shared_secret = shadow_crypt.kyber_encapsulate(public_key)
+        return hashlib.sha256(shared_secret).digest(), ciphertext
+    if protocol == "ntru":
+        ciphertext, shared_secret = shadow_crypt.ntru_encapsulate(public_key)
+        return hashlib.sha256(shared_secret).digest(), ciphertext
+    raise ValueError(f"Unknown hybrid protocol: {protocol}")
+
+# Recipient side: data key from the wrapped key
+def unwrap_key(protocol, private_key, wrapped_key):
+    if protocol == "rsa":
+        return bytes.fromhex(private_key.decrypt(wrapped_key))
+    if protocol == "x25519":
+        return hashlib.sha256(shadow_crypt.derive_ecdh_shared_key(private_key, wrapped_key)).digest()
+    if protocol == "kyber":
+        return hashlib.sha256(shadow_crypt.kyber_decapsulate(wrapped_key, private_key)).digest()
+    if protocol == "ntru":
+        return hashlib.sha256(shadow_crypt.ntru_decapsulate(private_key, wrapped_key)).digest()
+    raise ValueError(f"Unknown hybrid protocol: {protocol}")
+
+def chunk_nonce(prefix, counter, last):
+    return prefix + struct.pack(">IB", counter, 1 if last else 0)
+
+# Exact reads over a file-like object (request.stream, an HTTP response) or an iterator of bytes.
+# What a read brings beyond the requested size is kept as a view, so big source chunks are not recopied.
+class ChunkReader:
+    def __init__(self, source):
+        self.read_some = source.read if hasattr(source, "read") else self.iterator_reader(iter(source))
+        self.pending = memoryview(b"")
+        self.bytes_read = 0
+
+    @staticmethod
+    def iterator_reader(iterator):
+        return lambda size: next(iterator, b"")
+
+    # size bytes, fewer only at the end of the stream
+    def read(self, size):
+        parts = [self.pending[:size]]
+        have = len(parts[0])
+        self.pending = self.pending[have:]
+        while have < size:
+            data = memoryview(self.read_some(size - have))
+            if not data:
+                break
+            if len(data) > size - have:
+                data, self.pending = data[:size - have], data[size - have:]
+            parts.append(data)
+            have += len(data)
+        self.bytes_read += have
+        return b"".join(parts)
+
+# Encrypted stream of everything source yields, one frame per chunk. stats (a dict) is filled with
+# the plaintext and ciphertext byte counts as the stream goes.
+def encrypt_stream(protocol, public_key, source, chunk_bytes=CHUNK_BYTES, stats=None):
+    stats = {} if stats is None else stats
+    data_key, wrapped_key = wrap_key(protocol, public_key)
+    nonce_prefix = os.urandom(NONCE_PREFIX_BYTES)
+    header = HEADER.pack(MAGIC, PROTOCOLS.index(protocol), chunk_bytes, nonce_prefix, len(wrapped_key)) + wrapped_key
+    stats.update(plaintext_bytes=0, stream_bytes=len(header), chunks=0)
+    yield header
+
+    reader = ChunkReader(source)
+    chunk = reader.read(chunk_bytes)
+    counter = 0
+    while True:
+        following = reader.read(chunk_bytes) if len(chunk) == chunk_bytes else b""
+        last = not following
+        ciphertext = shadow_crypt.aead_encrypt(data_key, chunk_nonce(nonce_prefix, counter, last), chunk, header)
+        stats["plaintext_bytes"] += len(chunk)
+        stats["stream_bytes"] += FRAME.size + len(ciphertext)
+        stats["chunks"] += 1
+        yield FRAME.pack(len(ciphertext)) + ciphertext
+        if last:
+            return
+        chunk, counter = following, counter + 1
+
+# Plaintext chunks of an encrypted stream (a ChunkReader or anything it can read). private_key_for(protocol)
+# gives the recipient key. Raises ValueError on a malformed, altered or truncated stream.
+def decrypt_stream(source, private_key_for):
+    reader = source if isinstance(source, ChunkReader) else ChunkReader(source)
+    fixed = reader.read(HEADER.size)
+    if len(fixed) != HEADER.size:
+        raise ValueError("Hybrid stream ends inside its header")
+    magic, protocol_index, chunk_bytes, nonce_prefix, wrapped_length = HEADER.unpack(fixed)
+    if magic != MAGIC or protocol_index >= len(PROTOCOLS) or chunk_bytes > MAX_CHUNK_BYTES:
+        raise ValueError("Not a hybrid stream")
+    wrapped_key = reader.read(wrapped_length)
+    header = fixed + wrapped_key
+    protocol = PROTOCOLS[protocol_index]
+    data_key = unwrap_key(protocol, private_key_for(protocol), wrapped_key)
+
+    counter = 0
+    while True:
+        length = reader.read(FRAME.size)
+        if len(length) != FRAME.size:
+            raise ValueError("Hybrid stream is truncated")
+        (length,) = FRAME.unpack(length)
+        if length > chunk_bytes + shadow_crypt.AEAD_TAG_BYTES:
+            raise ValueError("Hybrid stream frame is larger than its chunk size")
+        ciphertext = reader.read(length)
+        # A short frame can only be the last one, which is flagged in its nonce
+        last = len(ciphertext) < chunk_bytes + shadow_crypt.AEAD_TAG_BYTES
+        try:
+            plaintext = shadow_crypt.aead_decrypt(data_key, chunk_nonce(nonce_prefix, counter, last), ciphertext, header)
+        except ValueError:
+            if last:
+                raise
+            # A full size chunk can still be the last one when the payload is a multiple of the chunk size
+            plaintext = shadow_crypt.aead_decrypt(data_key, chunk_nonce(nonce_prefix, counter, True), ciphertext, header)
+            last = True
+        yield plaintext
+        if last:
+            if reader.read(1):
+                raise ValueError("Data after the last hybrid chunk")
+            return
+        counter += 1
@@ -0,0 +1,286 @@
+import bisect
+import mmap
+import os
+import resource
+import tempfile
+import threading
+import time
+from flask import Response, g, request
+import timing
+
+# Prometheus metrics of the protocol routes: request, error and in-flight counts per protocol and
+# route, latency histograms per protocol, route and phase, crypto executor queues per protocol and
+# CPU / RSS of every worker process. The route label keeps a batch of N exchanges ("batch") out of
+# the latency distribution of single exchanges ("single").
+#
+# Every series has a fixed slot in a flat array of doubles laid out once at start up, so recording
+# is a few index lookups and in-place additions under the worker's lock (an addition is a read and
+# a write, threads of one worker would lose each other's updates). Each gunicorn worker writes only
+# to its own memory mapped file in METRICS_DIR; /metrics sums the files of all workers of the same
+# master, whichever worker happens to answer the scrape.
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(tempfile.gettempdir(), "shadow_metrics"))
+
+# Upper bounds of the latency buckets in seconds, +Inf is implicit
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Process CPU and RSS are refreshed at most this often by a worker serving requests
+PROCESS_REFRESH_SECONDS = 1.0
+
+# Per worker values and how they are exposed
+PROCESS_METRICS = (
+    ("cpu_seconds", "process_cpu_seconds_total", "counter", "User and system CPU time of the worker process."),
+    ("rss_bytes", "process_resident_memory_bytes", "gauge", "Resident memory of the worker process."),
+    ("start_time_seconds", "process_start_time_seconds", "gauge", "Start time of the worker process in seconds since the epoch.")
+)
+PROCESS_VALUES = tuple(name for name, *_ in PROCESS_METRICS)
+
+# Slot of every series in the array, so the hot path never allocates or looks up by name.
+# routes are the (protocol, route) pairs that are recorded.
+class Layout:
+    def __init__(self, routes, phases):
+        self.routes = tuple(routes)
+        self.protocols = tuple(dict.fromkeys(protocol for protocol, _ in self.routes))
+        self.phases = tuple(phases) + ('total',)
+        size = 0
+        self.requests, self.errors, self.in_flight = {}, {}, {}
+        for key in self.routes:
+            self.requests[key], self.errors[key], self.in_flight[key] = size, size + 1, size + 2
+            size += 3
+        # Per histogram: one count per bucket (+Inf last) and the sum
+        self.histograms = {}
+        for protocol, route in self.routes:
+            for phase in self.phases:
+                self.histograms[(protocol, route, phase)] = size
+                size += len(LATENCY_BUCKETS) + 2
+        # Per protocol crypto executor lane: calls waiting for a slot, calls running, calls shed
+        self.executor = {}
+        for protocol in self.protocols:
+            self.executor[protocol] = size
+            size += 3
+        self.process = {name: size + index for index, name in enumerate(PROCESS_VALUES)}
+        self.size = size + len(PROCESS_VALUES)
+
+# Values of this worker, in a file of METRICS_DIR (or in memory when it is empty), rebuilt after a fork
+class WorkerValues:
+    def __init__(self, name, layout):
+        self.pid = os.getpid()
+        self.prefix = f"{name}-{os.getppid()}-"
+        nbytes = layout.size * 8
+        if METRICS_DIR:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            remove_stale_files(name)
+            path = os.path.join(METRICS_DIR, f"{self.prefix}{self.pid}.metrics")
+            with open(path, "w+b") as metrics_file:
+                metrics_file.truncate(nbytes)
+                self.buffer = mmap.mmap(metrics_file.fileno(), nbytes)
+        else:
+            self.buffer = bytearray(nbytes)
+        self.values = memoryview(self.buffer).cast('d')
+        # Held by every update of values
+        self.lock = threading.Lock()
+        self.values[layout.process['start_time_seconds']] = time.time()
+        self.refreshed = 0.0
+
+# Files left by workers of a master that is gone, so a restart starts counting from zero
+def remove_stale_files(name):
+    for file_name in os.listdir(METRICS_DIR):
+        parts = file_name[:-len(".metrics")].rsplit("-", 2)
+        if file_name.endswith(".metrics") and len(parts) == 3 and parts[0] == name and not pid_alive(int(parts[1])):
+            try:
+                os.remove(os.path.join(METRICS_DIR, file_name))
+            except OSError:
+                pass
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak instead of current RSS where /proc is missing (kilobytes on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class Metrics:
+    def __init__(self, name, routes, phases):
+        self.name = name
+        self.layout = Layout(routes, phases)
+        self.worker = None
+        self.lock = threading.Lock()
+
+    # Values of this worker. Threads racing on the first request of a worker must all end up with
+    # the same file
+    def current(self):
+        worker = self.worker
+        if worker is None or worker.pid != os.getpid():
+            with self.lock:
+                if self.worker is None or self.worker.pid != os.getpid():
+                    self.worker = WorkerValues(self.name, self.layout)
+                worker = self.worker
+        return worker
+
+    def values(self):
+        return self.current().values
+
+    # key: (protocol, route)
+    def request_started(self, key):
+        worker = self.current()
+        with worker.lock:
+            worker.values[self.layout.in_flight[key]] += 1
+
+    def request_finished(self, key):
+        worker = self.current()
+        with worker.lock:
+            worker.values[self.layout.in_flight[key]] -= 1
+
+    def executor_changed(self, protocol, queued=0, running=0, rejected=0):
+        base = self.layout.executor.get(protocol)
+        if base is not None:
+            worker = self.current()
+            with worker.lock:
+                worker.values[base] += queued
+                worker.values[base + 1] += running
+                worker.values[base + 2] += rejected
+
+    def record(self, key, status, phases):
+        worker, layout = self.current(), self.layout
+        with worker.lock:
+            values = worker.values
+            values[layout.requests[key]] += 1
+            if status >= 400:
+                values[layout.errors[key]] += 1
+            for phase, seconds in phases.items():
+                base = layout.histograms.get((*key, phase))
+                if base is not None:
+                    values[base + bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+                    values[base + len(LATENCY_BUCKETS) + 1] += seconds
+        self.refresh_process(force=False)
+
+    def refresh_process(self, force=True):
+        worker = self.worker
+        now = time.monotonic()
+        if worker is not None and (force or now - worker.refreshed >= PROCESS_REFRESH_SECONDS):
+            with worker.lock:
+                worker.refreshed = now
+                worker.values[self.layout.process['cpu_seconds']] = time.process_time()
+                worker.values[self.layout.process['rss_bytes']] = rss_bytes()
+
+    # (pid, values) of every worker of this master, this one included
+    def all_workers(self):
+        own = self.values()
+        if not METRICS_DIR:
+            return [(self.worker.pid, own)]
+        workers = []
+        for file_name in os.listdir(METRICS_DIR):
+            if not (file_name.startswith(self.worker.prefix) and file_name.endswith(".metrics")):
+                continue
+            pid = int(file_name[len(self.worker.prefix):-len(".metrics")])
+            if pid == self.worker.pid:
+                workers.append((pid, own))
+                continue
+            try:
+                with open(os.path.join(METRICS_DIR, file_name), "rb") as metrics_file:
+                    data = metrics_file.read()
+            except OSError:
+                continue
+            if len(data) == self.layout.size * 8:
+                workers.append((pid, memoryview(data).cast('d')))
+        return workers
+
+    # Prometheus text exposition format, counters and histograms summed over all workers that ever
+    # ran, in-flight requests and process values only over the live ones
+    def exposition(self):
+        self.values()
+        self.refresh_process()
+        layout = self.layout
+        workers = self.all_workers()
+        live = [(pid, values) for pid, values in workers if pid == self.worker.pid or pid_alive(pid)]
+
+        def total(slot, over=workers):
+            return sum(values[slot] for _, values in over)
+
+        lines = [
+            "# HELP http_requests_total Protocol requests handled.",
+            "# TYPE http_requests_total counter"
+        ]
+        lines += [f'http_requests_total{{protocol="{p}",route="{r}"}} {total(layout.requests[(p, r)])}' for p, r in layout.routes]
+        lines += [
+            "# HELP http_request_errors_total Protocol requests answered with a 4xx or 5xx status.",
+            "# TYPE http_request_errors_total counter"
+        ]
+        lines += [f'http_request_errors_total{{protocol="{p}",route="{r}"}} {total(layout.errors[(p, r)])}' for p, r in layout.routes]
+        lines += [
+            "# HELP http_requests_in_flight Protocol requests being handled right now.",
+            "# TYPE http_requests_in_flight gauge"
+        ]
+        lines += [f'http_requests_in_flight{{protocol="{p}",route="{r}"}} {total(layout.in_flight[(p, r)], live)}'
+                  for p, r in layout.routes]
+
+        lines += [
+            "# HELP protocol_phase_seconds Time spent per phase of a protocol request (total is the whole request).",
+            "# TYPE protocol_phase_seconds histogram"
+        ]
+        for (protocol, route, phase), base in layout.histograms.items():
+            counts = [total(base + index) for index in range(len(LATENCY_BUCKETS) + 1)]
+            if not any(counts):
+                continue
+            labels = f'protocol="{protocol}",route="{route}",phase="{phase}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'protocol_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'protocol_phase_seconds_sum{{{labels}}} {total(base + len(LATENCY_BUCKETS) + 1)}')
+            lines.append(f'protocol_phase_seconds_count{{{labels}}} {cumulative}')
+
+        for offset, metric, metric_type, help_text, over in (
+            (0, "crypto_queue_depth", "gauge", "Crypto calls waiting for a slot of their protocol.", live),
+            (1, "crypto_running", "gauge", "Crypto calls running in the executor.", live),
+            (2, "crypto_rejected_total", "counter", "Crypto calls shed because their protocol's queue was full.", workers)
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {metric_type}"]
+            lines += [f'{metric}{{protocol="{p}"}} {total(layout.executor[p] + offset, over)}' for p in layout.protocols]
+
+        for name, metric, metric_type, help_text in PROCESS_METRICS:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {metric_type}"]
+            lines += [f'{metric}{{pid="{pid}"}} {values[layout.process[name]]}' for pid, values in live]
+        return "\n".join(lines) + "\n"
+
+# Instruments the requests route_of maps to one of the (protocol, route) pairs of routes (None
+# leaves a request out) and adds GET /metrics. Call after timing.init_app so the phases are there
+# when the request ends.
+def init_app(app, routes, phases, route_of):
+    metrics = Metrics(app.name, routes, phases)
+
+    @app.before_request
+    def start_request():
+        key = route_of(request)
+        if key in metrics.layout.requests:
+            g.metrics_route = key
+            metrics.request_started(key)
+
+    @app.after_request
+    def record_request(response):
+        key = g.get('metrics_route')
+        if key is not None:
+            timer = timing.current()
+            metrics.record(key, response.status_code, {**timer.phases, 'total': timer.elapsed()})
+        return response
+
+    @app.teardown_request
+    def end_request(exception):
+        key = g.pop('metrics_route', None)
+        if key is not None:
+            metrics.request_finished(key)
+
+    @app.route('/metrics')
+    def metrics_route():
+        return Response(metrics.exposition(), mimetype="text/plain; version=0.0.4")
+
+    return metrics
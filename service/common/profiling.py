@@ -0,0 +1,181 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from flask import g, jsonify, request
+
+# Stack sampling profiler for the protocol handlers, off unless PROFILING says otherwise:
+#   request   a request sent with the X-Profile header or ?profile= is profiled on its own,
+#             "store" (the default) writes the result to PROFILE_DIR and names the file in the
+#             X-Profile-File header, "return" sends it back instead of the handler's answer
+#   sampling  every thread of the worker is sampled continuously at a low rate and a profile
+#             is written to PROFILE_DIR every PROFILE_PERIOD seconds
+# e.g. PROFILING=request,sampling. Profiles are collapsed stacks (one "outer;inner count" line
+# per stack, the input of flamegraph.pl or speedscope) and a JSON summary of the top functions.
+# Time spent in shadow_crypt shows under the Python frame that called it, since the bindings
+# release the GIL and the sampler keeps running meanwhile. In pure Python code the sampler only
+# gets the GIL every switch interval (5 ms by default), which bounds the effective rate.
+PROFILING = {mode.strip() for mode in os.environ.get("PROFILING", "").split(",") if mode.strip()}
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "shadow_profiles"))
+PROFILE_REQUEST_INTERVAL = float(os.environ.get("PROFILE_REQUEST_INTERVAL", "0.001"))
+PROFILE_SAMPLING_INTERVAL = float(os.environ.get("PROFILE_SAMPLING_INTERVAL", "0.01"))
+PROFILE_PERIOD = float(os.environ.get("PROFILE_PERIOD", "60"))
+PROFILE_TOP = int(os.environ.get("PROFILE_TOP", "20"))
+
+# Threads of the profiler itself, left out of the samples
+PROFILER_THREADS = set()
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+# Outermost frame first
+def stack_of(frame):
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+# Samples the stacks of the given threads (all others than its own when None) every interval
+class StackSampler:
+    def __init__(self, interval, thread_ids=None):
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.stacks = Counter()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        return self
+
+    def run(self):
+        PROFILER_THREADS.add(threading.get_ident())
+        try:
+            while not self.stopped.wait(self.interval):
+                self.sample()
+        finally:
+            PROFILER_THREADS.discard(threading.get_ident())
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self.lock:
+            for thread_id, frame in frames.items():
+                if thread_id not in PROFILER_THREADS and (self.thread_ids is None or thread_id in self.thread_ids):
+                    self.stacks[stack_of(frame)] += 1
+
+    # Stacks collected so far, the sampler starts over from nothing
+    def take(self):
+        with self.lock:
+            stacks, self.stacks = self.stacks, Counter()
+        return stacks
+
+def collapsed(stacks):
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
+
+# Functions by samples spent in them (self) and under them (total), as share of all samples
+def top_functions(stacks, limit=PROFILE_TOP):
+    self_counts, total_counts = Counter(), Counter()
+    for stack, count in stacks.items():
+        self_counts[stack[-1]] += count
+        for label in set(stack):
+            total_counts[label] += count
+    samples = sum(stacks.values()) or 1
+    return [{
+        "function": label,
+        "self_samples": self_counts[label],
+        "total_samples": total_counts[label],
+        "self_percent": 100 * self_counts[label] / samples,
+        "total_percent": 100 * total_counts[label] / samples
+    } for label, _ in self_counts.most_common(limit)]
+
+def profile_document(stacks, interval, **details):
+    return {**details, "interval_seconds": interval, "samples": sum(stacks.values()), "top": top_functions(stacks)}
+
+# Writes <name>.collapsed and <name>.json into PROFILE_DIR, returns the name
+def store(name, stacks, document):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{name}.collapsed"), "w") as collapsed_file:
+        collapsed_file.write(collapsed(stacks))
+    with open(os.path.join(PROFILE_DIR, f"{name}.json"), "w") as summary_file:
+        json.dump(document, summary_file, indent=2)
+    return name
+
+# Background sampling of the whole worker, started once per process (gunicorn forks after import)
+class ContinuousProfiler:
+    def __init__(self, name):
+        self.name = name
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.sampler = StackSampler(PROFILE_SAMPLING_INTERVAL).start()
+                threading.Thread(target=self.write_periodically, name="profile-writer", daemon=True).start()
+
+    def write_periodically(self):
+        PROFILER_THREADS.add(threading.get_ident())
+        while True:
+            time.sleep(PROFILE_PERIOD)
+            stacks = self.sampler.take()
+            if stacks:
+                name = f"{self.name}-{os.getpid()}-{int(time.time())}-sampling"
+                store(name, stacks, profile_document(stacks, PROFILE_SAMPLING_INTERVAL, period_seconds=PROFILE_PERIOD))
+
+# Requested profiling mode of this request, None when it is not profiled
+def requested_mode():
+    mode = request.headers.get('X-Profile') or request.args.get('profile')
+    if not mode:
+        return None
+    return "return" if mode == "return" else "store"
+
+def init_app(app):
+    if "sampling" in PROFILING:
+        continuous = ContinuousProfiler(app.name)
+
+        @app.before_request
+        def start_continuous():
+            continuous.ensure_started()
+
+    if "request" in PROFILING:
+        @app.before_request
+        def start_request_profile():
+            mode = requested_mode()
+            if mode is not None:
+                g.profile = (mode, StackSampler(PROFILE_REQUEST_INTERVAL, {threading.get_ident()}).start())
+
+        @app.after_request
+        def finish_request_profile(response):
+            if 'profile' not in g:
+                return response
+            mode, sampler = g.pop('profile')
+            stacks = sampler.stop().take()
+            document = profile_document(stacks, PROFILE_REQUEST_INTERVAL, path=request.path,
+                                        status=response.status_code,
+                                        seconds=time.perf_counter() - sampler.started)
+            if mode == "return":
+                return jsonify({**document, "collapsed": collapsed(stacks)})
+            name = f"{app.name}-{os.getpid()}-{int(time.time() * 1000)}-{request.path.strip('/').replace('/', '_') or 'root'}"
+            response.headers['X-Profile-File'] = store(name, stacks, document)
+            return response
+
+        # A sampler left running by a request that failed before after_request
+        @app.teardown_request
+        def stop_request_profile(exception):
+            if 'profile' in g:
+                g.pop('profile')[1].stop()
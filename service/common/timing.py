@@ -0,0 +1,92 @@
+import time
+from contextlib import contextmanager
+from flask import g, jsonify
+
+# Prefix of the Server 2 phases when they are passed on in our own Server-Timing header
+SERVER2_PREFIX = "server2-"
+
+# Phases of one request measured on the monotonic high resolution clock, plus (on Server 1) the
+# phases Server 2 reported for its part of the exchange
+class PhaseTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.server2 = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    # Repeated phases (e.g. once per batch item) add up
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    # Server 2 phases taken from the Server-Timing header of its response
+    def add_server2(self, response):
+        for name, seconds in parse_server_timing(response.headers.get('Server-Timing', '')).items():
+            self.server2[name] = self.server2.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    # Seconds per phase and the total so far, as returned in the timings JSON object
+    def as_dict(self):
+        timings = {f"{name}_seconds": seconds for name, seconds in self.phases.items()}
+        if self.server2:
+            timings['server2'] = {f"{name}_seconds": seconds for name, seconds in self.server2.items()}
+        timings['total_seconds'] = self.elapsed()
+        return timings
+
+# Timer of the request being handled, a throwaway one outside of a request
+def current():
+    if 'timer' not in g:
+        g.timer = PhaseTimer()
+    return g.timer
+
+def phase(name):
+    return current().phase(name)
+
+# JSON response with the timings object filled in, the serialisation itself only makes the header.
+# Timings the route already put in the payload (e.g. handshakes per second) are kept.
+def respond(payload, status=200):
+    timer = current()
+    with timer.phase('serialize'):
+        response = jsonify({**payload, 'timings': {**timer.as_dict(), **payload.get('timings', {})}})
+    return response, status
+
+# Server-Timing header value, durations in milliseconds as the spec wants
+def server_timing_header(phases):
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in phases.items())
+
+# Phase name to seconds from a Server-Timing header value
+def parse_server_timing(value):
+    phases = {}
+    for entry in value.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, duration = param.strip().partition("=")
+            if name and key == "dur":
+                try:
+                    phases[name] = float(duration) / 1000
+                except ValueError:
+                    pass
+    return phases
+
+# Every response carries our phases, Server 2's phases if any and the total in a Server-Timing header
+def init_app(app):
+    @app.before_request
+    def start_timer():
+        g.timer = PhaseTimer()
+
+    @app.after_request
+    def add_server_timing(response):
+        timer = current()
+        phases = dict(timer.phases)
+        phases.update({f"{SERVER2_PREFIX}{name}": seconds for name, seconds in timer.server2.items()})
+        phases['total'] = timer.elapsed()
+        response.headers['Server-Timing'] = server_timing_header(phases)
+        return response
@@ -0,0 +1,61 @@
+import argparse
+import hashlib
+import os
+import resource
+import time
+
+import requests
+
+# Streams a large generated payload through Server 1's /hybrid/<protocol> route (Server 2 encrypts
+# it chunk by chunk, Server 1 decrypts it as it arrives) and reports the throughput and memory of
+# each protocol. The payload is produced on the fly, so hundreds of megabytes never sit in memory
+# here either; its SHA-256 is compared with the one of what Server 1 decrypted.
+#
+# Usage: python bench_hybrid.py --url http://localhost:5000 --megabytes 512 --protocol rsa x25519 kyber ntru
+
+BLOCK_BYTES = 1024 * 1024
+
+# total_bytes of pseudo-random data in blocks, hashed as they are handed out
+def payload(total_bytes, digest):
+    block = bytearray(os.urandom(BLOCK_BYTES))
+    sent = 0
+    while sent < total_bytes:
+        # A counter in every block so the payload does not repeat
+        block[:8] = sent.to_bytes(8, "big")
+        piece = bytes(block[:min(BLOCK_BYTES, total_bytes - sent)])
+        digest.update(piece)
+        sent += len(piece)
+        yield piece
+
+def run(url, protocol, total_bytes, chunk_bytes):
+    digest = hashlib.sha256()
+    start_time = time.perf_counter()
+    response = requests.post(f"{url}/hybrid/{protocol}", params={"chunk": chunk_bytes},
+                             data=payload(total_bytes, digest),
+                             headers={"Content-Type": "application/octet-stream"})
+    elapsed = time.perf_counter() - start_time
+    result = response.json()
+    if not result.get("success"):
+        raise RuntimeError(result.get("error", f"HTTP {response.status_code}"))
+    if result["sha256"] != digest.hexdigest():
+        raise RuntimeError("Decrypted data does not match what was sent")
+    result["client_mb_per_second"] = total_bytes / 1e6 / elapsed
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hybrid encryption streaming benchmark")
+    parser.add_argument("--url", default="http://localhost:5000", help="Server 1 base URL")
+    parser.add_argument("--protocol", nargs="+", default=["rsa", "x25519", "kyber", "ntru"])
+    parser.add_argument("--megabytes", type=float, default=256)
+    parser.add_argument("--chunk", type=int, default=64 * 1024, help="AEAD chunk size in bytes")
+    args = parser.parse_args()
+
+    total_bytes = int(args.megabytes * 1e6)
+    print(f"{args.megabytes:g} MB per protocol through {args.url}, {args.chunk} byte chunks")
+    print(f"{'protocol':10}{'server MB/s':>13}{'client MB/s':>13}{'overhead':>12}{'peak RSS MB':>13}{'RSS growth MB':>15}")
+    for protocol in args.protocol:
+        result = run(args.url.rstrip("/"), protocol, total_bytes, args.chunk)
+        print(f"{protocol:10}{result['mb_per_second']:>13.1f}{result['client_mb_per_second']:>13.1f}"
+              f"{result['overhead_bytes']:>12}{result['peak_rss_bytes'] / 1e6:>13.1f}{result['rss_growth_bytes'] / 1e6:>15.1f}")
+    # ru_maxrss is in kilobytes on Linux
+    print(f"client peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3:.1f} MB")
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Compares the Server 1 -> Server 2 transports on full handshakes:
+#   bare    one requests.post per handshake, a new TCP connection every time (the old behaviour)
+#   pooled  the shared keep-alive session from transport.py
+#   async   transport.async_post with every handshake in flight from one thread
+#
+# Usage: python bench_transport.py --protocol ecdh --requests 500 --concurrency 16 [--wire binary] [--spawn]
+
+# Starts Server 2 in this process on a free port and points the transport at it
+def spawn_server2():
+    from werkzeug.serving import make_server
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server2"))
+    import f_server_2
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, f_server_2.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+# Percentile over an already sorted list
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def report(name, latencies, elapsed, errors):
+    latencies = sorted(latencies)
+    if not latencies:
+        print(f"{name:8} no successful handshakes ({errors} errors)")
+        return
+    print(f"{name:8} {len(latencies) / elapsed:10.1f} handshakes/s"
+          f"   p50 {percentile(latencies, 0.50) * 1000:8.2f} ms"
+          f"   p99 {percentile(latencies, 0.99) * 1000:8.2f} ms"
+          f"   mean {statistics.fmean(latencies) * 1000:8.2f} ms"
+          f"   errors {errors}")
+
+# One full handshake through a blocking post function, returns its latency
+def sync_handshake(post, protocol, message, wire):
+    keygen, derive = f_server_1.EXCHANGES[protocol]
+    start_time = time.perf_counter()
+    private_key, public_key = keygen()
+    body = f_server_1.single_request_body(protocol, public_key, message)
+    response = post(f_server_1.SINGLE_ROUTES[protocol], **transport.encode_request(body, wire))
+    response.raise_for_status()
+    if not derive(private_key, transport.decode_response(response), message)['match']:
+        raise RuntimeError("Shared secrets do not match")
+    return time.perf_counter() - start_time
+
+def run_threads(post, protocol, message, wire, total, concurrency):
+    latencies, errors = [], 0
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(sync_handshake, post, protocol, message, wire) for _ in range(total)]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    return latencies, time.perf_counter() - start_time, errors
+
+async def run_async(protocol, message, wire, total, concurrency):
+    keygen, derive = f_server_1.EXCHANGES[protocol]
+    limit = asyncio.Semaphore(concurrency)
+
+    async def handshake():
+        async with limit:
+            start_time = time.perf_counter()
+            private_key, public_key = keygen()
+            response, reply, _ = await transport.async_exchange(
+                f_server_1.SINGLE_ROUTES[protocol],
+                f_server_1.single_request_body(protocol, public_key, message),
+                wire
+            )
+            response.raise_for_status()
+            if not derive(private_key, reply, message)['match']:
+                raise RuntimeError("Shared secrets do not match")
+            return time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    outcomes = await asyncio.gather(*(handshake() for _ in range(total)), return_exceptions=True)
+    elapsed = time.perf_counter() - start_time
+    latencies = [outcome for outcome in outcomes if not isinstance(outcome, Exception)]
+    return latencies, elapsed, len(outcomes) - len(latencies)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Server 1 -> Server 2 transports")
+    parser.add_argument("--protocol", default="ecdh", choices=["diffie_hellman", "ecdh", "rsa", "kyber", "ntru"])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--message", default="Hello, world!")
+    parser.add_argument("--wire", default="json", choices=["json", "binary"])
+    parser.add_argument("--spawn", action="store_true", help="run Server 2 inside this process")
+    args = parser.parse_args()
+
+    if args.spawn:
+        os.environ["SERVER2_URL"] = spawn_server2()
+    import transport
+    import f_server_1
+
+    print(f"{args.requests} {args.protocol} handshakes against {transport.SERVER2_URL}, "
+          f"concurrency {args.concurrency}, {args.wire} wire format")
+
+    def bare_post(path, **kwargs):
+        return requests.post(f"{transport.SERVER2_URL}{path}", **kwargs)
+
+    workload = (args.protocol, args.message, args.wire, args.requests, args.concurrency)
+    report("bare", *run_threads(bare_post, *workload))
+    report("pooled", *run_threads(transport.post, *workload))
+    report("async", *asyncio.run(run_async(*workload)))
@@ -1,12 +1,48 @@
+import os
+import sys
+
+# Helper modules both servers use (executor, hybrid, metrics, profiling, timing) live in
+# service/common; the Docker image copies them next to this file instead
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+
 from flask import Flask, jsonify, request
-import requests
+from functools import partial
+import asyncio
 import hashlib
 import shadow_crypt
-import os
+import executor
+import hybrid
+import keypool
+import metrics
+import profiling
+import time
+import timing
+import transport
 
 app = Flask(__name__)
+timing.init_app(app)
+profiling.init_app(app)
+
+# (protocol, route) of a request, the protocol from the single route path or the batch / concurrent /
+# KEM route argument. Batches of N exchanges get their own route label so they stay out of the
+# single exchange latencies. Hybrid streams are left out, their size makes a latency histogram meaningless.
+def request_route(request):
+    if request.endpoint == 'hybrid_route':
+        return None
+    protocol = (request.view_args or {}).get('protocol') or request.path.strip('/')
+    if request.endpoint == 'kem_route':
+        return f"kem_{protocol}", 'single'
+    return protocol, {'batch_route': 'batch', 'concurrent_route': 'concurrent'}.get(request.endpoint, 'single')
 
-SERVER2_URL = os.environ.get("SERVER2_URL", "http://localhost:5001")
+EXCHANGE_PROTOCOLS = ('diffie_hellman', 'ecdh', 'rsa', 'kyber', 'ntru')
+METRICS = metrics.init_app(app, [(protocol, route) for route in ('single', 'batch', 'concurrent') for protocol in EXCHANGE_PROTOCOLS]
+                           + [('kem_kyber', 'single'), ('kem_ntru', 'single')],
+                           ('keygen', 'remote', 'derive', 'decrypt', 'decapsulate', 'queue', 'serialize'), request_route)
+
+# Key generation and derivation of every protocol, inline or in a pool depending on CRYPTO_EXECUTOR
+CRYPTO = executor.init_app(app, EXCHANGE_PROTOCOLS, METRICS)
+
+MAX_BATCH_COUNT = int(os.environ.get("MAX_BATCH_COUNT", "1000"))
 
 # Health check for Render
 @app.route('/health')
@@ -17,30 +53,34 @@ def health():
 @app.route('/diffie_hellman', methods=['GET'])
 def diffie_hellman_route():
     # Generate key pair
-    private_key1, public_key1 = shadow_crypt.generate_dh_key()
-    public_key1_hex = bytes(public_key1).hex()
+    with timing.phase('keygen'):
+        private_key1, public_key1 = take_key_pair('diffie_hellman')
+    public_key1_hex = public_key1.hex()
     
     # Callout server 2
-    response = requests.post(f"{SERVER2_URL}/receive_public_key", data=public_key1_hex)
+    with timing.phase('remote'):
+        response, data, wire_stats = transport.exchange("/receive_public_key", public_key1, request.args.get('wire'))
+    timing.current().add_server2(response)
     if response.status_code != 200:
         return jsonify({'success': False, 'error': f'Server 2 error: {response.status_code}'}), response.status_code
     
-    data = response.json()
-    if 'server_public_key' not in data:
+    if not data or 'server_public_key' not in data:
         return jsonify({'success': False, 'error': 'No public key received from Server 2'}), 500
 
-    server_public_key = list(bytes.fromhex(data['server_public_key']))
+    server_public_key = transport.as_bytes(data['server_public_key'])
     
     # Shared secret computation
-    shared_key = shadow_crypt.derive_dh_shared_key(private_key1, server_public_key)
-    final_key = hashlib.sha256(bytes(shared_key)).hexdigest()
+    with timing.phase('derive'):
+        shared_key = CRYPTO.run('diffie_hellman', shadow_crypt.derive_dh_shared_key, private_key1, server_public_key)
+        final_key = hashlib.sha256(shared_key).hexdigest()
     
-    return jsonify({
+    return timing.respond({
         'success': True,
-        'server1_private_key': bytes(private_key1).hex(),
+        'server1_private_key': private_key1.hex(),
         'server1_public_key': public_key1_hex,
-        'server2_public_key': data['server_public_key'],
-        'final_key': final_key
+        'server2_public_key': transport.as_hex(data['server_public_key']),
+        'final_key': final_key,
+        'wire': wire_stats
     })
 
 # Elliptic Curve Diffie-Hellman
@@ -48,32 +88,36 @@ def diffie_hellman_route():
 def ecdh_route():
     try:
         # Generate our own ECDH key pair
-        private_key, public_key = shadow_crypt.generate_ecdh_key()
-        public_key_hex = bytes(public_key).hex()
+        with timing.phase('keygen'):
+            private_key, public_key = take_key_pair('ecdh')
+        public_key_hex = public_key.hex()
         
         # Callout server 2
-        response = requests.post(f"{SERVER2_URL}/receive_public_key_ell_curve", data=public_key_hex)
+        with timing.phase('remote'):
+            response, res_json, wire_stats = transport.exchange("/receive_public_key_ell_curve", public_key, request.args.get('wire'))
+        timing.current().add_server2(response)
         if response.status_code != 200:
             return jsonify({'success': False, 'error': f'Server 2 error: {response.status_code}'}), response.status_code
         
-        res_json = response.json()
-        if 'server_public_key' not in res_json:
+        if not res_json or 'server_public_key' not in res_json:
             return jsonify({'success': False, 'error': 'No public key returned by Server 2'}), 500
         
-        # Turn public key from hex string to bytes
-        server_pub_hex = res_json['server_public_key']
-        server_pub_bytes = bytes.fromhex(server_pub_hex)
+        # Turn public key from hex string or raw bytes to bytes
+        server_pub_bytes = transport.as_bytes(res_json['server_public_key'])
+        server_pub_hex = server_pub_bytes.hex()
         
         # Shared secret computation
-        shared_key = shadow_crypt.derive_ecdh_shared_key(private_key, server_pub_bytes)
-        final_key = hashlib.sha256(bytes(shared_key)).hexdigest()
+        with timing.phase('derive'):
+            shared_key = CRYPTO.run('ecdh', shadow_crypt.derive_ecdh_shared_key, private_key, server_pub_bytes)
+            final_key = hashlib.sha256(shared_key).hexdigest()
         
-        return jsonify({
+        return timing.respond({
             'success': True,
-            'server1_private_key': bytes(private_key).hex(),
+            'server1_private_key': private_key.hex(),
             'server1_public_key': public_key_hex,
             'server2_public_key': server_pub_hex,
-            'final_key': final_key
+            'final_key': final_key,
+            'wire': wire_stats
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -82,8 +126,9 @@ def ecdh_route():
 @app.route('/rsa', methods=['POST'])
 def rsa_route():
     try:
-        # Generate RSA key pair
-        rsa_private_key, rsa_public_key = shadow_crypt.generate_rsa_key()
+        # Generate RSA key pair, or take a ready one when RSA is pooled
+        with timing.phase('keygen'):
+            rsa_key, rsa_public_key = take_key_pair('rsa')
 
         # Get the message from the incoming JSON payload
         data = request.get_json()
@@ -91,37 +136,44 @@ def rsa_route():
 
         # Send the public key and message to Server 2
         app.logger.info("Sending public key to Server 2 for encryption.")
-        response = requests.post(f"{SERVER2_URL}/encrypt", json={
-            'message': message,
-            'public_key': rsa_public_key
-        })
+        with timing.phase('remote'):
+            response, res_json, wire_stats = transport.exchange("/encrypt", {
+                'message': message,
+                'public_key': rsa_public_key
+            }, request.args.get('wire'))
+        timing.current().add_server2(response)
         app.logger.info("Received response from Server 2 with status code: %s", response.status_code)
 
         if response.status_code != 200:
             app.logger.error("Server 2 returned error status: %s", response.status_code)
             return jsonify({'success': False, 'error': f'Server 2 error: {response.status_code}'}), response.status_code
 
-        res_json = response.json()
-        app.logger.info("Response JSON from Server 2: %s", repr(res_json))
-        if 'encrypted_message' not in res_json:
+        app.logger.info("Response from Server 2: %s", repr(res_json))
+        if not res_json or 'encrypted_message' not in res_json:
             app.logger.error("Encryption failed at Server 2: 'encrypted_message' key not found in response.")
             return jsonify({'success': False, 'error': 'Encryption failed at Server 2'}), 500
 
         # Convert the encrypted message from hex string back to bytes.
-        encrypted_message_hex = res_json['encrypted_message']
-        encrypted_message = bytes.fromhex(encrypted_message_hex)
-        app.logger.info("Converted encrypted message from hex to bytes.")
+        encrypted_message = transport.as_bytes(res_json['encrypted_message'])
+        encrypted_message_hex = encrypted_message.hex()
+        app.logger.info("Converted encrypted message to bytes.")
 
         # Decrypt the encrypted message using our RSA private key.
-        decrypted_message = shadow_crypt.rsa_decrypt(rsa_private_key, encrypted_message)
+        with timing.phase('decrypt'):
+            decrypted_message = CRYPTO.run('rsa', rsa_key.decrypt, encrypted_message, portable=False)
         app.logger.info("Decrypted message: %s", decrypted_message)
 
-        return jsonify({
+        message_bytes = len(message.encode('utf-8'))
+        return timing.respond({
             'success': True,
             'encrypted_message': encrypted_message_hex,
             'decrypted_message': decrypted_message,
+            'message_bytes': message_bytes,
+            'ciphertext_bytes': len(encrypted_message),
+            'expansion_bytes': len(encrypted_message) - message_bytes,
             'server1_public_key': rsa_public_key,
-            'server1_private_key': rsa_private_key
+            'server1_private_key': rsa_key.private_pem(),
+            'wire': wire_stats
         })
     except Exception as e:
         app.logger.exception("Exception occurred in rsa_route:")
@@ -131,62 +183,440 @@ def rsa_route():
 @app.route('/kyber', methods=['GET'])
 def kyber_route():
     # Generate key pair
-    kyber_public_key, kyber_secret_key = shadow_crypt.kyber_keygen()
+    with timing.phase('keygen'):
+        kyber_secret_key, kyber_public_key = take_key_pair('kyber')
     kyber_public_key_hex = kyber_public_key.hex() if isinstance(kyber_public_key, bytes) else str(kyber_public_key)
 
     # Send the public key and message to Server 2
-    response = requests.post(f"{SERVER2_URL}/kyber_encapsulate", data=kyber_public_key_hex)
+    with timing.phase('remote'):
+        response, resp, wire_stats = transport.exchange("/kyber_encapsulate", kyber_public_key, request.args.get('wire'))
+    timing.current().add_server2(response)
     if response.status_code != 200:
         return jsonify({'success': False, 'error': 'Error contacting Server 2'}), response.status_code
-    resp = response.json()
 
-    if 'ciphertext' not in resp:
+    if not resp or 'ciphertext' not in resp:
         return jsonify({'success': False, 'error': 'Kyber encapsulation failed at Server 2'})
-    ciphertext_hex = resp['ciphertext']
+    ciphertext = transport.as_bytes(resp['ciphertext'])
+    ciphertext_hex = ciphertext.hex()
 
     # Decapsulation
-    shared_secret = shadow_crypt.kyber_decapsulate(bytes.fromhex(ciphertext_hex), kyber_secret_key)
-    return jsonify({
+    with timing.phase('decapsulate'):
+        shared_secret = CRYPTO.run('kyber', shadow_crypt.kyber_decapsulate, ciphertext, kyber_secret_key)
+    return timing.respond({
         'success': True,
         'server1_public_key': kyber_public_key_hex,
         'server1_secret_key': kyber_secret_key.hex() if isinstance(kyber_secret_key, bytes) else str(kyber_secret_key),
         'server2_ciphertext': ciphertext_hex,
-        'shared_secret': shared_secret.hex() if isinstance(shared_secret, bytes) else str(shared_secret)
+        'shared_secret': shared_secret.hex() if isinstance(shared_secret, bytes) else str(shared_secret),
+        'wire': wire_stats
     })
 
 # NTRU
 @app.route('/ntru', methods=['GET'])
 def ntru_route():
     # Generate key pair
-    ntru_public_key, ntru_private_key = shadow_crypt.ntru_generate_keypair()
+    with timing.phase('keygen'):
+        ntru_private_key, ntru_public_key = take_key_pair('ntru')
 
-    ntru_public_key_hex = bytes(ntru_public_key).hex()
-    ntru_private_key_hex = bytes(ntru_private_key).hex()
+    ntru_public_key_hex = ntru_public_key.hex()
+    ntru_private_key_hex = ntru_private_key.hex()
     
     # Send the public key to Server 2
-    response = requests.post(f"{SERVER2_URL}/ntru_encapsulate", data=ntru_public_key_hex)
+    with timing.phase('remote'):
+        response, resp, wire_stats = transport.exchange("/ntru_encapsulate", ntru_public_key, request.args.get('wire'))
+    timing.current().add_server2(response)
     if response.status_code != 200:
         return jsonify({'success': False, 'error': 'Error contacting Server 2'}), response.status_code
     
-    resp = response.json()
-    if 'ciphertext' not in resp:
+    if not resp or 'ciphertext' not in resp:
         return jsonify({'success': False, 'error': 'NTRU encapsulation failed at Server 2'}), 500
     
-    ciphertext_hex = resp['ciphertext']
+    ciphertext = transport.as_bytes(resp['ciphertext'])
+    ciphertext_hex = ciphertext.hex()
     
     # Decapsulation
-    shared_secret= shadow_crypt.ntru_decapsulate(bytes(ntru_private_key), bytes.fromhex(ciphertext_hex))
-    final_key = hashlib.sha256(bytes(shared_secret)).hexdigest()
+    with timing.phase('decapsulate'):
+        shared_secret = CRYPTO.run('ntru', shadow_crypt.ntru_decapsulate, ntru_private_key, ciphertext)
+        final_key = hashlib.sha256(shared_secret).hexdigest()
     
-    return jsonify({
+    return timing.respond({
         'success': True,
         'server1_public_key': ntru_public_key_hex,
         'server1_private_key': ntru_private_key_hex,
         'server2_ciphertext': ciphertext_hex,
-        'shared_secret': bytes(shared_secret).hex(),
-        'final_key': final_key
+        'shared_secret': shared_secret.hex(),
+        'final_key': final_key,
+        'wire': wire_stats
     })
 
+# Exchange helpers for the batch and concurrent routes, key generation returns the private part and the public part as sent to Server 2
+def dh_exchange_keygen():
+    private_key, public_key = CRYPTO.run('diffie_hellman', shadow_crypt.generate_dh_key)
+    return private_key, public_key
+
+def dh_exchange_derive(private_key, reply, message):
+    shared_key = CRYPTO.run('diffie_hellman', shadow_crypt.derive_dh_shared_key, private_key,
+                            transport.as_bytes(reply['server_public_key']))
+    final_key = hashlib.sha256(shared_key).hexdigest()
+    return {'final_key': final_key, 'match': final_key == reply['final_key']}
+
+def ecdh_exchange_keygen():
+    private_key, public_key = CRYPTO.run('ecdh', shadow_crypt.generate_ecdh_key)
+    return private_key, public_key
+
+def ecdh_exchange_derive(private_key, reply, message):
+    shared_key = CRYPTO.run('ecdh', shadow_crypt.derive_ecdh_shared_key, private_key,
+                            transport.as_bytes(reply['server_public_key']))
+    final_key = hashlib.sha256(shared_key).hexdigest()
+    return {'final_key': final_key, 'match': final_key == reply['final_key']}
+
+# The private part stays a parsed key handle, so decryption does not parse PEM again
+def rsa_exchange_keygen():
+    rsa_key = CRYPTO.generate_rsa_key()
+    return rsa_key, rsa_key.public_pem()
+
+def rsa_exchange_derive(private_key, reply, message):
+    decrypted_message = CRYPTO.run('rsa', private_key.decrypt, transport.as_bytes(reply['encrypted_message']), portable=False)
+    return {'decrypted_message': decrypted_message, 'match': decrypted_message == message}
+
+def kyber_exchange_keygen():
+    public_key, secret_key = CRYPTO.run('kyber', shadow_crypt.kyber_keygen)
+    return secret_key, public_key
+
+def kyber_exchange_derive(secret_key, reply, message):
+    shared_secret = CRYPTO.run('kyber', shadow_crypt.kyber_decapsulate, transport.as_bytes(reply['ciphertext']), secret_key)
+    return {'shared_secret': shared_secret.hex(), 'match': shared_secret == transport.as_bytes(reply['shared_secret'])}
+
+def ntru_exchange_keygen():
+    public_key, private_key = CRYPTO.run('ntru', shadow_crypt.ntru_generate_keypair)
+    return private_key, public_key
+
+def ntru_exchange_derive(private_key, reply, message):
+    shared_secret = CRYPTO.run('ntru', shadow_crypt.ntru_decapsulate, private_key, transport.as_bytes(reply['ciphertext']))
+    return {
+        'final_key': hashlib.sha256(shared_secret).hexdigest(),
+        'match': shared_secret == transport.as_bytes(reply['shared_secret'])
+    }
+
+EXCHANGES = {
+    'diffie_hellman': (dh_exchange_keygen, dh_exchange_derive),
+    'ecdh': (ecdh_exchange_keygen, ecdh_exchange_derive),
+    'rsa': (rsa_exchange_keygen, rsa_exchange_derive),
+    'kyber': (kyber_exchange_keygen, kyber_exchange_derive),
+    'ntru': (ntru_exchange_keygen, ntru_exchange_derive)
+}
+
+# Key pair made by a refill thread, outside the executor lanes so refills never crowd out requests
+def refill_key_pair(protocol):
+    with CRYPTO.bypass():
+        return EXCHANGES[protocol][0]()
+
+# Pre-generated key pairs for the protocols listed in KEY_POOL, the others generate on demand
+KEY_POOLS = keypool.build_pools({protocol: keygen for protocol, (keygen, _) in EXCHANGES.items()},
+                                refills={protocol: partial(refill_key_pair, protocol) for protocol in EXCHANGES})
+
+# Key pair as (private part, public part) for the protocol, from its pool when it has one
+def take_key_pair(protocol):
+    pool = KEY_POOLS.get(protocol)
+    return pool.take() if pool else EXCHANGES[protocol][0]()
+
+# Shared secret from the KEM ciphertext, Kyber and NTRU take their arguments in opposite order
+KEM_DECAPSULATE = {
+    'kyber': lambda secret_key, ciphertext: CRYPTO.run('kyber', shadow_crypt.kyber_decapsulate, ciphertext, secret_key),
+    'ntru': lambda secret_key, ciphertext: CRYPTO.run('ntru', shadow_crypt.ntru_decapsulate, secret_key, ciphertext)
+}
+
+# Message encryption through a KEM instead of RSA: Server 2 encapsulates against our public key
+# and encrypts the message with ChaCha20-Poly1305 under sha256(shared secret). Unlike RSA there
+# is no padding limit on the message size.
+@app.route('/kem/<protocol>', methods=['POST'])
+def kem_route(protocol):
+    if protocol not in KEM_DECAPSULATE:
+        return jsonify({'success': False, 'error': f'Unknown KEM: {protocol}'}), 404
+    try:
+        with timing.phase('keygen'):
+            secret_key, public_key = take_key_pair(protocol)
+
+        data = request.get_json(silent=True) or {}
+        message = data.get('message', "Hello, world!")
+
+        with timing.phase('remote'):
+            response, res_json, wire_stats = transport.exchange("/kem_encrypt", {
+                'protocol': protocol,
+                'public_key': public_key,
+                'message': message
+            }, request.args.get('wire'))
+        timing.current().add_server2(response)
+
+        if response.status_code != 200 or not res_json or 'encrypted_message' not in res_json:
+            return jsonify({'success': False, 'error': f'Server 2 error: {response.status_code}'}), 502
+
+        ciphertext = transport.as_bytes(res_json['ciphertext'])
+        nonce = transport.as_bytes(res_json['nonce'])
+        encrypted_message = transport.as_bytes(res_json['encrypted_message'])
+        with timing.phase('decapsulate'):
+            shared_secret = KEM_DECAPSULATE[protocol](secret_key, ciphertext)
+        with timing.phase('decrypt'):
+            decrypted_message = shadow_crypt.aead_decrypt(hashlib.sha256(shared_secret).digest(), nonce,
+                                                          encrypted_message, ciphertext).decode('utf-8')
+
+        # Everything the receiver needs besides its own key: KEM ciphertext, nonce, encrypted message and tag
+        message_bytes = len(message.encode('utf-8'))
+        ciphertext_bytes = len(ciphertext) + len(nonce) + len(encrypted_message)
+        return timing.respond({
+            'success': True,
+            'encrypted_message': encrypted_message.hex(),
+            'decrypted_message': decrypted_message,
+            'kem_ciphertext': ciphertext.hex(),
+            'nonce': nonce.hex(),
+            'message_bytes': message_bytes,
+            'ciphertext_bytes': ciphertext_bytes,
+            'expansion_bytes': ciphertext_bytes - message_bytes,
+            'wire': wire_stats
+        })
+    except Exception as e:
+        app.logger.exception("Exception occurred in kem_route:")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Peak RSS is sampled once every this many chunks of a hybrid stream
+HYBRID_RSS_EVERY = 16
+
+# Hybrid encryption round trip of a body of any size: we generate the recipient key, the body is
+# streamed to Server 2 which wraps a data key for it and streams back AEAD chunks, and those are
+# decrypted as they arrive. The body is never held in full on either side, the answer reports the
+# throughput, peak memory and a SHA-256 of the decrypted data to compare with what was sent.
+@app.route('/hybrid/<protocol>', methods=['POST'])
+def hybrid_route(protocol):
+    if protocol not in hybrid.PROTOCOLS:
+        return jsonify({'success': False, 'error': f'Unknown hybrid protocol: {protocol}'}), 404
+    chunk_bytes = request.args.get('chunk', default=hybrid.CHUNK_BYTES, type=int)
+    if not 1 <= chunk_bytes <= hybrid.MAX_CHUNK_BYTES:
+        return jsonify({'success': False, 'error': f'chunk must be between 1 and {hybrid.MAX_CHUNK_BYTES}'}), 400
+
+    with timing.phase('keygen'):
+        private_key, public_key = hybrid.generate_recipient_key(protocol)
+
+    def private_key_for(stream_protocol):
+        if stream_protocol != protocol:
+            raise ValueError(f"Server 2 wrapped the key with {stream_protocol} instead of {protocol}")
+        return private_key
+
+    source = hybrid.ChunkReader(request.stream)
+    def upload():
+        while chunk := source.read(chunk_bytes):
+            yield chunk
+
+    digest = hashlib.sha256()
+    plaintext_bytes = chunks = 0
+    start_rss = peak_rss = metrics.rss_bytes()
+    start_time = time.perf_counter()
+    try:
+        with timing.phase('stream'):
+            response, writer, upload_errors = transport.stream_exchange(
+                f"/hybrid_encrypt/{protocol}?chunk={chunk_bytes}", upload(), {"X-Public-Key": public_key.hex()})
+            try:
+                if response.status != 200:
+                    return jsonify({'success': False, 'error': f'Server 2 error: {response.status}'}), 502
+                encrypted = hybrid.ChunkReader(response)
+                for plaintext in hybrid.decrypt_stream(encrypted, private_key_for):
+                    digest.update(plaintext)
+                    plaintext_bytes += len(plaintext)
+                    chunks += 1
+                    if chunks % HYBRID_RSS_EVERY == 0:
+                        peak_rss = max(peak_rss, metrics.rss_bytes())
+            finally:
+                response.close()
+                writer.join()
+        if upload_errors:
+            raise upload_errors[0]
+        seconds = time.perf_counter() - start_time
+        peak_rss = max(peak_rss, metrics.rss_bytes())
+        return timing.respond({
+            'success': True,
+            'protocol': protocol,
+            'plaintext_bytes': plaintext_bytes,
+            'stream_bytes': encrypted.bytes_read,
+            'overhead_bytes': encrypted.bytes_read - plaintext_bytes,
+            'chunks': chunks,
+            'chunk_bytes': chunk_bytes,
+            'seconds': seconds,
+            'mb_per_second': plaintext_bytes / 1e6 / seconds if seconds > 0 else 0,
+            'peak_rss_bytes': peak_rss,
+            'rss_growth_bytes': peak_rss - start_rss,
+            'sha256': digest.hexdigest()
+        })
+    except Exception as e:
+        app.logger.exception("Exception occurred in hybrid_route:")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Depth, hit/miss counts and refill rate of every key pool in this worker
+@app.route('/key_pools', methods=['GET'])
+def key_pools_route():
+    return jsonify({'success': True, 'pools': {protocol: pool.stats() for protocol, pool in KEY_POOLS.items()}})
+
+# Server 2 single-exchange routes and the request body each one expects
+SINGLE_ROUTES = {
+    'diffie_hellman': '/receive_public_key',
+    'ecdh': '/receive_public_key_ell_curve',
+    'rsa': '/encrypt',
+    'kyber': '/kyber_encapsulate',
+    'ntru': '/ntru_encapsulate'
+}
+
+def single_request_body(protocol, public_key, message):
+    if protocol == 'rsa':
+        return {'message': message, 'public_key': public_key}
+    return public_key
+
+# Batch of N exchanges sent to Server 2 in a single request
+@app.route('/batch/<protocol>', methods=['GET', 'POST'])
+def batch_route(protocol):
+    if protocol not in EXCHANGES:
+        return jsonify({'success': False, 'error': f'Unknown protocol: {protocol}'}), 404
+
+    count = request.args.get('count', default=1, type=int)
+    if not 1 <= count <= MAX_BATCH_COUNT:
+        return jsonify({'success': False, 'error': f'count must be between 1 and {MAX_BATCH_COUNT}'}), 400
+
+    data = request.get_json(silent=True) or {}
+    message = data.get('message', "Hello, world!")
+    derive = EXCHANGES[protocol][1]
+
+    try:
+        # Generate every key pair up front
+        start_time = time.perf_counter()
+        key_pairs = [take_key_pair(protocol) for _ in range(count)]
+        keygen_done = time.perf_counter()
+
+        # One call to Server 2 for the whole batch
+        response, res_json, wire_stats = transport.exchange(f"/batch/{protocol}", {
+            'public_keys': [public_key for _, public_key in key_pairs],
+            'message': message
+        }, request.args.get('wire'))
+        remote_done = time.perf_counter()
+        timing.current().add_server2(response)
+        if response.status_code != 200:
+            return jsonify({'success': False, 'error': f'Server 2 error: {response.status_code}'}), response.status_code
+
+        replies = (res_json or {}).get('results', [])
+        if len(replies) != count:
+            return jsonify({'success': False, 'error': 'Server 2 returned a different number of results'}), 500
+
+        # Finish each exchange with its own private key, a shed item (here or on Server 2) fails alone
+        results = []
+        with CRYPTO.handled():
+            for (private_key, _), reply in zip(key_pairs, replies):
+                if not reply.get('success'):
+                    results.append({'success': False, 'error': reply.get('error', 'Server 2 error'),
+                                    **({'overloaded': True} if reply.get('overloaded') else {})})
+                    continue
+                try:
+                    results.append({'success': True, **derive(private_key, reply, message)})
+                except executor.Overloaded as e:
+                    results.append({'success': False, 'error': str(e), 'overloaded': True})
+                except Exception as e:
+                    results.append({'success': False, 'error': str(e)})
+        end_time = time.perf_counter()
+        timer = timing.current()
+        timer.add('keygen', keygen_done - start_time)
+        timer.add('remote', remote_done - keygen_done)
+        timer.add('derive', end_time - remote_done)
+
+        total_seconds = end_time - start_time
+        succeeded = sum(1 for result in results if result['success'] and result['match'])
+        return timing.respond({
+            'success': succeeded == count,
+            'protocol': protocol,
+            'count': count,
+            'succeeded': succeeded,
+            'results': results,
+            'timings': {
+                'keygen_seconds': keygen_done - start_time,
+                'remote_seconds': remote_done - keygen_done,
+                'server2_compute_seconds': res_json.get('timings', {}).get('compute_seconds'),
+                'derive_seconds': end_time - remote_done,
+                'total_seconds': total_seconds,
+                'handshakes_per_second': count / total_seconds if total_seconds > 0 else 0
+            },
+            'wire': wire_stats
+        })
+    except Exception as e:
+        app.logger.exception("Exception occurred in batch_route:")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# N independent exchanges with all their Server 2 calls in flight at once
+@app.route('/concurrent/<protocol>', methods=['GET', 'POST'])
+async def concurrent_route(protocol):
+    if protocol not in EXCHANGES:
+        return jsonify({'success': False, 'error': f'Unknown protocol: {protocol}'}), 404
+
+    count = request.args.get('count', default=1, type=int)
+    if not 1 <= count <= MAX_BATCH_COUNT:
+        return jsonify({'success': False, 'error': f'count must be between 1 and {MAX_BATCH_COUNT}'}), 400
+
+    data = request.get_json(silent=True) or {}
+    message = data.get('message', "Hello, world!")
+    derive = EXCHANGES[protocol][1]
+
+    try:
+        start_time = time.perf_counter()
+        key_pairs = [take_key_pair(protocol) for _ in range(count)]
+        keygen_done = time.perf_counter()
+
+        # Each exchange keeps its own round trip, but none of them waits for the others
+        wire = request.args.get('wire')
+        outcomes = await asyncio.gather(*(
+            transport.async_exchange(SINGLE_ROUTES[protocol], single_request_body(protocol, public_key, message), wire)
+            for _, public_key in key_pairs
+        ), return_exceptions=True)
+        remote_done = time.perf_counter()
+        for outcome in outcomes:
+            if not isinstance(outcome, Exception):
+                timing.current().add_server2(outcome[0])
+
+        results = []
+        with CRYPTO.handled():
+            for (private_key, _), outcome in zip(key_pairs, outcomes):
+                try:
+                    if isinstance(outcome, Exception):
+                        raise outcome
+                    response, reply, _ = outcome
+                    if response.status_code != 200:
+                        raise RuntimeError(f'Server 2 error: {response.status_code}')
+                    if not reply or not reply.get('success', True):
+                        raise RuntimeError((reply or {}).get('error', 'Server 2 error'))
+                    results.append({'success': True, **derive(private_key, reply, message)})
+                except executor.Overloaded as e:
+                    results.append({'success': False, 'error': str(e), 'overloaded': True})
+                except Exception as e:
+                    results.append({'success': False, 'error': str(e)})
+        end_time = time.perf_counter()
+        timer = timing.current()
+        timer.add('keygen', keygen_done - start_time)
+        timer.add('remote', remote_done - keygen_done)
+        timer.add('derive', end_time - remote_done)
+
+        total_seconds = end_time - start_time
+        succeeded = sum(1 for result in results if result['success'] and result['match'])
+        return timing.respond({
+            'success': succeeded == count,
+            'protocol': protocol,
+            'count': count,
+            'succeeded': succeeded,
+            'results': results,
+            'timings': {
+                'keygen_seconds': keygen_done - start_time,
+                'remote_seconds': remote_done - keygen_done,
+                'derive_seconds': end_time - remote_done,
+                'total_seconds': total_seconds,
+                'handshakes_per_second': count / total_seconds if total_seconds > 0 else 0
+            },
+            'wire': transport.total_wire_stats([outcome[2] for outcome in outcomes if not isinstance(outcome, Exception)])
+        })
+    except Exception as e:
+        app.logger.exception("Exception occurred in concurrent_route:")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # Main
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,125 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+# Protocols whose key pairs are generated ahead of time, e.g. KEY_POOL=rsa or KEY_POOL=rsa,ntru
+POOLED_PROTOCOLS = [name.strip() for name in os.environ.get("KEY_POOL", "").split(",") if name.strip()]
+POOL_DEPTH = int(os.environ.get("KEY_POOL_DEPTH", "16"))
+REFILL_WORKERS = int(os.environ.get("KEY_POOL_WORKERS", "2"))
+
+# Number of recent refills the refill rate is measured over
+RATE_WINDOW = 64
+
+# Fresh key pairs kept ready by background threads. shadow_crypt releases the GIL while it
+# generates keys, so refill threads run next to the request threads instead of stalling them.
+# factory makes a pair for a request that found the pool empty, refill (factory by default)
+# the pairs of the refill threads.
+class KeyPool:
+    def __init__(self, name, factory, depth=POOL_DEPTH, workers=REFILL_WORKERS, refill=None):
+        self.name = name
+        self.factory = factory
+        self.refill = refill or factory
+        self.depth = depth
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._owner_pid = None
+        self._ready = None
+        self._stop = None
+        self._refill_times = deque(maxlen=RATE_WINDOW)
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_errors = 0
+
+    # Threads do not survive a gunicorn fork, so every worker starts its own refillers
+    def start(self):
+        with self._lock:
+            if self._owner_pid == os.getpid():
+                return
+            self._owner_pid = os.getpid()
+            self._ready = queue.Queue(maxsize=self.depth)
+            self._stop = threading.Event()
+            self._refill_times.clear()
+            for index in range(self.workers):
+                threading.Thread(target=self._refill, args=(self._ready, self._stop),
+                                 name=f"keypool-{self.name}-{index}", daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            if self._stop is not None:
+                self._stop.set()
+            self._owner_pid = None
+
+    def _refill(self, ready, stop):
+        while not stop.is_set():
+            try:
+                key_pair = self.refill()
+            except Exception:
+                with self._lock:
+                    self.refill_errors += 1
+                stop.wait(1)
+                continue
+            with self._lock:
+                self.refills += 1
+                self._refill_times.append(time.monotonic())
+
+            # Hold on to the pair until there is room, checking now and then whether to stop
+            while not stop.is_set():
+                try:
+                    ready.put(key_pair, timeout=0.5)
+                    break
+                except queue.Full:
+                    pass
+
+    # A ready key pair when there is one, otherwise one generated inline and counted as a miss
+    def take(self):
+        self.start()
+        try:
+            key_pair = self._ready.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.misses += 1
+            return self.factory()
+        with self._lock:
+            self.hits += 1
+        return key_pair
+
+    # Refills per second over the last RATE_WINDOW refills
+    def refill_rate(self):
+        with self._lock:
+            times = list(self._refill_times)
+        if len(times) < 2 or times[-1] <= times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            refills, refill_errors = self.refills, self.refill_errors
+        taken = hits + misses
+        return {
+            'depth': self._ready.qsize() if self._ready is not None else 0,
+            'capacity': self.depth,
+            'workers': self.workers,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / taken if taken else None,
+            'refills': refills,
+            'refill_errors': refill_errors,
+            'refills_per_second': self.refill_rate()
+        }
+
+# Pools for the configured protocols, started right away so the first requests already hit
+def build_pools(factories, protocols=None, refills=None):
+    protocols = POOLED_PROTOCOLS if protocols is None else protocols
+    unknown = [name for name in protocols if name not in factories]
+    if unknown:
+        raise ValueError(f"Unknown protocols in KEY_POOL: {', '.join(unknown)}")
+
+    refills = refills or {}
+    pools = {name: KeyPool(name, factories[name], refill=refills.get(name)) for name in protocols}
+    for pool in pools.values():
+        pool.start()
+    return pools
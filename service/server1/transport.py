@@ -0,0 +1,222 @@
+import asyncio
+import http.client
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+
+import cbor2
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Server 2 location and connection pool settings
+SERVER2_URL = os.environ.get("SERVER2_URL", "http://localhost:5001")
+POOL_SIZE = int(os.environ.get("SERVER2_POOL_SIZE", "32"))
+CONNECT_TIMEOUT = float(os.environ.get("SERVER2_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.environ.get("SERVER2_READ_TIMEOUT", "30"))
+
+# Encoding of keys between the servers: "json" sends hex inside JSON, "binary" sends raw bytes and CBOR
+WIRE_FORMATS = ("json", "binary")
+WIRE_FORMAT = os.environ.get("SERVER2_WIRE_FORMAT", "json")
+CBOR = "application/cbor"
+OCTET_STREAM = "application/octet-stream"
+
+_lock = threading.Lock()
+_session = None
+_async_state = None
+_owner_pid = None
+_loopback_client = None
+
+# Sessions and event loops do not survive a gunicorn fork, so every worker builds its own
+def _reset_after_fork():
+    global _session, _async_state, _owner_pid
+    if _owner_pid != os.getpid():
+        _session = None
+        _async_state = None
+        _owner_pid = os.getpid()
+
+# Process wide keep-alive session shared by every request thread
+def get_session():
+    global _session
+    with _lock:
+        _reset_after_fork()
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+# Response of an in-process call with the attributes the code here reads from a requests.Response
+class LoopbackResponse:
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.get_data()
+
+    def json(self):
+        return json.loads(self.content)
+
+# Sends every Server 2 call to a Flask test client instead of the network (no sockets), used to
+# run both servers' handlers in one process. None switches back to HTTP.
+def use_loopback(test_client):
+    global _loopback_client
+    _loopback_client = test_client
+
+def _loopback_post(path, **kwargs):
+    response = _loopback_client.post(path, data=kwargs.get("data"), json=kwargs.get("json"), headers=kwargs.get("headers"))
+    return LoopbackResponse(response)
+
+# Blocking call to Server 2 through the pooled session
+def post(path, **kwargs):
+    if _loopback_client is not None:
+        return _loopback_post(path, **kwargs)
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return get_session().post(f"{SERVER2_URL}{path}", **kwargs)
+
+# Background event loop owning one async client, so its pool outlives each Flask request
+def _get_async_state():
+    global _async_state
+    with _lock:
+        _reset_after_fork()
+        if _async_state is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="server2-transport", daemon=True).start()
+            client = httpx.AsyncClient(
+                base_url=SERVER2_URL,
+                limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+            )
+            _async_state = (loop, client)
+        return _async_state
+
+# Non-blocking call to Server 2, many of these can be in flight from a single worker
+async def async_post(path, **kwargs):
+    if _loopback_client is not None:
+        return await asyncio.to_thread(_loopback_post, path, **kwargs)
+    loop, client = _get_async_state()
+
+    # httpx wants raw bodies under content= instead of data=
+    if isinstance(kwargs.get("data"), (str, bytes)):
+        kwargs["content"] = kwargs.pop("data")
+
+    future = asyncio.run_coroutine_threadsafe(client.post(path, **kwargs), loop)
+    return await asyncio.wrap_future(future)
+
+# Keys come back raw from CBOR replies and as hex strings from JSON ones
+def as_bytes(value):
+    return bytes(value) if isinstance(value, (bytes, bytearray)) else bytes.fromhex(value)
+
+def as_hex(value):
+    return bytes(value).hex() if isinstance(value, (bytes, bytearray)) else value
+
+# JSON cannot carry bytes, so every bytes value is turned into hex
+def hexify(value):
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).hex()
+    if isinstance(value, dict):
+        return {key: hexify(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [hexify(item) for item in value]
+    return value
+
+# Size the same body or reply would have had as compact JSON with hex keys
+def json_size(value):
+    if isinstance(value, (bytes, bytearray)):
+        return 2 * len(value)
+    return len(json.dumps(hexify(value), separators=(",", ":")).encode())
+
+# Request arguments for a body that is either a lone public key (bytes) or a dict of fields
+def encode_request(body, wire=None):
+    wire = wire or WIRE_FORMAT
+    if wire not in WIRE_FORMATS:
+        raise ValueError(f"Unknown wire format: {wire}")
+    if wire == "binary":
+        if isinstance(body, (bytes, bytearray)):
+            return {"data": bytes(body), "headers": {"Content-Type": OCTET_STREAM, "Accept": CBOR}}
+        return {"data": cbor2.dumps(body), "headers": {"Content-Type": CBOR, "Accept": CBOR}}
+    if isinstance(body, (bytes, bytearray)):
+        return {"data": bytes(body).hex()}
+    return {"json": hexify(body)}
+
+# Reply fields from either a CBOR or a JSON response, None when the body is neither
+def decode_response(response):
+    try:
+        if response.headers.get("Content-Type", "").startswith(CBOR):
+            return cbor2.loads(response.content)
+        return response.json()
+    except ValueError:
+        return None
+
+# Bytes that actually crossed the wire next to what JSON with hex would have cost
+def wire_stats(wire, request_kwargs, body, response, reply):
+    sent = request_kwargs.get("data")
+    if sent is None:
+        sent = json.dumps(request_kwargs["json"], separators=(",", ":"))
+    request_bytes = len(sent.encode() if isinstance(sent, str) else sent)
+    return {
+        "format": wire,
+        "request_bytes": request_bytes,
+        "response_bytes": len(response.content),
+        "json_request_bytes": json_size(body),
+        "json_response_bytes": json_size(reply) if reply is not None else len(response.content)
+    }
+
+# Sums the wire statistics of several exchanges
+def total_wire_stats(stats_list):
+    totals = {"format": stats_list[0]["format"] if stats_list else WIRE_FORMAT}
+    for key in ("request_bytes", "response_bytes", "json_request_bytes", "json_response_bytes"):
+        totals[key] = sum(stats[key] for stats in stats_list)
+    return totals
+
+# Blocking exchange with Server 2, returns the response, its decoded fields and the wire statistics
+def exchange(path, body, wire=None):
+    wire = wire or WIRE_FORMAT
+    request_kwargs = encode_request(body, wire)
+    response = post(path, **request_kwargs)
+    reply = decode_response(response)
+    return response, reply, wire_stats(wire, request_kwargs, body, response, reply)
+
+# Same as exchange but through the async client
+async def async_exchange(path, body, wire=None):
+    wire = wire or WIRE_FORMAT
+    request_kwargs = encode_request(body, wire)
+    response = await async_post(path, **dict(request_kwargs))
+    reply = decode_response(response)
+    return response, reply, wire_stats(wire, request_kwargs, body, response, reply)
+
+# Full duplex streaming call: chunks are sent with chunked encoding from a writer thread while the
+# caller reads the response, so a Server 2 route that answers as it reads (hybrid encryption) never
+# waits on us to finish uploading. Returns (http.client response, writer thread, writer errors);
+# the response is read with .read(n) and the thread joined once it is exhausted. HTTP only.
+def stream_exchange(path, chunks, headers=None):
+    url = urlsplit(SERVER2_URL)
+    connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+    connection = connection_class(url.hostname, url.port, timeout=READ_TIMEOUT)
+    connection.putrequest("POST", f"{url.path.rstrip('/')}{path}")
+    for name, value in {"Transfer-Encoding": "chunked", "Content-Type": OCTET_STREAM, **(headers or {})}.items():
+        connection.putheader(name, value)
+    connection.endheaders()
+
+    errors = []
+    def write_body():
+        try:
+            for chunk in chunks:
+                if chunk:
+                    connection.send(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            connection.send(b"0\r\n\r\n")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # The socket really closes once the response is closed as well
+            connection.close()
+
+    writer = threading.Thread(target=write_body, name="server2-upload", daemon=True)
+    writer.start()
+    # Not getresponse(): it closes the connection when the answer says "Connection: close", which
+    # Server 2 sends before the upload is over, and the next send would then open a new one
+    response = connection.response_class(connection.sock, method="POST")
+    response.begin()
+    return response, writer, errors
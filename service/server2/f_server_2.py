@@ -1,35 +1,168 @@
-from flask import Flask, request, jsonify
+import os
+import sys
+
+# Helper modules both servers use (executor, hybrid, metrics, profiling, timing) live in
+# service/common; the Docker image copies them next to this file instead
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+
+from flask import Flask, Response, jsonify, request, stream_with_context
+from functools import lru_cache, partial
+import executor
 import hashlib
+import hybrid
+import metrics
+import profiling
 import shadow_crypt
+import time
+import timing
+import wire
 
 app = Flask(__name__)
+timing.init_app(app)
+profiling.init_app(app)
+
+# Protocol of each single-exchange route, the batch route names it in its path
+ROUTE_PROTOCOLS = {
+    '/receive_public_key': 'diffie_hellman',
+    '/receive_public_key_ell_curve': 'ecdh',
+    '/encrypt': 'rsa',
+    '/kyber_encapsulate': 'kyber',
+    '/ntru_encapsulate': 'ntru'
+}
+
+# (protocol, route) of a request, batches get their own route label so they stay out of the single
+# exchange latencies. Streaming routes are left out, their handler returns before the body is even read
+def request_route(request):
+    if request.endpoint == 'hybrid_encrypt':
+        return None
+    protocol = (request.view_args or {}).get('protocol')
+    if protocol is not None:
+        return protocol, 'batch'
+    protocol = ROUTE_PROTOCOLS.get(request.path)
+    return None if protocol is None else (protocol, 'single')
+
+EXCHANGE_PROTOCOLS = ('diffie_hellman', 'ecdh', 'rsa', 'kyber', 'ntru')
+METRICS = metrics.init_app(app, [(protocol, route) for route in ('single', 'batch') for protocol in EXCHANGE_PROTOCOLS],
+                           ('read', 'keygen', 'derive', 'load_key', 'encrypt', 'encapsulate', 'queue', 'serialize'),
+                           request_route)
+
+# Key generation, derivation and encryption, inline or in a pool depending on CRYPTO_EXECUTOR
+CRYPTO = executor.init_app(app, EXCHANGE_PROTOCOLS, METRICS)
+
+# Parsed RSA public keys kept between requests
+RSA_KEY_CACHE_SIZE = int(os.environ.get("RSA_KEY_CACHE_SIZE", "256"))
+
+# Largest batch answered, as server1 sends at most its own MAX_BATCH_COUNT keys
+MAX_BATCH_COUNT = int(os.environ.get("MAX_BATCH_COUNT", "1000"))
 
 # Health check for Render
 @app.route('/health')
 def health():
     return jsonify({"status": "ok"}), 200
 
+# Diffie-Hellman answer for one public key, shared by the single and batch routes.
+# Responders take and return raw bytes, the wire module picks the encoding.
+def dh_respond(public_key):
+    # Generate key pair
+    with timing.phase('keygen'):
+        private_key2, public_key2 = CRYPTO.run('diffie_hellman', shadow_crypt.generate_dh_key)
+    with timing.phase('derive'):
+        shared_key = CRYPTO.run('diffie_hellman', shadow_crypt.derive_dh_shared_key, private_key2, public_key)
+        final_key = hashlib.sha256(shared_key).hexdigest()
+
+    return {
+        'final_key': final_key,
+        'server_public_key': public_key2,
+        'server2_private_key': private_key2
+    }
+
+# Elliptic Curve Diffie-Hellman answer for one public key
+def ecdh_respond(public_key):
+    # Generate key pair.
+    with timing.phase('keygen'):
+        private_key, server_public_key = CRYPTO.run('ecdh', shadow_crypt.generate_ecdh_key)
+    with timing.phase('derive'):
+        shared_key = CRYPTO.run('ecdh', shadow_crypt.derive_ecdh_shared_key, private_key, public_key)
+        final_key = hashlib.sha256(shared_key).hexdigest()
+
+    return {
+        'final_key': final_key,
+        'server_public_key': server_public_key,
+        'server2_private_key': private_key
+    }
+
+# Key handle for a PEM public key, a key Server 1 sends again is not parsed again
+@lru_cache(maxsize=RSA_KEY_CACHE_SIZE)
+def rsa_public_key(public_key):
+    return shadow_crypt.RsaKey.from_pem(public_key)
+
+# RSA encryption of the message with the received public key
+def rsa_respond(public_key, message):
+    with timing.phase('load_key'):
+        rsa_key = rsa_public_key(public_key)
+    with timing.phase('encrypt'):
+        encrypted_message = CRYPTO.run('rsa', rsa_key.encrypt, message, portable=False)
+
+    return {
+        'encrypted_message': encrypted_message,
+        'used_public_key': public_key
+    }
+
+# Crystals Kyber encapsulation for one public key
+def kyber_respond(public_key):
+    with timing.phase('encapsulate'):
+        ciphertext, shared_secret = CRYPTO.run('kyber', shadow_crypt.kyber_encapsulate, public_key)
+    return {
+        'ciphertext': ciphertext,
+        'shared_secret': shared_secret
+    }
+
+# NTRU encapsulation for one public key
+def ntru_respond(public_key):
+    # Perform encapsulation
+    with timing.phase('encapsulate'):
+        ciphertext, shared_secret = CRYPTO.run('ntru', shadow_crypt.ntru_encapsulate, public_key)
+
+    return {
+        'ciphertext': ciphertext,
+        'shared_secret': shared_secret
+    }
+
+# KEMs that can carry a message: the shared secret keys ChaCha20-Poly1305 over the message
+KEM_ENCAPSULATE = {
+    'kyber': shadow_crypt.kyber_encapsulate,
+    'ntru': shadow_crypt.ntru_encapsulate
+}
+
+# Encapsulation against the received public key, then the message encrypted under sha256(shared
+# secret). The KEM ciphertext is the associated data, so it cannot be swapped for another one.
+def kem_encrypt_respond(protocol, public_key, message):
+    with timing.phase('encapsulate'):
+        ciphertext, shared_secret = CRYPTO.run(protocol, KEM_ENCAPSULATE[protocol], public_key)
+    with timing.phase('encrypt'):
+        nonce = os.urandom(shadow_crypt.AEAD_NONCE_BYTES)
+        encrypted_message = shadow_crypt.aead_encrypt(hashlib.sha256(shared_secret).digest(), nonce,
+                                                      message.encode('utf-8'), ciphertext)
+    return {
+        'ciphertext': ciphertext,
+        'nonce': nonce,
+        'encrypted_message': encrypted_message
+    }
+
+# Protocol names as used by server 1 routes
+RESPONDERS = {
+    'diffie_hellman': dh_respond,
+    'ecdh': ecdh_respond,
+    'rsa': rsa_respond,
+    'kyber': kyber_respond,
+    'ntru': ntru_respond
+}
+
 # Diffie-Hellman
 @app.route('/receive_public_key', methods=['POST'])
 def receive_public_key():
     try:
-        # Receive public key 
-        public_key_from_server1 = list(bytes.fromhex(request.data.decode()))
-        
-        # Generate key pair
-        private_key2, public_key2 = shadow_crypt.generate_dh_key()
-        shared_key = shadow_crypt.derive_dh_shared_key(private_key2, public_key_from_server1)
-        final_key = hashlib.sha256(bytes(shared_key)).hexdigest()
-        
-        server_public_key_hex = bytes(public_key2).hex()
-        server_private_key_hex = bytes(private_key2).hex()
-        
-        return jsonify({
-            'success': True,
-            'final_key': final_key,
-            'server_public_key': server_public_key_hex,
-            'server2_private_key': server_private_key_hex
-        })
+        return wire.respond({'success': True, **dh_respond(wire.read_public_key())})
     except Exception as e:
         return jsonify({'success': False, 'error': f'Key exchange failed: {str(e)}'})
 
@@ -37,44 +170,17 @@ def receive_public_key():
 @app.route('/receive_public_key_ell_curve', methods=['POST'])
 def receive_public_key_ell_curve():
     try:
-        # Receive public key
-        client_pub_hex = request.data.decode()
-        client_pub_bytes = bytes.fromhex(client_pub_hex)
-        
-        # Generate key pair.
-        private_key, public_key = shadow_crypt.generate_ecdh_key()
-        shared_key = shadow_crypt.derive_ecdh_shared_key(private_key, client_pub_bytes)
-        final_key = hashlib.sha256(bytes(shared_key)).hexdigest()
-        
-        # Convert our public key (list of ints) to bytes then hex string.
-        server_public_key_hex = bytes(public_key).hex()
-        server_private_key_hex = bytes(private_key).hex()
-        
-        return jsonify({
-            'success': True,
-            'final_key': final_key,
-            'server_public_key': server_public_key_hex,
-            'server2_private_key': server_private_key_hex
-        })
+        return wire.respond({'success': True, **ecdh_respond(wire.read_public_key())})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
-# RSA 
+# RSA
 @app.route('/encrypt', methods=['POST'])
 def encrypt():
     try:
         # Get the encrypted message
-        data = request.get_json()
-        public_key = data['public_key']
-        message = data['message']
-
-        encrypted_message_list = shadow_crypt.rsa_encrypt(public_key, message)
-        encrypted_message_bytes = bytes(encrypted_message_list)
-        
-        return jsonify({
-            'encrypted_message': encrypted_message_bytes.hex(),
-            'used_public_key': public_key
-        })
+        data = wire.read_payload()
+        return wire.respond(rsa_respond(data['public_key'], data['message']))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -83,14 +189,7 @@ def encrypt():
 def kyber_encapsulate():
     try:
         # Expect public key
-        public_key_hex = request.data.decode()
-        public_key = bytes.fromhex(public_key_hex)
-        ciphertext, shared_secret = shadow_crypt.kyber_encapsulate(public_key)
-        return jsonify({
-            'success': True,
-            'ciphertext': ciphertext.hex(),
-            'shared_secret': shared_secret.hex()
-        })
+        return wire.respond({'success': True, **kyber_respond(wire.read_public_key())})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -98,21 +197,82 @@ def kyber_encapsulate():
 @app.route('/ntru_encapsulate', methods=['POST'])
 def ntru_encapsulate():
     try:
-        # Expect the public key from Server 1 
-        public_key_hex = request.data.decode()
-        public_key = bytes.fromhex(public_key_hex)
-        
-        # Perform encapsulation
-        ciphertext, shared_secret = shadow_crypt.ntru_encapsulate(public_key)
-        
-        return jsonify({
-            'success': True,
-            'ciphertext': bytes(ciphertext).hex(),
-            'shared_secret': bytes(shared_secret).hex()
-        })
+        # Expect the public key from Server 1
+        return wire.respond({'success': True, **ntru_respond(wire.read_public_key())})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+# Message encryption through a KEM, the counterpart of /encrypt for Kyber and NTRU
+@app.route('/kem_encrypt', methods=['POST'])
+def kem_encrypt():
+    try:
+        data = wire.read_payload()
+        if data.get('protocol') not in KEM_ENCAPSULATE:
+            return jsonify({'success': False, 'error': f"Unknown KEM: {data.get('protocol')}"}), 404
+        public_key = wire.as_bytes(data['public_key'])
+        return wire.respond({'success': True, **kem_encrypt_respond(data['protocol'], public_key, data['message'])})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+# Hybrid encryption of a body of any size for the public key in X-Public-Key (hex). The body is
+# read from the request stream and each encrypted chunk written out as soon as it is ready.
+@app.route('/hybrid_encrypt/<protocol>', methods=['POST'])
+def hybrid_encrypt(protocol):
+    if protocol not in hybrid.PROTOCOLS:
+        return jsonify({'success': False, 'error': f'Unknown hybrid protocol: {protocol}'}), 404
+    try:
+        public_key = bytes.fromhex(request.headers['X-Public-Key'])
+        chunk_bytes = request.args.get('chunk', default=hybrid.CHUNK_BYTES, type=int)
+        if not 1 <= chunk_bytes <= hybrid.MAX_CHUNK_BYTES:
+            return jsonify({'success': False, 'error': f'chunk must be between 1 and {hybrid.MAX_CHUNK_BYTES}'}), 400
+    except (KeyError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Missing or invalid X-Public-Key: {e}'}), 400
+    stream = hybrid.encrypt_stream(protocol, public_key, request.stream, chunk_bytes)
+    return Response(stream_with_context(stream), mimetype=wire.OCTET_STREAM)
+
+# Batch of exchanges, one answer per received public key
+@app.route('/batch/<protocol>', methods=['POST'])
+def batch(protocol):
+    if protocol not in RESPONDERS:
+        return jsonify({'success': False, 'error': f'Unknown protocol: {protocol}'}), 404
+
+    data = wire.read_payload()
+    public_keys = data.get('public_keys')
+    if not isinstance(public_keys, list):
+        return jsonify({'success': False, 'error': 'Expected a public_keys list'}), 400
+    if not 1 <= len(public_keys) <= MAX_BATCH_COUNT:
+        return jsonify({'success': False, 'error': f'public_keys must hold between 1 and {MAX_BATCH_COUNT} keys'}), 400
+
+    # RSA keys travel as PEM text, every other key as bytes or hex
+    if protocol == 'rsa':
+        respond = partial(rsa_respond, message=data.get('message', "Hello, world!"))
+    else:
+        respond = lambda public_key: RESPONDERS[protocol](wire.as_bytes(public_key))
+
+    # Every item is answered on its own so one bad key, or one call shed by a busy executor, does
+    # not fail the whole batch
+    results = []
+    start_time = time.perf_counter()
+    with CRYPTO.handled():
+        for public_key in public_keys:
+            try:
+                results.append({'success': True, **respond(public_key)})
+            except executor.Overloaded as e:
+                results.append({'success': False, 'error': str(e), 'overloaded': True})
+            except Exception as e:
+                results.append({'success': False, 'error': str(e)})
+    compute_seconds = time.perf_counter() - start_time
+
+    return wire.respond({
+        'success': True,
+        'count': len(results),
+        'results': results,
+        'timings': {
+            'compute_seconds': compute_seconds,
+            'handshakes_per_second': len(results) / compute_seconds if compute_seconds > 0 else 0
+        }
+    })
+
 # Main
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=5001, debug=True)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=5001, debug=True)
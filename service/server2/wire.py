@@ -0,0 +1,43 @@
+from flask import Response, jsonify, request
+import cbor2
+import timing
+
+# Formats Server 1 can talk to us in, JSON with hex keys stays the default
+JSON = "application/json"
+CBOR = "application/cbor"
+OCTET_STREAM = "application/octet-stream"
+
+# Keys arrive raw in binary formats and as hex strings in JSON
+def as_bytes(value):
+    return bytes(value) if isinstance(value, (bytes, bytearray)) else bytes.fromhex(value)
+
+# JSON cannot carry bytes, so every bytes value is turned into hex
+def hexify(value):
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).hex()
+    if isinstance(value, dict):
+        return {key: hexify(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [hexify(item) for item in value]
+    return value
+
+# Public key sent on its own, either as raw bytes or as hex text
+def read_public_key():
+    with timing.phase('read'):
+        if request.mimetype == OCTET_STREAM:
+            return request.get_data()
+        return bytes.fromhex(request.get_data(as_text=True))
+
+# Structured body, either CBOR or JSON
+def read_payload():
+    with timing.phase('read'):
+        if request.mimetype == CBOR:
+            return cbor2.loads(request.get_data())
+        return request.get_json(silent=True) or {}
+
+# Answer in whatever format the caller accepts
+def respond(result, status=200):
+    with timing.phase('serialize'):
+        if request.accept_mimetypes.best_match([JSON, CBOR], default=JSON) == CBOR:
+            return Response(cbor2.dumps(result), status=status, mimetype=CBOR)
+        return jsonify(hexify(result)), status
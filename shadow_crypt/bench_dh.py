@@ -0,0 +1,52 @@
+import argparse
+import statistics
+import time
+
+import shadow_crypt
+
+# Diffie-Hellman keygen with the cached group against the previous implementation, which parsed
+# the prime and ran a generic modpow with a full-size exponent on every call.
+#
+# Usage: python bench_dh.py --keys 200 --rounds 5
+
+KEYGENS = {
+    "modpow (uncached)": shadow_crypt.generate_dh_key_modpow,
+    "cached group": shadow_crypt.generate_dh_key,
+    "cached group, short exponent": lambda: shadow_crypt.generate_dh_key(short_exponent=True)
+}
+
+# Keys per second of one keygen, the best of several rounds
+def measure(keygen, keys, rounds):
+    rates = []
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        for _ in range(keys):
+            keygen()
+        rates.append(keys / (time.perf_counter() - start_time))
+    return max(rates), statistics.median(rates)
+
+# Shared key derivation per second for full-size and short private exponents
+def measure_derive(keys, rounds, short_exponent):
+    private_key, _ = shadow_crypt.generate_dh_key(short_exponent=short_exponent)
+    _, public_key = shadow_crypt.generate_dh_key()
+    return measure(lambda: shadow_crypt.derive_dh_shared_key(private_key, public_key), keys, rounds)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diffie-Hellman keygen, cached group against generic modpow")
+    parser.add_argument("--keys", type=int, default=200, help="key pairs per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    # The first call builds the cached group, it is not billed to any round
+    shadow_crypt.generate_dh_key()
+
+    baseline = None
+    for name, keygen in KEYGENS.items():
+        best, median = measure(keygen, args.keys, args.rounds)
+        baseline = baseline or median
+        print(f"keygen  {name:30} {median:10.1f} keys/s (best {best:.1f})   x{median / baseline:6.2f}")
+
+    for short_exponent in (False, True):
+        best, median = measure_derive(args.keys, args.rounds, short_exponent)
+        name = "short exponent" if short_exponent else "full exponent"
+        print(f"derive  {name:30} {median:10.1f} keys/s (best {best:.1f})")
@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+import shadow_crypt
+
+# Microbenchmarks of every shadow_crypt primitive. Each one is warmed up, then timed over several
+# rounds, and reported as ops/s with a 95% confidence interval over the rounds. Results can be
+# saved as a JSON baseline and later runs compared against it, flagging regressions beyond a
+# threshold, e.g. after bumping kyberlib, ntrust-native, rsa or num-bigint.
+#
+# Usage: python bench_primitives.py --save baseline.json
+#        python bench_primitives.py --compare baseline.json --threshold 5
+
+MESSAGE = "Hello, world!"
+
+# Crate dependencies whose versions are recorded with every result
+TRACKED_CRATES = ("kyberlib", "ntrust-native", "rsa", "num-bigint", "x25519-dalek", "pyo3")
+
+# Inputs each benchmark needs, built once outside of the timed region
+def fixtures():
+    dh_private_key, dh_public_key = shadow_crypt.generate_dh_key()
+    ecdh_private_key, ecdh_public_key = shadow_crypt.generate_ecdh_key()
+    rsa_private_key, rsa_public_key = shadow_crypt.generate_rsa_key()
+    kyber_public_key, kyber_secret_key = shadow_crypt.kyber_keygen()
+    kyber_ciphertext, _ = shadow_crypt.kyber_encapsulate(kyber_public_key)
+    ntru_public_key, ntru_private_key = shadow_crypt.ntru_generate_keypair()
+    ntru_ciphertext, _ = shadow_crypt.ntru_encapsulate(ntru_public_key)
+    return {
+        "dh": (dh_private_key, dh_public_key),
+        "ecdh": (ecdh_private_key, ecdh_public_key),
+        "rsa": (rsa_private_key, rsa_public_key, shadow_crypt.rsa_encrypt(rsa_public_key, MESSAGE)),
+        "kyber": (kyber_public_key, kyber_secret_key, kyber_ciphertext),
+        "ntru": (ntru_public_key, ntru_private_key, ntru_ciphertext)
+    }
+
+# Benchmark name to a zero-argument callable over the fixtures
+def benchmarks(f):
+    return {
+        "dh_keygen": shadow_crypt.generate_dh_key,
+        "dh_derive": lambda: shadow_crypt.derive_dh_shared_key(f["dh"][0], f["dh"][1]),
+        "x25519_keygen": shadow_crypt.generate_ecdh_key,
+        "x25519_derive": lambda: shadow_crypt.derive_ecdh_shared_key(f["ecdh"][0], f["ecdh"][1]),
+        "rsa_keygen": shadow_crypt.generate_rsa_key,
+        "rsa_encrypt": lambda: shadow_crypt.rsa_encrypt(f["rsa"][1], MESSAGE),
+        "rsa_decrypt": lambda: shadow_crypt.rsa_decrypt(f["rsa"][0], f["rsa"][2]),
+        "kyber_keygen": shadow_crypt.kyber_keygen,
+        "kyber_encapsulate": lambda: shadow_crypt.kyber_encapsulate(f["kyber"][0]),
+        "kyber_decapsulate": lambda: shadow_crypt.kyber_decapsulate(f["kyber"][2], f["kyber"][1]),
+        "ntru_keygen": shadow_crypt.ntru_generate_keypair,
+        "ntru_encapsulate": lambda: shadow_crypt.ntru_encapsulate(f["ntru"][0]),
+        "ntru_decapsulate": lambda: shadow_crypt.ntru_decapsulate(f["ntru"][1], f["ntru"][2])
+    }
+
+# Two-sided 95% Student t quantiles by degrees of freedom, normal quantile beyond the table
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+        10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042}
+
+def t_quantile(degrees):
+    known = [d for d in T_95 if d <= degrees]
+    return T_95[max(known)] if degrees <= 30 else 1.960
+
+# Operations per call needed for one round to take about round_seconds
+def calibrate(operation, round_seconds):
+    calls = 1
+    while True:
+        start_time = time.perf_counter()
+        for _ in range(calls):
+            operation()
+        elapsed = time.perf_counter() - start_time
+        if elapsed >= round_seconds / 4 or calls >= 1 << 20:
+            return max(1, int(calls * round_seconds / max(elapsed, 1e-9)))
+        calls *= 4
+
+# Warmup, then ops/s of each round with the mean and its 95% confidence interval
+def measure(operation, warmup_seconds, rounds, round_seconds):
+    deadline = time.perf_counter() + warmup_seconds
+    while time.perf_counter() < deadline:
+        operation()
+
+    calls = calibrate(operation, round_seconds)
+    rates = []
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        for _ in range(calls):
+            operation()
+        rates.append(calls / (time.perf_counter() - start_time))
+
+    mean = statistics.fmean(rates)
+    stdev = statistics.stdev(rates) if len(rates) > 1 else 0.0
+    half_width = t_quantile(len(rates) - 1) * stdev / len(rates) ** 0.5 if len(rates) > 1 else 0.0
+    return {
+        "ops_per_second": mean,
+        "ci95_low": mean - half_width,
+        "ci95_high": mean + half_width,
+        "stdev": stdev,
+        "rounds": rounds,
+        "calls_per_round": calls,
+        "rates": rates
+    }
+
+# Versions of the tracked crates the installed module was built against (CRATE_VERSIONS, from
+# build.rs), empty for builds older than that
+def built_crate_versions():
+    versions = getattr(shadow_crypt, "CRATE_VERSIONS", {})
+    return {name: versions[name] for name in TRACKED_CRATES if name in versions}
+
+def environment():
+    try:
+        from importlib.metadata import version
+        shadow_crypt_version = version("shadowCrypt")
+    except Exception:
+        shadow_crypt_version = None
+    return {
+        "shadow_crypt": shadow_crypt_version,
+        "crates": built_crate_versions(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+
+# Regressions are slowdowns beyond the threshold whose confidence intervals do not overlap,
+# so a noisy run alone is not reported as one
+def compare(results, baseline, threshold_percent):
+    rows = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            rows.append((name, result, None, None, "new"))
+            continue
+        change = 100 * (result["ops_per_second"] / base["ops_per_second"] - 1)
+        if change < -threshold_percent and result["ci95_high"] < base["ci95_low"]:
+            status = "REGRESSION"
+        elif change > threshold_percent and result["ci95_low"] > base["ci95_high"]:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((name, result, base, change, status))
+    return rows
+
+def print_results(results):
+    print(f"{'benchmark':20}{'ops/s':>14}{'95% CI':>26}")
+    for name, result in results.items():
+        interval = f"[{result['ci95_low']:.1f}, {result['ci95_high']:.1f}]"
+        print(f"{name:20}{result['ops_per_second']:>14.1f}{interval:>26}")
+
+def print_comparison(rows):
+    print(f"{'benchmark':20}{'baseline ops/s':>16}{'ops/s':>14}{'change':>10}  status")
+    for name, result, base, change, status in rows:
+        base_text = f"{base['ops_per_second']:.1f}" if base else "-"
+        change_text = f"{change:+.1f}%" if change is not None else "-"
+        print(f"{name:20}{base_text:>16}{result['ops_per_second']:>14.1f}{change_text:>10}  {status}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="shadow_crypt primitive microbenchmarks")
+    parser.add_argument("--only", nargs="+", help="benchmarks to run (default: all)")
+    parser.add_argument("--warmup", type=float, default=0.5, help="warmup seconds per benchmark")
+    parser.add_argument("--rounds", type=int, default=10, help="timed rounds per benchmark")
+    parser.add_argument("--round-seconds", type=float, default=0.2, help="target length of each round")
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=5.0, help="slowdown in percent flagged as a regression")
+    args = parser.parse_args()
+
+    available = benchmarks(fixtures())
+    unknown = set(args.only or []) - set(available)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for name in args.only or available:
+        results[name] = measure(available[name], args.warmup, args.rounds, args.round_seconds)
+        print(f"{name:20}{results[name]['ops_per_second']:>14.1f} ops/s", file=sys.stderr)
+
+    if args.save:
+        with open(args.save, "w") as output:
+            json.dump({"environment": environment(), "results": results}, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"baseline: {baseline.get('environment', {})}")
+        print(f"current:  {environment()}")
+        rows = compare(results, baseline, args.threshold)
+        print_comparison(rows)
+        sys.exit(1 if any(status == "REGRESSION" for *_, status in rows) else 0)
+    print_results(results)
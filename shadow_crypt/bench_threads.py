@@ -0,0 +1,73 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import shadow_crypt
+
+# Thread scaling of shadow_crypt inside a single process. Every binding releases the GIL while it
+# computes, so handshakes per second should grow with the thread count up to the number of cores.
+#
+# Usage: python bench_threads.py --handshakes 64 --threads 1 2 4 8
+
+# Both sides of one complete exchange per protocol, all in this process
+def dh_handshake():
+    private_key1, public_key1 = shadow_crypt.generate_dh_key()
+    private_key2, public_key2 = shadow_crypt.generate_dh_key()
+    assert shadow_crypt.derive_dh_shared_key(private_key1, public_key2) == shadow_crypt.derive_dh_shared_key(private_key2, public_key1)
+
+def ecdh_handshake():
+    private_key1, public_key1 = shadow_crypt.generate_ecdh_key()
+    private_key2, public_key2 = shadow_crypt.generate_ecdh_key()
+    assert shadow_crypt.derive_ecdh_shared_key(private_key1, public_key2) == shadow_crypt.derive_ecdh_shared_key(private_key2, public_key1)
+
+def rsa_handshake():
+    private_key, public_key = shadow_crypt.generate_rsa_key()
+    encrypted_message = shadow_crypt.rsa_encrypt(public_key, "Hello, world!")
+    assert shadow_crypt.rsa_decrypt(private_key, encrypted_message) == "Hello, world!"
+
+def kyber_handshake():
+    public_key, secret_key = shadow_crypt.kyber_keygen()
+    ciphertext, shared_secret = shadow_crypt.kyber_encapsulate(public_key)
+    assert shadow_crypt.kyber_decapsulate(ciphertext, secret_key) == shared_secret
+
+def ntru_handshake():
+    public_key, private_key = shadow_crypt.ntru_generate_keypair()
+    ciphertext, shared_secret = shadow_crypt.ntru_encapsulate(public_key)
+    assert shadow_crypt.ntru_decapsulate(private_key, ciphertext) == shared_secret
+
+HANDSHAKES = {
+    "diffie_hellman": dh_handshake,
+    "ecdh": ecdh_handshake,
+    "rsa": rsa_handshake,
+    "kyber": kyber_handshake,
+    "ntru": ntru_handshake
+}
+
+# Handshakes per second with the given number of threads sharing the work
+def measure(handshake, total, threads):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start_time = time.perf_counter()
+        for future in [pool.submit(handshake) for _ in range(total)]:
+            future.result()
+        return total / (time.perf_counter() - start_time)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Thread scaling of shadow_crypt handshakes")
+    parser.add_argument("--protocols", nargs="+", default=list(HANDSHAKES), choices=list(HANDSHAKES))
+    parser.add_argument("--handshakes", type=int, default=64, help="handshakes per measurement (RSA runs a quarter)")
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs available")
+    for protocol in args.protocols:
+        handshake = HANDSHAKES[protocol]
+        total = max(1, args.handshakes // 4) if protocol == "rsa" else args.handshakes
+
+        # Warm up once so lazy initialisation is not billed to the first run
+        handshake()
+        baseline = None
+        for threads in args.threads:
+            rate = measure(handshake, total, threads)
+            baseline = baseline or rate
+            print(f"{protocol:15} {threads:3} threads {rate:10.1f} handshakes/s   x{rate / baseline:5.2f}")
@@ -0,0 +1,61 @@
+use std::env;
+use std::fs;
+use std::path::Path;
+
+// Versions of the direct dependencies as resolved in Cargo.lock, built into the module as
+// CRATE_VERSIONS. Cargo brings the lock file up to date before build scripts run, so these are the
+// crates the module was compiled against, whether or not a Cargo.lock came with the sources.
+fn main() {
+    let lock_path = Path::new(&env::var("CARGO_MANIFEST_DIR").unwrap()).join("Cargo.lock");
+    println!("cargo:rerun-if-changed={}", lock_path.display());
+    let lock = fs::read_to_string(&lock_path).unwrap_or_default();
+    let packages: Vec<Package> = lock.split("[[package]]").skip(1).map(parse_package).collect();
+
+    let mut entries = String::new();
+    let root = env::var("CARGO_PKG_NAME").unwrap();
+    if let Some(root) = packages.iter().find(|package| package.name == root) {
+        for dependency in &root.dependencies {
+            // "name" when a single version is locked, "name version" when there are several
+            let mut parts = dependency.split(' ');
+            let name = parts.next().unwrap_or_default();
+            let version = match parts.next() {
+                Some(version) => Some(version),
+                None => packages.iter().find(|package| package.name == name).map(|package| package.version.as_str()),
+            };
+            if let Some(version) = version {
+                entries += &format!("    ({:?}, {:?}),\n", name, version);
+            }
+        }
+    }
+
+    let out_path = Path::new(&env::var("OUT_DIR").unwrap()).join("crate_versions.rs");
+    fs::write(out_path, format!("pub const CRATE_VERSIONS: &[(&str, &str)] = &[\n{}];\n", entries)).unwrap();
+}
+
+struct Package {
+    name: String,
+    version: String,
+    dependencies: Vec<String>,
+}
+
+// One [[package]] entry of Cargo.lock
+fn parse_package(block: &str) -> Package {
+    let mut package = Package { name: String::new(), version: String::new(), dependencies: Vec::new() };
+    let mut in_dependencies = false;
+    for line in block.lines().map(str::trim) {
+        if in_dependencies {
+            if line == "]" {
+                in_dependencies = false;
+            } else {
+                package.dependencies.push(line.trim_end_matches(',').trim_matches('"').to_string());
+            }
+        } else if let Some(value) = line.strip_prefix("name = ") {
+            package.name = value.trim_matches('"').to_string();
+        } else if let Some(value) = line.strip_prefix("version = ") {
+            package.version = value.trim_matches('"').to_string();
+        } else if line == "dependencies = [" {
+            in_dependencies = true;
+        }
+    }
+    package
+}
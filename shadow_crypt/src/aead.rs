@@ -0,0 +1,45 @@
+use pyo3::prelude::*;
+use pyo3::exceptions::PyValueError;
+use pyo3::types::PyBytes;
+use chacha20poly1305::{ChaCha20Poly1305, Key, Nonce};
+use chacha20poly1305::aead::{Aead, KeyInit, Payload};
+use crate::buffers::{ByteArg, to_py_bytes};
+
+pub const AEAD_KEY_BYTES: usize = 32;
+pub const AEAD_NONCE_BYTES: usize = 12;
+pub const AEAD_TAG_BYTES: usize = 16;
+
+fn cipher_for(key: &[u8]) -> PyResult<ChaCha20Poly1305> {
+    if key.len() != AEAD_KEY_BYTES {return Err(PyValueError::new_err("AEAD key must be 32 bytes"));}
+    Ok(ChaCha20Poly1305::new(Key::from_slice(key)))
+}
+
+fn nonce_for(nonce: &[u8]) -> PyResult<&Nonce> {
+    if nonce.len() != AEAD_NONCE_BYTES {return Err(PyValueError::new_err("AEAD nonce must be 12 bytes"));}
+    Ok(Nonce::from_slice(nonce))
+}
+
+// ChaCha20-Poly1305 encryption, returns the ciphertext followed by the 16 byte tag.
+// The data key usually comes from a KEM shared secret, the nonce must never repeat under one key.
+#[pyfunction]
+#[pyo3(signature = (key, nonce, plaintext, associated_data=None))]
+pub fn aead_encrypt(py: Python<'_>, key: ByteArg, nonce: ByteArg, plaintext: ByteArg, associated_data: Option<ByteArg>) -> PyResult<Py<PyBytes>> {
+    let cipher = cipher_for(key.as_slice())?;
+    let nonce = nonce_for(nonce.as_slice())?;
+    let (msg, aad) = (plaintext.as_slice(), associated_data.as_ref().map_or(&[][..], |aad| aad.as_slice()));
+    let ciphertext = py.allow_threads(|| cipher.encrypt(nonce, Payload { msg, aad }))
+        .map_err(|_| PyValueError::new_err("AEAD encryption failed"))?;
+    Ok(to_py_bytes(py, &ciphertext))
+}
+
+// ChaCha20-Poly1305 decryption, raises ValueError when the tag does not verify
+#[pyfunction]
+#[pyo3(signature = (key, nonce, ciphertext, associated_data=None))]
+pub fn aead_decrypt(py: Python<'_>, key: ByteArg, nonce: ByteArg, ciphertext: ByteArg, associated_data: Option<ByteArg>) -> PyResult<Py<PyBytes>> {
+    let cipher = cipher_for(key.as_slice())?;
+    let nonce = nonce_for(nonce.as_slice())?;
+    let (msg, aad) = (ciphertext.as_slice(), associated_data.as_ref().map_or(&[][..], |aad| aad.as_slice()));
+    let plaintext = py.allow_threads(|| cipher.decrypt(nonce, Payload { msg, aad }))
+        .map_err(|_| PyValueError::new_err("AEAD decryption failed: ciphertext or associated data was altered"))?;
+    Ok(to_py_bytes(py, &plaintext))
+}
@@ -0,0 +1,36 @@
+use pyo3::prelude::*;
+use pyo3::buffer::PyBuffer;
+use pyo3::types::PyBytes;
+
+// Byte input accepted by every binding: bytes are borrowed without copying, any other buffer
+// (bytearray, memoryview, numpy arrays) is copied once, and the old list[int] form still works
+pub enum ByteArg<'py> {
+    Borrowed(Bound<'py, PyBytes>),
+    Owned(Vec<u8>),
+}
+
+impl<'py> FromPyObject<'py> for ByteArg<'py> {
+    fn extract_bound(ob: &Bound<'py, PyAny>) -> PyResult<Self> {
+        if let Ok(bytes) = ob.downcast::<PyBytes>() {
+            return Ok(ByteArg::Borrowed(bytes.clone()));
+        }
+        if let Ok(buffer) = PyBuffer::<u8>::get_bound(ob) {
+            return Ok(ByteArg::Owned(buffer.to_vec(ob.py())?));
+        }
+        Ok(ByteArg::Owned(ob.extract::<Vec<u8>>()?))
+    }
+}
+
+impl ByteArg<'_> {
+    pub fn as_slice(&self) -> &[u8] {
+        match self {
+            ByteArg::Borrowed(bytes) => bytes.as_bytes(),
+            ByteArg::Owned(vec) => vec,
+        }
+    }
+}
+
+// Result buffer handed back to Python as bytes
+pub fn to_py_bytes(py: Python<'_>, data: &[u8]) -> Py<PyBytes> {
+    PyBytes::new_bound(py, data).into()
+}
@@ -1,30 +1,309 @@
 use pyo3::prelude::*;
+use pyo3::types::PyBytes;
 use num_bigint::{BigUint, RandBigInt};
 use rand::thread_rng;
+use std::sync::OnceLock;
+use crate::buffers::{ByteArg, to_py_bytes};
 
 const DH_PRIME: &str = "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F14374FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7EDEE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF0598DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3BE39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF6955817183995497CEA956AE515D2261898FA051015728E5A8AACAA68FFFFFFFFFFFFFFFF";
 const DH_GENERATOR: u32 = 2;
 
-// Diffie-Hellman key generation
-#[pyfunction]
-pub fn generate_dh_key() -> PyResult<(Vec<u8>, Vec<u8>)> {
-    let p = BigUint::parse_bytes(DH_PRIME.as_bytes(), 16).unwrap();
-    let g = BigUint::from(DH_GENERATOR);
+// Fixed record width of the batch buffers, the size of the 2048-bit prime
+pub const DH_KEY_BYTES: usize = 256;
+
+// Short private exponents: the 2048-bit MODP group gives about 112 bits of security, and an
+// exponent of twice that strength (rounded up to 256 bits) keeps discrete logs just as hard
+pub const DH_SHORT_EXPONENT_BITS: u64 = 256;
+
+// The prime as 64-bit little-endian limbs, and the window width of the fixed-base table
+const LIMBS: usize = DH_KEY_BYTES / 8;
+const WINDOW_BITS: usize = 4;
+const WINDOWS: usize = DH_KEY_BYTES * 8 / WINDOW_BITS;
+
+type Limbs = [u64; LIMBS];
+
+// Group parameters built once per process: the parsed prime, its Montgomery context and the
+// powers of the generator, table[i][j] = g^(j * 2^(WINDOW_BITS * i)) in Montgomery form.
+// A fixed-base exponentiation is then one multiplication per exponent window, no squarings.
+struct DhGroup {
+    p: BigUint,
+    p_limbs: Limbs,
+    n0_inv: u64,
+    r2: Limbs,
+    one: Limbs,
+    table: Vec<[Limbs; 1 << WINDOW_BITS]>,
+}
+
+static GROUP: OnceLock<DhGroup> = OnceLock::new();
+
+fn group() -> &'static DhGroup {
+    GROUP.get_or_init(DhGroup::new)
+}
+
+fn to_limbs(value: &BigUint) -> Limbs {
+    let mut limbs = [0u64; LIMBS];
+    for (limb, digit) in limbs.iter_mut().zip(value.to_u64_digits()) {
+        *limb = digit;
+    }
+    limbs
+}
+
+fn from_limbs(limbs: &Limbs) -> BigUint {
+    let bytes: Vec<u8> = limbs.iter().flat_map(|limb| limb.to_le_bytes()).collect();
+    BigUint::from_bytes_le(&bytes)
+}
+
+// a >= b on equal width limbs
+fn limbs_ge(a: &Limbs, b: &Limbs) -> bool {
+    for i in (0..LIMBS).rev() {
+        if a[i] != b[i] {
+            return a[i] > b[i];
+        }
+    }
+    true
+}
+
+fn limbs_sub(a: &mut Limbs, b: &Limbs) {
+    let mut borrow = 0u64;
+    for i in 0..LIMBS {
+        let (diff, under1) = a[i].overflowing_sub(b[i]);
+        let (diff, under2) = diff.overflowing_sub(borrow);
+        a[i] = diff;
+        borrow = (under1 || under2) as u64;
+    }
+}
+
+// Montgomery product a * b * R^-1 mod p (CIOS), both inputs below p
+fn mont_mul(a: &Limbs, b: &Limbs, p: &Limbs, n0_inv: u64) -> Limbs {
+    let mut t = [0u64; LIMBS + 2];
+    for i in 0..LIMBS {
+        let mut carry = 0u128;
+        for j in 0..LIMBS {
+            let sum = t[j] as u128 + (a[j] as u128) * (b[i] as u128) + carry;
+            t[j] = sum as u64;
+            carry = sum >> 64;
+        }
+        let sum = t[LIMBS] as u128 + carry;
+        t[LIMBS] = sum as u64;
+        t[LIMBS + 1] = (sum >> 64) as u64;
+
+        let m = t[0].wrapping_mul(n0_inv);
+        let mut carry = (t[0] as u128 + (m as u128) * (p[0] as u128)) >> 64;
+        for j in 1..LIMBS {
+            let sum = t[j] as u128 + (m as u128) * (p[j] as u128) + carry;
+            t[j - 1] = sum as u64;
+            carry = sum >> 64;
+        }
+        let sum = t[LIMBS] as u128 + carry;
+        t[LIMBS - 1] = sum as u64;
+        t[LIMBS] = t[LIMBS + 1] + (sum >> 64) as u64;
+    }
+
+    let mut out = [0u64; LIMBS];
+    out.copy_from_slice(&t[..LIMBS]);
+    if t[LIMBS] != 0 || limbs_ge(&out, p) {
+        limbs_sub(&mut out, p);
+    }
+    out
+}
+
+// Exponent bits WINDOW_BITS at a time, least significant window first
+fn exponent_windows(exponent: &[u8]) -> impl DoubleEndedIterator<Item = usize> + '_ {
+    exponent.iter().rev().flat_map(|byte| [(byte & 0x0f) as usize, (byte >> 4) as usize])
+}
+
+impl DhGroup {
+    fn new() -> Self {
+        let p = BigUint::parse_bytes(DH_PRIME.as_bytes(), 16).unwrap();
+        let p_limbs = to_limbs(&p);
+
+        // -p^-1 mod 2^64 by Newton iteration, each step doubles the correct low bits
+        let mut inv = 1u64;
+        for _ in 0..6 {
+            inv = inv.wrapping_mul(2u64.wrapping_sub(p_limbs[0].wrapping_mul(inv)));
+        }
+        let n0_inv = inv.wrapping_neg();
+
+        let r = BigUint::from(1u32) << (LIMBS * 64);
+        let one = to_limbs(&(&r % &p));
+        let r2 = to_limbs(&((&r * &r) % &p));
+
+        let mut group = DhGroup { p, p_limbs, n0_inv, r2, one, table: Vec::with_capacity(WINDOWS) };
+        let mut base = group.to_mont(&BigUint::from(DH_GENERATOR));
+        for _ in 0..WINDOWS {
+            let mut row = [group.one; 1 << WINDOW_BITS];
+            for j in 1..row.len() {
+                row[j] = group.mul(&row[j - 1], &base);
+            }
+            // Next window's base is this one raised to 2^WINDOW_BITS
+            base = group.mul(&row[row.len() - 1], &base);
+            group.table.push(row);
+        }
+        group
+    }
+
+    fn mul(&self, a: &Limbs, b: &Limbs) -> Limbs {
+        mont_mul(a, b, &self.p_limbs, self.n0_inv)
+    }
+
+    fn to_mont(&self, value: &BigUint) -> Limbs {
+        let reduced = if value < &self.p { to_limbs(value) } else { to_limbs(&(value % &self.p)) };
+        self.mul(&reduced, &self.r2)
+    }
+
+    fn from_mont(&self, value: &Limbs) -> BigUint {
+        let mut unit = [0u64; LIMBS];
+        unit[0] = 1;
+        from_limbs(&self.mul(value, &unit))
+    }
+
+    // g^exponent from the precomputed table, the exponent must fit in the group size
+    fn pow_generator(&self, exponent: &[u8]) -> BigUint {
+        let mut acc = self.one;
+        for (row, digit) in self.table.iter().zip(exponent_windows(exponent)) {
+            if digit != 0 {
+                acc = self.mul(&acc, &row[digit]);
+            }
+        }
+        self.from_mont(&acc)
+    }
 
-    let mut rng = thread_rng();
-    let private_key = rng.gen_biguint_range(&BigUint::from(2u32), &p);
-    let public_key = g.modpow(&private_key, &p);
+    // base^exponent for an arbitrary base, fixed 4-bit windows over the cached context
+    fn pow(&self, base: &BigUint, exponent: &[u8]) -> BigUint {
+        let mut powers = [self.one; 1 << WINDOW_BITS];
+        powers[1] = self.to_mont(base);
+        for j in 2..powers.len() {
+            powers[j] = self.mul(&powers[j - 1], &powers[1]);
+        }
 
-    Ok((private_key.to_bytes_be().to_vec(), public_key.to_bytes_be().to_vec()))
+        let mut acc = self.one;
+        for digit in exponent_windows(exponent).rev() {
+            for _ in 0..WINDOW_BITS {
+                acc = self.mul(&acc, &acc);
+            }
+            if digit != 0 {
+                acc = self.mul(&acc, &powers[digit]);
+            }
+        }
+        self.from_mont(&acc)
+    }
+
+    // Private exponent in [2, p) or, for short exponents, DH_SHORT_EXPONENT_BITS wide
+    fn random_exponent(&self, short_exponent: bool) -> BigUint {
+        let mut rng = thread_rng();
+        if short_exponent {
+            let mut exponent = rng.gen_biguint(DH_SHORT_EXPONENT_BITS);
+            exponent.set_bit(DH_SHORT_EXPONENT_BITS - 1, true);
+            exponent
+        } else {
+            rng.gen_biguint_range(&BigUint::from(2u32), &self.p)
+        }
+    }
+}
+
+// Big-endian value left padded with zeros to one DH_KEY_BYTES record
+fn push_padded(out: &mut Vec<u8>, value: &BigUint) {
+    let bytes = value.to_bytes_be();
+    out.resize(out.len() + DH_KEY_BYTES - bytes.len(), 0);
+    out.extend_from_slice(&bytes);
+}
+
+// Key pair computation shared by the bytes and list bindings
+fn dh_keypair(short_exponent: bool) -> (Vec<u8>, Vec<u8>) {
+    let group = group();
+    let private_key = group.random_exponent(short_exponent).to_bytes_be();
+    let public_key = group.pow_generator(&private_key);
+
+    (private_key, public_key.to_bytes_be())
+}
+
+fn dh_shared_key(private_key: &[u8], other_public_key: &[u8]) -> Vec<u8> {
+    let other_public_key = BigUint::from_bytes_be(other_public_key);
+
+    let shared_secret = group().pow(&other_public_key, private_key);
+    shared_secret.to_bytes_be()
+}
+
+// Diffie-Hellman key generation, the GIL is released during the modular exponentiation
+#[pyfunction]
+#[pyo3(signature = (short_exponent=false))]
+pub fn generate_dh_key(py: Python<'_>, short_exponent: bool) -> (Py<PyBytes>, Py<PyBytes>) {
+    let (private_key, public_key) = py.allow_threads(|| dh_keypair(short_exponent));
+    (to_py_bytes(py, &private_key), to_py_bytes(py, &public_key))
 }
 
 // Diffie-Hellman decypher
 #[pyfunction]
-pub fn derive_dh_shared_key(private_key: Vec<u8>, other_public_key: Vec<u8>) -> PyResult<Vec<u8>> {
-    let p = BigUint::parse_bytes(DH_PRIME.as_bytes(), 16).unwrap();
-    let private_key = BigUint::from_bytes_be(&private_key);
-    let other_public_key = BigUint::from_bytes_be(&other_public_key);
-
-    let shared_secret = other_public_key.modpow(&private_key, &p);
-    Ok(shared_secret.to_bytes_be().to_vec())
-}
\ No newline at end of file
+pub fn derive_dh_shared_key(py: Python<'_>, private_key: ByteArg, other_public_key: ByteArg) -> Py<PyBytes> {
+    let (private_key, other_public_key) = (private_key.as_slice(), other_public_key.as_slice());
+    let shared_secret = py.allow_threads(|| dh_shared_key(private_key, other_public_key));
+    to_py_bytes(py, &shared_secret)
+}
+
+// Key generation as it was before the cached group: parse the prime and run a generic modpow
+// on every call. Kept only as the baseline for bench_dh.py
+#[pyfunction]
+pub fn generate_dh_key_modpow(py: Python<'_>) -> (Py<PyBytes>, Py<PyBytes>) {
+    let (private_key, public_key) = py.allow_threads(|| {
+        let p = BigUint::parse_bytes(DH_PRIME.as_bytes(), 16).unwrap();
+        let g = BigUint::from(DH_GENERATOR);
+
+        let mut rng = thread_rng();
+        let private_key = rng.gen_biguint_range(&BigUint::from(2u32), &p);
+        let public_key = g.modpow(&private_key, &p);
+        (private_key.to_bytes_be(), public_key.to_bytes_be())
+    });
+    (to_py_bytes(py, &private_key), to_py_bytes(py, &public_key))
+}
+
+// list[int] forms of the above for callers written against shadow_crypt 0.1
+#[pyfunction]
+#[pyo3(name = "generate_dh_key")]
+pub fn generate_dh_key_list(py: Python<'_>) -> (Vec<u8>, Vec<u8>) {
+    py.allow_threads(|| dh_keypair(false))
+}
+
+#[pyfunction]
+#[pyo3(name = "derive_dh_shared_key")]
+pub fn derive_dh_shared_key_list(py: Python<'_>, private_key: ByteArg, other_public_key: ByteArg) -> Vec<u8> {
+    let (private_key, other_public_key) = (private_key.as_slice(), other_public_key.as_slice());
+    py.allow_threads(|| dh_shared_key(private_key, other_public_key))
+}
+
+// N Diffie-Hellman key pairs as two contiguous buffers (private keys, public keys) of DH_KEY_BYTES records
+#[pyfunction]
+#[pyo3(signature = (n, short_exponent=false))]
+pub fn dh_generate_many(py: Python<'_>, n: usize, short_exponent: bool) -> (Py<PyBytes>, Py<PyBytes>) {
+    let (private_keys, public_keys) = py.allow_threads(|| {
+        let group = group();
+
+        let mut private_keys = Vec::with_capacity(n * DH_KEY_BYTES);
+        let mut public_keys = Vec::with_capacity(n * DH_KEY_BYTES);
+        for _ in 0..n {
+            let private_key = group.random_exponent(short_exponent);
+            push_padded(&mut public_keys, &group.pow_generator(&private_key.to_bytes_be()));
+            push_padded(&mut private_keys, &private_key);
+        }
+        (private_keys, public_keys)
+    });
+    (to_py_bytes(py, &private_keys), to_py_bytes(py, &public_keys))
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn cached_group_matches_generic_modpow() {
+        let group = group();
+        let g = BigUint::from(DH_GENERATOR);
+        for short_exponent in [false, true] {
+            let exponent = group.random_exponent(short_exponent);
+            let bytes = exponent.to_bytes_be();
+            assert_eq!(group.pow_generator(&bytes), g.modpow(&exponent, &group.p));
+
+            let base = thread_rng().gen_biguint_below(&group.p);
+            assert_eq!(group.pow(&base, &bytes), base.modpow(&exponent, &group.p));
+        }
+    }
+}
@@ -1,22 +1,138 @@
 use pyo3::prelude::*;
+use pyo3::exceptions::PyValueError;
+use pyo3::types::PyBytes;
 use x25519_dalek::{StaticSecret, PublicKey};
 use rand::rngs::OsRng;
+use crate::buffers::{ByteArg, to_py_bytes};
 
-// Elliptic Curve Diffie-Hellman key generation
-#[pyfunction]
-pub fn generate_ecdh_key() -> PyResult<(Vec<u8>, Vec<u8>)> {
+// Record width of X25519 private keys, public keys and shared secrets
+pub const X25519_KEY_BYTES: usize = 32;
+
+// Key pair computation shared by the bytes and list bindings
+fn ecdh_keypair() -> (Vec<u8>, Vec<u8>) {
     let private_key = StaticSecret::random_from_rng(OsRng);
     let public_key = PublicKey::from(&private_key);
-    
-    Ok((private_key.to_bytes().to_vec(), public_key.as_bytes().to_vec()))
+
+    (private_key.to_bytes().to_vec(), public_key.as_bytes().to_vec())
+}
+
+// 32-byte key check done while the GIL is still held
+fn key_array(key: &[u8], name: &str) -> PyResult<[u8; X25519_KEY_BYTES]> {
+    key.try_into().map_err(|_| PyValueError::new_err(format!("Invalid {} length", name)))
+}
+
+fn ecdh_shared_key(private_key: [u8; X25519_KEY_BYTES], server_public_key: [u8; X25519_KEY_BYTES]) -> Vec<u8> {
+    let private_key = StaticSecret::from(private_key);
+    let server_public_key = PublicKey::from(server_public_key);
+
+    let shared_secret = private_key.diffie_hellman(&server_public_key);
+    shared_secret.as_bytes().to_vec()
+}
+
+// Elliptic Curve Diffie-Hellman key generation
+#[pyfunction]
+pub fn generate_ecdh_key(py: Python<'_>) -> (Py<PyBytes>, Py<PyBytes>) {
+    let (private_key, public_key) = py.allow_threads(ecdh_keypair);
+    (to_py_bytes(py, &private_key), to_py_bytes(py, &public_key))
 }
 
 // Elliptic Curve Diffie-Hellman key derivation
 #[pyfunction]
-pub fn derive_ecdh_shared_key(private_key_bytes: Vec<u8>, server_public_key_bytes: Vec<u8>) -> PyResult<Vec<u8>> {
-    let private_key = StaticSecret::from(<[u8; 32]>::try_from(private_key_bytes.as_slice()).unwrap());
-    let server_public_key = PublicKey::from(<[u8; 32]>::try_from(server_public_key_bytes.as_slice()).unwrap());
+pub fn derive_ecdh_shared_key(py: Python<'_>, private_key_bytes: ByteArg, server_public_key_bytes: ByteArg) -> PyResult<Py<PyBytes>> {
+    let private_key = key_array(private_key_bytes.as_slice(), "private key")?;
+    let server_public_key = key_array(server_public_key_bytes.as_slice(), "public key")?;
+    let shared_secret = py.allow_threads(|| ecdh_shared_key(private_key, server_public_key));
+    Ok(to_py_bytes(py, &shared_secret))
+}
 
-    let shared_secret = private_key.diffie_hellman(&server_public_key);
-    Ok(shared_secret.as_bytes().to_vec())
-}
\ No newline at end of file
+// list[int] forms of the above for callers written against shadow_crypt 0.1
+#[pyfunction]
+#[pyo3(name = "generate_ecdh_key")]
+pub fn generate_ecdh_key_list(py: Python<'_>) -> (Vec<u8>, Vec<u8>) {
+    py.allow_threads(ecdh_keypair)
+}
+
+#[pyfunction]
+#[pyo3(name = "derive_ecdh_shared_key")]
+pub fn derive_ecdh_shared_key_list(py: Python<'_>, private_key_bytes: ByteArg, server_public_key_bytes: ByteArg) -> PyResult<Vec<u8>> {
+    let private_key = key_array(private_key_bytes.as_slice(), "private key")?;
+    let server_public_key = key_array(server_public_key_bytes.as_slice(), "public key")?;
+    Ok(py.allow_threads(|| ecdh_shared_key(private_key, server_public_key)))
+}
+
+// N X25519 key pairs as two contiguous buffers (private keys, public keys) of 32-byte records
+#[pyfunction]
+pub fn x25519_generate_many(py: Python<'_>, n: usize) -> (Py<PyBytes>, Py<PyBytes>) {
+    let (private_keys, public_keys) = py.allow_threads(|| {
+        let mut private_keys = Vec::with_capacity(n * X25519_KEY_BYTES);
+        let mut public_keys = Vec::with_capacity(n * X25519_KEY_BYTES);
+        for _ in 0..n {
+            let private_key = StaticSecret::random_from_rng(OsRng);
+            public_keys.extend_from_slice(PublicKey::from(&private_key).as_bytes());
+            private_keys.extend_from_slice(&private_key.to_bytes());
+        }
+        (private_keys, public_keys)
+    });
+    (to_py_bytes(py, &private_keys), to_py_bytes(py, &public_keys))
+}
+
+// Shared secrets of one private key with every 32-byte public key of a contiguous buffer
+#[pyfunction]
+pub fn x25519_derive_many(py: Python<'_>, private_key: ByteArg, public_keys: ByteArg) -> PyResult<Py<PyBytes>> {
+    let private_key_array = key_array(private_key.as_slice(), "private key")?;
+    let public_keys = public_keys.as_slice();
+    if public_keys.len() % X25519_KEY_BYTES != 0 {return Err(PyValueError::new_err("Public keys buffer is not a multiple of 32 bytes"));}
+
+    let shared_secrets = py.allow_threads(|| {
+        let private_key = StaticSecret::from(private_key_array);
+        let mut shared_secrets = Vec::with_capacity(public_keys.len());
+        for record in public_keys.chunks_exact(X25519_KEY_BYTES) {
+            let public_key = PublicKey::from(<[u8; X25519_KEY_BYTES]>::try_from(record).unwrap());
+            shared_secrets.extend_from_slice(private_key.diffie_hellman(&public_key).as_bytes());
+        }
+        shared_secrets
+    });
+    Ok(to_py_bytes(py, &shared_secrets))
+}
+
+// X25519 key kept across calls, so derive skips rebuilding the StaticSecret from bytes
+#[pyclass(frozen, module = "shadow_crypt")]
+pub struct EcdhKey {
+    private_key: StaticSecret,
+    public_key: PublicKey,
+}
+
+#[pymethods]
+impl EcdhKey {
+    #[staticmethod]
+    fn generate() -> Self {
+        let private_key = StaticSecret::random_from_rng(OsRng);
+        let public_key = PublicKey::from(&private_key);
+        EcdhKey { private_key, public_key }
+    }
+
+    #[staticmethod]
+    fn from_bytes(private_key: ByteArg) -> PyResult<Self> {
+        let private_key = StaticSecret::from(key_array(private_key.as_slice(), "private key")?);
+        let public_key = PublicKey::from(&private_key);
+        Ok(EcdhKey { private_key, public_key })
+    }
+
+    fn derive(&self, py: Python<'_>, other_public_key: ByteArg) -> PyResult<Py<PyBytes>> {
+        let other_public_key = PublicKey::from(key_array(other_public_key.as_slice(), "public key")?);
+        let shared_secret = py.allow_threads(|| self.private_key.diffie_hellman(&other_public_key));
+        Ok(to_py_bytes(py, shared_secret.as_bytes()))
+    }
+
+    fn private_bytes(&self, py: Python<'_>) -> Py<PyBytes> {
+        to_py_bytes(py, &self.private_key.to_bytes())
+    }
+
+    fn public_bytes(&self, py: Python<'_>) -> Py<PyBytes> {
+        to_py_bytes(py, self.public_key.as_bytes())
+    }
+
+    fn __repr__(&self) -> String {
+        "EcdhKey(x25519)".to_string()
+    }
+}
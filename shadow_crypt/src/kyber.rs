@@ -1,17 +1,21 @@
 use pyo3::prelude::*;
+use pyo3::exceptions::PyValueError;
 use pyo3::types::PyBytes;
 use rand::rngs::OsRng;
 use kyberlib::*;
+use crate::buffers::ByteArg;
 
 fn kyber_err_to_pyerr(err: KyberLibError) -> PyErr {
     PyErr::new::<pyo3::exceptions::PyValueError, _>(err.to_string())
 }
 
-// Kyber key generator
+// Kyber key generator, the lattice work runs without the GIL and only the bytes objects need it
 #[pyfunction]
 pub fn kyber_keygen(py: Python) -> PyResult<(Py<PyBytes>, Py<PyBytes>)> {
-    let mut rng = OsRng;
-    let keys = keypair(&mut rng).map_err(kyber_err_to_pyerr)?;
+    let keys = py.allow_threads(|| {
+        let mut rng = OsRng;
+        keypair(&mut rng)
+    }).map_err(kyber_err_to_pyerr)?;
     let public_key = PyBytes::new_bound(py, &keys.public).into();
     let secret_key = PyBytes::new_bound(py, &keys.secret).into();
     Ok((public_key, secret_key))
@@ -19,9 +23,12 @@ pub fn kyber_keygen(py: Python) -> PyResult<(Py<PyBytes>, Py<PyBytes>)> {
 
 // Kyber keypair encapsulation
 #[pyfunction]
-pub fn kyber_encapsulate(py: Python, public_key: &[u8]) -> PyResult<(Py<PyBytes>, Py<PyBytes>)> {
-    let mut rng = OsRng;
-    let (ciphertext, shared_secret) = encapsulate(public_key, &mut rng).map_err(kyber_err_to_pyerr)?;
+pub fn kyber_encapsulate(py: Python, public_key: ByteArg) -> PyResult<(Py<PyBytes>, Py<PyBytes>)> {
+    let public_key = public_key.as_slice();
+    let (ciphertext, shared_secret) = py.allow_threads(|| {
+        let mut rng = OsRng;
+        encapsulate(public_key, &mut rng)
+    }).map_err(kyber_err_to_pyerr)?;
     let ciphertext_bytes = PyBytes::new_bound(py, &ciphertext).into();
     let shared_secret_bytes = PyBytes::new_bound(py, &shared_secret).into();
     Ok((ciphertext_bytes, shared_secret_bytes))
@@ -29,7 +36,106 @@ pub fn kyber_encapsulate(py: Python, public_key: &[u8]) -> PyResult<(Py<PyBytes>
 
 // Kyber keypair decapsulation
 #[pyfunction]
-pub fn kyber_decapsulate(py: Python, ciphertext: &[u8], secret_key: &[u8]) -> PyResult<Py<PyBytes>> {
-    let shared_secret = decapsulate(ciphertext, secret_key).map_err(kyber_err_to_pyerr)?;
+pub fn kyber_decapsulate(py: Python, ciphertext: ByteArg, secret_key: ByteArg) -> PyResult<Py<PyBytes>> {
+    let (ciphertext, secret_key) = (ciphertext.as_slice(), secret_key.as_slice());
+    let shared_secret = py.allow_threads(|| decapsulate(ciphertext, secret_key)).map_err(kyber_err_to_pyerr)?;
     Ok(PyBytes::new_bound(py, &shared_secret).into())
-}
\ No newline at end of file
+}
+
+
+// N Kyber key pairs as two contiguous buffers (public keys, secret keys) of fixed-size records
+#[pyfunction]
+pub fn kyber_keygen_batch(py: Python, n: usize) -> PyResult<(Py<PyBytes>, Py<PyBytes>)> {
+    let (public_keys, secret_keys) = py.allow_threads(|| -> Result<(Vec<u8>, Vec<u8>), KyberLibError> {
+        let mut rng = OsRng;
+        let mut public_keys = Vec::with_capacity(n * KYBER_PUBLIC_KEY_BYTES);
+        let mut secret_keys = Vec::with_capacity(n * KYBER_SECRET_KEY_BYTES);
+        for _ in 0..n {
+            let keys = keypair(&mut rng)?;
+            public_keys.extend_from_slice(&keys.public);
+            secret_keys.extend_from_slice(&keys.secret);
+        }
+        Ok((public_keys, secret_keys))
+    }).map_err(kyber_err_to_pyerr)?;
+    Ok((PyBytes::new_bound(py, &public_keys).into(), PyBytes::new_bound(py, &secret_keys).into()))
+}
+
+// Encapsulation against every public key of a contiguous buffer, returns (ciphertexts, shared secrets)
+#[pyfunction]
+pub fn kyber_encapsulate_many(py: Python, public_keys: ByteArg) -> PyResult<(Py<PyBytes>, Py<PyBytes>)> {
+    let public_keys = public_keys.as_slice();
+    if public_keys.len() % KYBER_PUBLIC_KEY_BYTES != 0 {return Err(PyValueError::new_err("Public keys buffer is not a multiple of the public key size"));}
+
+    let (ciphertexts, shared_secrets) = py.allow_threads(|| -> Result<(Vec<u8>, Vec<u8>), KyberLibError> {
+        let mut rng = OsRng;
+        let count = public_keys.len() / KYBER_PUBLIC_KEY_BYTES;
+        let mut ciphertexts = Vec::with_capacity(count * KYBER_CIPHERTEXT_BYTES);
+        let mut shared_secrets = Vec::with_capacity(count * KYBER_SHARED_SECRET_BYTES);
+        for record in public_keys.chunks_exact(KYBER_PUBLIC_KEY_BYTES) {
+            let (ciphertext, shared_secret) = encapsulate(record, &mut rng)?;
+            ciphertexts.extend_from_slice(&ciphertext);
+            shared_secrets.extend_from_slice(&shared_secret);
+        }
+        Ok((ciphertexts, shared_secrets))
+    }).map_err(kyber_err_to_pyerr)?;
+    Ok((PyBytes::new_bound(py, &ciphertexts).into(), PyBytes::new_bound(py, &shared_secrets).into()))
+}
+
+// Kyber key pair kept across calls as fixed-size arrays. A handle built from a public key only
+// can encapsulate, one with the secret key can also decapsulate.
+#[pyclass(frozen, module = "shadow_crypt")]
+pub struct KyberKey {
+    public_key: [u8; KYBER_PUBLIC_KEY_BYTES],
+    secret_key: Option<[u8; KYBER_SECRET_KEY_BYTES]>,
+}
+
+#[pymethods]
+impl KyberKey {
+    #[staticmethod]
+    fn generate(py: Python<'_>) -> PyResult<Self> {
+        let keys = py.allow_threads(|| keypair(&mut OsRng)).map_err(kyber_err_to_pyerr)?;
+        Ok(KyberKey { public_key: keys.public, secret_key: Some(keys.secret) })
+    }
+
+    #[staticmethod]
+    #[pyo3(signature = (public_key, secret_key=None))]
+    fn from_bytes(public_key: ByteArg, secret_key: Option<ByteArg>) -> PyResult<Self> {
+        let public_key = public_key.as_slice().try_into().map_err(|_| PyValueError::new_err("Invalid public key length"))?;
+        let secret_key = match secret_key {
+            Some(secret_key) => Some(secret_key.as_slice().try_into().map_err(|_| PyValueError::new_err("Invalid secret key length"))?),
+            None => None,
+        };
+        Ok(KyberKey { public_key, secret_key })
+    }
+
+    #[getter]
+    fn has_private(&self) -> bool {
+        self.secret_key.is_some()
+    }
+
+    // Returns (ciphertext, shared secret) against this public key
+    fn encapsulate(&self, py: Python<'_>) -> PyResult<(Py<PyBytes>, Py<PyBytes>)> {
+        let (ciphertext, shared_secret) = py.allow_threads(|| encapsulate(&self.public_key, &mut OsRng)).map_err(kyber_err_to_pyerr)?;
+        Ok((PyBytes::new_bound(py, &ciphertext).into(), PyBytes::new_bound(py, &shared_secret).into()))
+    }
+
+    fn decapsulate(&self, py: Python<'_>, ciphertext: ByteArg) -> PyResult<Py<PyBytes>> {
+        let secret_key = self.secret_key.as_ref().ok_or_else(|| PyValueError::new_err("This Kyber key has no secret part"))?;
+        let ciphertext = ciphertext.as_slice();
+        let shared_secret = py.allow_threads(|| decapsulate(ciphertext, secret_key)).map_err(kyber_err_to_pyerr)?;
+        Ok(PyBytes::new_bound(py, &shared_secret).into())
+    }
+
+    fn public_bytes(&self, py: Python<'_>) -> Py<PyBytes> {
+        PyBytes::new_bound(py, &self.public_key).into()
+    }
+
+    fn secret_bytes(&self, py: Python<'_>) -> PyResult<Py<PyBytes>> {
+        let secret_key = self.secret_key.as_ref().ok_or_else(|| PyValueError::new_err("This Kyber key has no secret part"))?;
+        Ok(PyBytes::new_bound(py, secret_key).into())
+    }
+
+    fn __repr__(&self) -> String {
+        format!("KyberKey({})", if self.secret_key.is_some() { "private" } else { "public" })
+    }
+}
@@ -1,17 +1,24 @@
 use pyo3::prelude::*;
+use pyo3::types::PyDict;
 use pyo3::wrap_pyfunction;
 
+mod aead;
+mod buffers;
 mod dh;
 mod ecdh;
 mod rsa;
 mod kyber;
 mod ntru;
 
-use dh::{generate_dh_key, derive_dh_shared_key};
-use ecdh::{generate_ecdh_key, derive_ecdh_shared_key};
-use rsa::{generate_rsa_key, rsa_encrypt, rsa_decrypt};
-use kyber::{kyber_keygen, kyber_encapsulate, kyber_decapsulate};
-use ntru::{ntru_generate_keypair, ntru_encapsulate, ntru_decapsulate};
+use aead::{aead_encrypt, aead_decrypt};
+use dh::{generate_dh_key, derive_dh_shared_key, dh_generate_many, generate_dh_key_modpow, generate_dh_key_list, derive_dh_shared_key_list};
+use ecdh::{EcdhKey, generate_ecdh_key, derive_ecdh_shared_key, x25519_generate_many, x25519_derive_many, generate_ecdh_key_list, derive_ecdh_shared_key_list};
+use rsa::{RsaKey, generate_rsa_key, rsa_encrypt, rsa_decrypt, rsa_encrypt_list};
+use kyber::{KyberKey, kyber_keygen, kyber_encapsulate, kyber_decapsulate, kyber_keygen_batch, kyber_encapsulate_many};
+use ntru::{NtruKey, ntru_generate_keypair, ntru_encapsulate, ntru_decapsulate, ntru_encapsulate_many, ntru_generate_keypair_list, ntru_encapsulate_list, ntru_decapsulate_list};
+
+// CRATE_VERSIONS, written by build.rs from Cargo.lock
+include!(concat!(env!("OUT_DIR"), "/crate_versions.rs"));
 
 // Function exposition to Python code from all Rust files
 #[pymodule]
@@ -29,5 +36,63 @@ fn shadow_crypt(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(ntru_generate_keypair, m)?)?;
     m.add_function(wrap_pyfunction!(ntru_encapsulate, m)?)?;
     m.add_function(wrap_pyfunction!(ntru_decapsulate, m)?)?;
+
+    // Symmetric encryption under a key agreed through one of the exchanges
+    m.add_function(wrap_pyfunction!(aead_encrypt, m)?)?;
+    m.add_function(wrap_pyfunction!(aead_decrypt, m)?)?;
+
+    // Batch functions returning contiguous buffers of fixed-size records
+    m.add_function(wrap_pyfunction!(dh_generate_many, m)?)?;
+    m.add_function(wrap_pyfunction!(x25519_generate_many, m)?)?;
+    m.add_function(wrap_pyfunction!(x25519_derive_many, m)?)?;
+    m.add_function(wrap_pyfunction!(kyber_keygen_batch, m)?)?;
+    m.add_function(wrap_pyfunction!(kyber_encapsulate_many, m)?)?;
+    m.add_function(wrap_pyfunction!(ntru_encapsulate_many, m)?)?;
+
+    // Uncached Diffie-Hellman keygen, the baseline bench_dh.py measures the cached group against
+    m.add_function(wrap_pyfunction!(generate_dh_key_modpow, m)?)?;
+
+    // Key handles that keep the parsed key between calls
+    m.add_class::<RsaKey>()?;
+    m.add_class::<EcdhKey>()?;
+    m.add_class::<KyberKey>()?;
+    m.add_class::<NtruKey>()?;
+
+    // Record sizes so callers can slice the batch buffers or view them as arrays
+    m.add("DH_KEY_BYTES", dh::DH_KEY_BYTES)?;
+    m.add("DH_SHORT_EXPONENT_BITS", dh::DH_SHORT_EXPONENT_BITS)?;
+    m.add("X25519_KEY_BYTES", ecdh::X25519_KEY_BYTES)?;
+    m.add("KYBER_PUBLIC_KEY_BYTES", kyberlib::KYBER_PUBLIC_KEY_BYTES)?;
+    m.add("KYBER_SECRET_KEY_BYTES", kyberlib::KYBER_SECRET_KEY_BYTES)?;
+    m.add("KYBER_CIPHERTEXT_BYTES", kyberlib::KYBER_CIPHERTEXT_BYTES)?;
+    m.add("KYBER_SHARED_SECRET_BYTES", kyberlib::KYBER_SHARED_SECRET_BYTES)?;
+    m.add("NTRU_PUBLIC_KEY_BYTES", ntrust_native::CRYPTO_PUBLICKEYBYTES)?;
+    m.add("NTRU_SECRET_KEY_BYTES", ntrust_native::CRYPTO_SECRETKEYBYTES)?;
+    m.add("NTRU_CIPHERTEXT_BYTES", ntrust_native::CRYPTO_CIPHERTEXTBYTES)?;
+    m.add("NTRU_SHARED_SECRET_BYTES", ntrust_native::CRYPTO_BYTES)?;
+    m.add("AEAD_KEY_BYTES", aead::AEAD_KEY_BYTES)?;
+    m.add("AEAD_NONCE_BYTES", aead::AEAD_NONCE_BYTES)?;
+    m.add("AEAD_TAG_BYTES", aead::AEAD_TAG_BYTES)?;
+
+    // Locked versions of the crates built in, so benchmark results can say what they measured
+    let crate_versions = PyDict::new_bound(m.py());
+    for (name, version) in CRATE_VERSIONS {
+        crate_versions.set_item(name, version)?;
+    }
+    m.add("CRATE_VERSIONS", crate_versions)?;
+
+    // Compatibility shim: shadow_crypt.compat keeps the 0.1 functions that return list[int]
+    let compat = PyModule::new_bound(m.py(), "compat")?;
+    compat.add_function(wrap_pyfunction!(generate_dh_key_list, &compat)?)?;
+    compat.add_function(wrap_pyfunction!(derive_dh_shared_key_list, &compat)?)?;
+    compat.add_function(wrap_pyfunction!(generate_ecdh_key_list, &compat)?)?;
+    compat.add_function(wrap_pyfunction!(derive_ecdh_shared_key_list, &compat)?)?;
+    compat.add_function(wrap_pyfunction!(rsa_encrypt_list, &compat)?)?;
+    compat.add_function(wrap_pyfunction!(ntru_generate_keypair_list, &compat)?)?;
+    compat.add_function(wrap_pyfunction!(ntru_encapsulate_list, &compat)?)?;
+    compat.add_function(wrap_pyfunction!(ntru_decapsulate_list, &compat)?)?;
+    m.add_submodule(&compat)?;
+    // add_submodule only sets the attribute, the import system finds submodules in sys.modules
+    m.py().import_bound("sys")?.getattr("modules")?.set_item("shadow_crypt.compat", &compat)?;
     Ok(())
 }
\ No newline at end of file
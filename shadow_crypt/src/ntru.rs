@@ -1,5 +1,6 @@
 use pyo3::prelude::*;
 use pyo3::exceptions::PyValueError;
+use pyo3::types::PyBytes;
 use ntrust_native::{
     AesState,
     RNGState,
@@ -12,6 +13,7 @@ use ntrust_native::{
     CRYPTO_BYTES,
 };
 use rand::RngCore;
+use crate::buffers::{ByteArg, to_py_bytes};
 
 // AesState initialize
 fn seeded_rng() -> Result<AesState, String> {
@@ -23,43 +25,182 @@ fn seeded_rng() -> Result<AesState, String> {
     Ok(rng_instance)
 }
 
-// NTRU key generation
-#[pyfunction]
-pub fn ntru_generate_keypair() -> PyResult<(Vec<u8>, Vec<u8>)> {
-    let mut rng = seeded_rng().map_err(|e_str| PyValueError::new_err(format!("RNG initialization failed: {}", e_str)))?;
+// Key pair computation shared by the bytes and list bindings, errors are built as
+// strings so the work can run without the GIL
+fn ntru_keypair() -> Result<(Vec<u8>, Vec<u8>), String> {
+    let mut rng = seeded_rng().map_err(|e_str| format!("RNG initialization failed: {}", e_str))?;
     let mut pk = [0u8; CRYPTO_PUBLICKEYBYTES];
     let mut sk = [0u8; CRYPTO_SECRETKEYBYTES];
 
-    crypto_kem_keypair(&mut pk, &mut sk, &mut rng).map_err(|e| PyValueError::new_err(format!("Failed to generate key pair: {:?}", e)))?;
+    crypto_kem_keypair(&mut pk, &mut sk, &mut rng).map_err(|e| format!("Failed to generate key pair: {:?}", e))?;
 
     Ok((pk.to_vec(), sk.to_vec()))
 }
 
-// NTRU key encryption
-#[pyfunction]
-pub fn ntru_encapsulate(public_key: &[u8]) -> PyResult<(Vec<u8>, Vec<u8>)> {
-
-    if public_key.len() != CRYPTO_PUBLICKEYBYTES {return Err(PyValueError::new_err("Invalid public key length"));}
+fn ntru_encapsulation(public_key: &[u8]) -> Result<(Vec<u8>, Vec<u8>), String> {
+    if public_key.len() != CRYPTO_PUBLICKEYBYTES {return Err("Invalid public key length".to_string());}
 
-    let mut rng = seeded_rng().map_err(|e_str| PyValueError::new_err(format!("RNG initialization failed: {}", e_str)))?;
+    let mut rng = seeded_rng().map_err(|e_str| format!("RNG initialization failed: {}", e_str))?;
     let mut ct = [0u8; CRYPTO_CIPHERTEXTBYTES];
     let mut ss = [0u8; CRYPTO_BYTES];
-    let pk_array: [u8; CRYPTO_PUBLICKEYBYTES] = public_key.try_into().map_err(|_| PyValueError::new_err("Failed to convert public key"))?;
-    crypto_kem_enc(&mut ct, &mut ss, &pk_array, &mut rng).map_err(|e| PyValueError::new_err(format!("Encryption failed: {:?}", e)))?;
+    let pk_array: [u8; CRYPTO_PUBLICKEYBYTES] = public_key.try_into().map_err(|_| "Failed to convert public key".to_string())?;
+    crypto_kem_enc(&mut ct, &mut ss, &pk_array, &mut rng).map_err(|e| format!("Encryption failed: {:?}", e))?;
 
     Ok((ct.to_vec(), ss.to_vec()))
 }
 
-// NTRU key decryption
-#[pyfunction]
-pub fn ntru_decapsulate(private_key: &[u8], ciphertext: &[u8]) -> PyResult<Vec<u8>> {
-    if private_key.len() != CRYPTO_SECRETKEYBYTES {return Err(PyValueError::new_err("Invalid private key length"));}
-    if ciphertext.len() != CRYPTO_CIPHERTEXTBYTES {return Err(PyValueError::new_err("Invalid ciphertext length"));}
+fn ntru_decapsulation(private_key: &[u8], ciphertext: &[u8]) -> Result<Vec<u8>, String> {
+    if private_key.len() != CRYPTO_SECRETKEYBYTES {return Err("Invalid private key length".to_string());}
+    if ciphertext.len() != CRYPTO_CIPHERTEXTBYTES {return Err("Invalid ciphertext length".to_string());}
 
     let mut ss = [0u8; CRYPTO_BYTES];
-    let sk_array: [u8; CRYPTO_SECRETKEYBYTES] = private_key.try_into().map_err(|_| PyValueError::new_err("Failed to convert private key"))?;
-    let ct_array: [u8; CRYPTO_CIPHERTEXTBYTES] = ciphertext.try_into().map_err(|_| PyValueError::new_err("Failed to convert ciphertext"))?;
-    crypto_kem_dec(&mut ss, &ct_array, &sk_array).map_err(|e| PyValueError::new_err(format!("Decryption failed: {:?}", e)))?;
+    let sk_array: [u8; CRYPTO_SECRETKEYBYTES] = private_key.try_into().map_err(|_| "Failed to convert private key".to_string())?;
+    let ct_array: [u8; CRYPTO_CIPHERTEXTBYTES] = ciphertext.try_into().map_err(|_| "Failed to convert ciphertext".to_string())?;
+    crypto_kem_dec(&mut ss, &ct_array, &sk_array).map_err(|e| format!("Decryption failed: {:?}", e))?;
 
     Ok(ss.to_vec())
-}
\ No newline at end of file
+}
+
+// NTRU key generation
+#[pyfunction]
+pub fn ntru_generate_keypair(py: Python<'_>) -> PyResult<(Py<PyBytes>, Py<PyBytes>)> {
+    let (pk, sk) = py.allow_threads(ntru_keypair).map_err(PyValueError::new_err)?;
+    Ok((to_py_bytes(py, &pk), to_py_bytes(py, &sk)))
+}
+
+// NTRU key encryption
+#[pyfunction]
+pub fn ntru_encapsulate(py: Python<'_>, public_key: ByteArg) -> PyResult<(Py<PyBytes>, Py<PyBytes>)> {
+    let public_key = public_key.as_slice();
+    let (ct, ss) = py.allow_threads(|| ntru_encapsulation(public_key)).map_err(PyValueError::new_err)?;
+    Ok((to_py_bytes(py, &ct), to_py_bytes(py, &ss)))
+}
+
+// NTRU key decryption
+#[pyfunction]
+pub fn ntru_decapsulate(py: Python<'_>, private_key: ByteArg, ciphertext: ByteArg) -> PyResult<Py<PyBytes>> {
+    let (private_key, ciphertext) = (private_key.as_slice(), ciphertext.as_slice());
+    let ss = py.allow_threads(|| ntru_decapsulation(private_key, ciphertext)).map_err(PyValueError::new_err)?;
+    Ok(to_py_bytes(py, &ss))
+}
+
+// list[int] forms of the above for callers written against shadow_crypt 0.1
+#[pyfunction]
+#[pyo3(name = "ntru_generate_keypair")]
+pub fn ntru_generate_keypair_list(py: Python<'_>) -> PyResult<(Vec<u8>, Vec<u8>)> {
+    py.allow_threads(ntru_keypair).map_err(PyValueError::new_err)
+}
+
+#[pyfunction]
+#[pyo3(name = "ntru_encapsulate")]
+pub fn ntru_encapsulate_list(py: Python<'_>, public_key: ByteArg) -> PyResult<(Vec<u8>, Vec<u8>)> {
+    let public_key = public_key.as_slice();
+    py.allow_threads(|| ntru_encapsulation(public_key)).map_err(PyValueError::new_err)
+}
+
+#[pyfunction]
+#[pyo3(name = "ntru_decapsulate")]
+pub fn ntru_decapsulate_list(py: Python<'_>, private_key: ByteArg, ciphertext: ByteArg) -> PyResult<Vec<u8>> {
+    let (private_key, ciphertext) = (private_key.as_slice(), ciphertext.as_slice());
+    py.allow_threads(|| ntru_decapsulation(private_key, ciphertext)).map_err(PyValueError::new_err)
+}
+
+// Encapsulation against every public key of a contiguous buffer, returns (ciphertexts, shared secrets)
+#[pyfunction]
+pub fn ntru_encapsulate_many(py: Python<'_>, public_keys: ByteArg) -> PyResult<(Py<PyBytes>, Py<PyBytes>)> {
+    let public_keys = public_keys.as_slice();
+    if public_keys.len() % CRYPTO_PUBLICKEYBYTES != 0 {return Err(PyValueError::new_err("Public keys buffer is not a multiple of the public key size"));}
+
+    let (ciphertexts, shared_secrets) = py.allow_threads(|| -> Result<(Vec<u8>, Vec<u8>), String> {
+        // One seeded generator serves the whole batch
+        let mut rng = seeded_rng().map_err(|e_str| format!("RNG initialization failed: {}", e_str))?;
+        let count = public_keys.len() / CRYPTO_PUBLICKEYBYTES;
+        let mut ciphertexts = Vec::with_capacity(count * CRYPTO_CIPHERTEXTBYTES);
+        let mut shared_secrets = Vec::with_capacity(count * CRYPTO_BYTES);
+        for record in public_keys.chunks_exact(CRYPTO_PUBLICKEYBYTES) {
+            let mut ct = [0u8; CRYPTO_CIPHERTEXTBYTES];
+            let mut ss = [0u8; CRYPTO_BYTES];
+            let pk_array: [u8; CRYPTO_PUBLICKEYBYTES] = record.try_into().map_err(|_| "Failed to convert public key".to_string())?;
+            crypto_kem_enc(&mut ct, &mut ss, &pk_array, &mut rng).map_err(|e| format!("Encryption failed: {:?}", e))?;
+            ciphertexts.extend_from_slice(&ct);
+            shared_secrets.extend_from_slice(&ss);
+        }
+        Ok((ciphertexts, shared_secrets))
+    }).map_err(PyValueError::new_err)?;
+    Ok((to_py_bytes(py, &ciphertexts), to_py_bytes(py, &shared_secrets)))
+}
+
+// NTRU key pair kept across calls as fixed-size arrays, so encapsulate/decapsulate skip the
+// length checks and slice conversions. A public-only handle can only encapsulate.
+#[pyclass(frozen, module = "shadow_crypt")]
+pub struct NtruKey {
+    public_key: [u8; CRYPTO_PUBLICKEYBYTES],
+    secret_key: Option<[u8; CRYPTO_SECRETKEYBYTES]>,
+}
+
+#[pymethods]
+impl NtruKey {
+    #[staticmethod]
+    fn generate(py: Python<'_>) -> PyResult<Self> {
+        let (public_key, secret_key) = py.allow_threads(|| -> Result<_, String> {
+            let mut rng = seeded_rng().map_err(|e_str| format!("RNG initialization failed: {}", e_str))?;
+            let mut pk = [0u8; CRYPTO_PUBLICKEYBYTES];
+            let mut sk = [0u8; CRYPTO_SECRETKEYBYTES];
+            crypto_kem_keypair(&mut pk, &mut sk, &mut rng).map_err(|e| format!("Failed to generate key pair: {:?}", e))?;
+            Ok((pk, sk))
+        }).map_err(PyValueError::new_err)?;
+        Ok(NtruKey { public_key, secret_key: Some(secret_key) })
+    }
+
+    #[staticmethod]
+    #[pyo3(signature = (public_key, secret_key=None))]
+    fn from_bytes(public_key: ByteArg, secret_key: Option<ByteArg>) -> PyResult<Self> {
+        let public_key = public_key.as_slice().try_into().map_err(|_| PyValueError::new_err("Invalid public key length"))?;
+        let secret_key = match secret_key {
+            Some(secret_key) => Some(secret_key.as_slice().try_into().map_err(|_| PyValueError::new_err("Invalid private key length"))?),
+            None => None,
+        };
+        Ok(NtruKey { public_key, secret_key })
+    }
+
+    #[getter]
+    fn has_private(&self) -> bool {
+        self.secret_key.is_some()
+    }
+
+    // Returns (ciphertext, shared secret) against this public key
+    fn encapsulate(&self, py: Python<'_>) -> PyResult<(Py<PyBytes>, Py<PyBytes>)> {
+        let (ct, ss) = py.allow_threads(|| -> Result<_, String> {
+            let mut rng = seeded_rng().map_err(|e_str| format!("RNG initialization failed: {}", e_str))?;
+            let mut ct = [0u8; CRYPTO_CIPHERTEXTBYTES];
+            let mut ss = [0u8; CRYPTO_BYTES];
+            crypto_kem_enc(&mut ct, &mut ss, &self.public_key, &mut rng).map_err(|e| format!("Encryption failed: {:?}", e))?;
+            Ok((ct, ss))
+        }).map_err(PyValueError::new_err)?;
+        Ok((to_py_bytes(py, &ct), to_py_bytes(py, &ss)))
+    }
+
+    fn decapsulate(&self, py: Python<'_>, ciphertext: ByteArg) -> PyResult<Py<PyBytes>> {
+        let secret_key = self.secret_key.as_ref().ok_or_else(|| PyValueError::new_err("This NTRU key has no private part"))?;
+        let ct_array: [u8; CRYPTO_CIPHERTEXTBYTES] = ciphertext.as_slice().try_into().map_err(|_| PyValueError::new_err("Invalid ciphertext length"))?;
+        let ss = py.allow_threads(|| -> Result<_, String> {
+            let mut ss = [0u8; CRYPTO_BYTES];
+            crypto_kem_dec(&mut ss, &ct_array, secret_key).map_err(|e| format!("Decryption failed: {:?}", e))?;
+            Ok(ss)
+        }).map_err(PyValueError::new_err)?;
+        Ok(to_py_bytes(py, &ss))
+    }
+
+    fn public_bytes(&self, py: Python<'_>) -> Py<PyBytes> {
+        to_py_bytes(py, &self.public_key)
+    }
+
+    fn private_bytes(&self, py: Python<'_>) -> PyResult<Py<PyBytes>> {
+        let secret_key = self.secret_key.as_ref().ok_or_else(|| PyValueError::new_err("This NTRU key has no private part"))?;
+        Ok(to_py_bytes(py, secret_key))
+    }
+
+    fn __repr__(&self) -> String {
+        format!("NtruKey({})", if self.secret_key.is_some() { "private" } else { "public" })
+    }
+}
@@ -1,36 +1,163 @@
 use pyo3::prelude::*;
+use pyo3::exceptions::PyValueError;
+use pyo3::types::PyBytes;
 use rsa::{RsaPrivateKey, RsaPublicKey, Pkcs1v15Encrypt};
+use rsa::traits::PublicKeyParts;
 use rsa::pkcs1::{DecodeRsaPrivateKey, DecodeRsaPublicKey, EncodeRsaPrivateKey, EncodeRsaPublicKey};
 use rsa::pkcs8::LineEnding;
 use rand::rngs::OsRng;
+use crate::buffers::{ByteArg, to_py_bytes};
 
-// RSA key generation
+// RSA key generation, prime search runs without the GIL so other threads keep going
 #[pyfunction]
-pub fn generate_rsa_key() -> (String, String) {
-    let mut rng = OsRng;
-    let bits = 2048;
+pub fn generate_rsa_key(py: Python<'_>) -> (String, String) {
+    py.allow_threads(|| {
+        let mut rng = OsRng;
+        let bits = 2048;
 
-    let private_key = RsaPrivateKey::new(&mut rng, bits).unwrap();
-    let public_key = RsaPublicKey::from(&private_key);
+        let private_key = RsaPrivateKey::new(&mut rng, bits).unwrap();
+        let public_key = RsaPublicKey::from(&private_key);
 
-    let private_pem = private_key.to_pkcs1_pem(LineEnding::LF).unwrap();
-    let public_pem = public_key.to_pkcs1_pem(LineEnding::LF).unwrap();
+        let private_pem = private_key.to_pkcs1_pem(LineEnding::LF).unwrap();
+        let public_pem = public_key.to_pkcs1_pem(LineEnding::LF).unwrap();
 
-    (private_pem.to_string(), public_pem)
+        (private_pem.to_string(), public_pem)
+    })
 }
 
-// RSA encryption
-#[pyfunction]
-pub fn rsa_encrypt(public_key_pem: &str, message: &str) -> Vec<u8> {
+fn encrypt_message(public_key_pem: &str, message: &str) -> Vec<u8> {
     let public_key = RsaPublicKey::from_pkcs1_pem(public_key_pem).unwrap();
     let mut rng = OsRng;
     public_key.encrypt(&mut rng, Pkcs1v15Encrypt, message.as_bytes()).unwrap()
 }
 
+// RSA encryption
+#[pyfunction]
+pub fn rsa_encrypt(py: Python<'_>, public_key_pem: &str, message: &str) -> Py<PyBytes> {
+    let encrypted_data = py.allow_threads(|| encrypt_message(public_key_pem, message));
+    to_py_bytes(py, &encrypted_data)
+}
+
+// list[int] form for callers written against shadow_crypt 0.1
+#[pyfunction]
+#[pyo3(name = "rsa_encrypt")]
+pub fn rsa_encrypt_list(py: Python<'_>, public_key_pem: &str, message: &str) -> Vec<u8> {
+    py.allow_threads(|| encrypt_message(public_key_pem, message))
+}
+
 // RSA decryption
 #[pyfunction]
-pub fn rsa_decrypt(private_key_pem: &str, encrypted_data: Vec<u8>) -> String {
-    let private_key = RsaPrivateKey::from_pkcs1_pem(private_key_pem).unwrap();
-    let decrypted_data = private_key.decrypt(Pkcs1v15Encrypt, &encrypted_data).unwrap();
-    String::from_utf8(decrypted_data).unwrap()
-}
\ No newline at end of file
+pub fn rsa_decrypt(py: Python<'_>, private_key_pem: &str, encrypted_data: ByteArg) -> String {
+    let encrypted_data = encrypted_data.as_slice();
+    py.allow_threads(|| {
+        let private_key = RsaPrivateKey::from_pkcs1_pem(private_key_pem).unwrap();
+        let decrypted_data = private_key.decrypt(Pkcs1v15Encrypt, encrypted_data).unwrap();
+        String::from_utf8(decrypted_data).unwrap()
+    })
+}
+
+fn rsa_err_to_pyerr(err: impl std::fmt::Display) -> PyErr {
+    PyValueError::new_err(err.to_string())
+}
+
+// Parsed RSA key kept across calls, so encrypt/decrypt skip the PEM parse and the private key
+// keeps its CRT precomputation. A handle built from a public key can only encrypt.
+#[pyclass(frozen, module = "shadow_crypt")]
+pub struct RsaKey {
+    private_key: Option<RsaPrivateKey>,
+    public_key: RsaPublicKey,
+}
+
+impl RsaKey {
+    fn from_private(mut private_key: RsaPrivateKey) -> PyResult<Self> {
+        private_key.precompute().map_err(rsa_err_to_pyerr)?;
+        let public_key = RsaPublicKey::from(&private_key);
+        Ok(RsaKey { private_key: Some(private_key), public_key })
+    }
+
+    fn private(&self) -> PyResult<&RsaPrivateKey> {
+        self.private_key.as_ref().ok_or_else(|| PyValueError::new_err("This RSA key has no private part"))
+    }
+}
+
+#[pymethods]
+impl RsaKey {
+    // Fresh key pair, prime search runs without the GIL
+    #[staticmethod]
+    #[pyo3(signature = (bits=2048))]
+    fn generate(py: Python<'_>, bits: usize) -> PyResult<Self> {
+        let private_key = py.allow_threads(|| RsaPrivateKey::new(&mut OsRng, bits)).map_err(rsa_err_to_pyerr)?;
+        Self::from_private(private_key)
+    }
+
+    // PKCS#1 PEM of either a private or a public key
+    #[staticmethod]
+    fn from_pem(pem: &str) -> PyResult<Self> {
+        match RsaPrivateKey::from_pkcs1_pem(pem) {
+            Ok(private_key) => Self::from_private(private_key),
+            Err(_) => {
+                let public_key = RsaPublicKey::from_pkcs1_pem(pem).map_err(rsa_err_to_pyerr)?;
+                Ok(RsaKey { private_key: None, public_key })
+            }
+        }
+    }
+
+    // PKCS#1 DER of either a private or a public key
+    #[staticmethod]
+    fn from_der(der: ByteArg) -> PyResult<Self> {
+        let der = der.as_slice();
+        match RsaPrivateKey::from_pkcs1_der(der) {
+            Ok(private_key) => Self::from_private(private_key),
+            Err(_) => {
+                let public_key = RsaPublicKey::from_pkcs1_der(der).map_err(rsa_err_to_pyerr)?;
+                Ok(RsaKey { private_key: None, public_key })
+            }
+        }
+    }
+
+    #[getter]
+    fn has_private(&self) -> bool {
+        self.private_key.is_some()
+    }
+
+    // Public-only handle, e.g. to hand to the encrypting side
+    fn public(&self) -> RsaKey {
+        RsaKey { private_key: None, public_key: self.public_key.clone() }
+    }
+
+    fn encrypt(&self, py: Python<'_>, message: &str) -> PyResult<Py<PyBytes>> {
+        let encrypted_data = py.allow_threads(|| self.public_key.encrypt(&mut OsRng, Pkcs1v15Encrypt, message.as_bytes()))
+            .map_err(rsa_err_to_pyerr)?;
+        Ok(to_py_bytes(py, &encrypted_data))
+    }
+
+    fn decrypt(&self, py: Python<'_>, encrypted_data: ByteArg) -> PyResult<String> {
+        let private_key = self.private()?;
+        let encrypted_data = encrypted_data.as_slice();
+        let decrypted_data = py.allow_threads(|| private_key.decrypt(Pkcs1v15Encrypt, encrypted_data)).map_err(rsa_err_to_pyerr)?;
+        String::from_utf8(decrypted_data).map_err(rsa_err_to_pyerr)
+    }
+
+    fn private_pem(&self) -> PyResult<String> {
+        Ok(self.private()?.to_pkcs1_pem(LineEnding::LF).map_err(rsa_err_to_pyerr)?.to_string())
+    }
+
+    fn public_pem(&self) -> PyResult<String> {
+        self.public_key.to_pkcs1_pem(LineEnding::LF).map_err(rsa_err_to_pyerr)
+    }
+
+    fn private_der(&self, py: Python<'_>) -> PyResult<Py<PyBytes>> {
+        let der = self.private()?.to_pkcs1_der().map_err(rsa_err_to_pyerr)?;
+        Ok(to_py_bytes(py, der.as_bytes()))
+    }
+
+    fn public_der(&self, py: Python<'_>) -> PyResult<Py<PyBytes>> {
+        let der = self.public_key.to_pkcs1_der().map_err(rsa_err_to_pyerr)?;
+        Ok(to_py_bytes(py, der.as_bytes()))
+    }
+
+    fn __repr__(&self) -> String {
+        let kind = if self.private_key.is_some() { "private" } else { "public" };
+        format!("RsaKey({}, {} bits)", kind, self.public_key.size() * 8)
+    }
+}
@@ -1,3 +1,5 @@
+import hashlib
+import os
 import shadow_crypt
 
 # Test the Diffie-Hellman key exchange.
@@ -32,6 +34,19 @@ def test_dh():
     print(f"Public key length: {len(public_key1)} bytes")
     print(f"Shared key length: {len(shared_key1)} bytes")
 
+# Test short Diffie-Hellman exponents against full-size keys and the uncached keygen.
+def test_dh_short_exponent():
+    print("\nTesting Diffie-Hellman short exponents...")
+    short_private_key, short_public_key = shadow_crypt.generate_dh_key(short_exponent=True)
+    assert len(short_private_key) * 8 == shadow_crypt.DH_SHORT_EXPONENT_BITS, "Short exponent has the wrong size!"
+
+    # Keys from the cached group, with or without short exponents, agree with the generic modpow keys.
+    private_key, public_key = shadow_crypt.generate_dh_key_modpow()
+    shared_key1 = shadow_crypt.derive_dh_shared_key(short_private_key, public_key)
+    shared_key2 = shadow_crypt.derive_dh_shared_key(private_key, short_public_key)
+    assert shared_key1 == shared_key2, "Short exponent shared keys do not match!"
+    print("Short exponent shared keys match!")
+
 # Test the Elliptic Curve Diffie-Hellman (ECDH) key exchange.
 def test_ecdh():
     print("\nTesting ECDH key exchange...")
@@ -121,14 +136,136 @@ def test_ntru():
     assert shared_secret_alice == shared_secret_bob, "NTRU shared secrets do not match!"
     print("NTRU key encapsulation successful!")
     
+# Test the batch functions that return contiguous buffers of fixed-size records.
+def test_batch_buffers():
+    print("\nTesting batch buffers...")
+    n = 4
+
+    # DH keys are padded to fixed records and still derive the same secret as the single calls.
+    dh_private_keys, dh_public_keys = shadow_crypt.dh_generate_many(n)
+    assert len(dh_private_keys) == len(dh_public_keys) == n * shadow_crypt.DH_KEY_BYTES
+    private_key2, public_key2 = shadow_crypt.generate_dh_key()
+    dh_private_key1 = dh_private_keys[:shadow_crypt.DH_KEY_BYTES]
+    dh_public_key1 = dh_public_keys[:shadow_crypt.DH_KEY_BYTES]
+    assert shadow_crypt.derive_dh_shared_key(dh_private_key1, public_key2) == shadow_crypt.derive_dh_shared_key(private_key2, dh_public_key1)
+
+    # One X25519 private key against a whole buffer of public keys.
+    x_private_keys, x_public_keys = shadow_crypt.x25519_generate_many(n)
+    private_key, public_key = shadow_crypt.generate_ecdh_key()
+    shared_secrets = shadow_crypt.x25519_derive_many(bytes(private_key), x_public_keys)
+    size = shadow_crypt.X25519_KEY_BYTES
+    for i in range(n):
+        expected = shadow_crypt.derive_ecdh_shared_key(x_private_keys[i * size:(i + 1) * size], public_key)
+        assert shared_secrets[i * size:(i + 1) * size] == bytes(expected), "X25519 batch secret does not match!"
+
+    # Kyber keygen and encapsulation in bulk, decapsulated one record at a time.
+    public_keys, secret_keys = shadow_crypt.kyber_keygen_batch(n)
+    ciphertexts, kyber_secrets = shadow_crypt.kyber_encapsulate_many(public_keys)
+    sk_size, ct_size, ss_size = shadow_crypt.KYBER_SECRET_KEY_BYTES, shadow_crypt.KYBER_CIPHERTEXT_BYTES, shadow_crypt.KYBER_SHARED_SECRET_BYTES
+    for i in range(n):
+        shared_secret = shadow_crypt.kyber_decapsulate(ciphertexts[i * ct_size:(i + 1) * ct_size], secret_keys[i * sk_size:(i + 1) * sk_size])
+        assert shared_secret == kyber_secrets[i * ss_size:(i + 1) * ss_size], "Kyber batch secret does not match!"
+
+    # NTRU encapsulation in bulk against the same public key repeated.
+    ntru_public_key, ntru_private_key = shadow_crypt.ntru_generate_keypair()
+    ciphertexts, ntru_secrets = shadow_crypt.ntru_encapsulate_many(bytes(ntru_public_key) * n)
+    ct_size, ss_size = shadow_crypt.NTRU_CIPHERTEXT_BYTES, shadow_crypt.NTRU_SHARED_SECRET_BYTES
+    for i in range(n):
+        shared_secret = shadow_crypt.ntru_decapsulate(bytes(ntru_private_key), ciphertexts[i * ct_size:(i + 1) * ct_size])
+        assert bytes(shared_secret) == ntru_secrets[i * ss_size:(i + 1) * ss_size], "NTRU batch secret does not match!"
+    print("Batch buffers match the single-item functions!")
+
+def test_bytes_api():
+    print("\nTesting bytes results and the list compat shim...")
+    # Keys and secrets come back as bytes and are accepted as bytes, bytearray or list of ints.
+    private_key, public_key = shadow_crypt.generate_ecdh_key()
+    assert isinstance(private_key, bytes) and isinstance(public_key, bytes)
+    shared_key = shadow_crypt.derive_ecdh_shared_key(private_key, public_key)
+    assert shadow_crypt.derive_ecdh_shared_key(bytearray(private_key), list(public_key)) == shared_key
+
+    ntru_public_key, ntru_private_key = shadow_crypt.ntru_generate_keypair()
+    ciphertext, shared_secret = shadow_crypt.ntru_encapsulate(memoryview(ntru_public_key))
+    assert isinstance(ciphertext, bytes) and isinstance(shared_secret, bytes)
+    assert shadow_crypt.ntru_decapsulate(ntru_private_key, ciphertext) == shared_secret
+
+    # The 0.1 list[int] forms stay available under shadow_crypt.compat, which imports as a submodule.
+    import shadow_crypt.compat
+    from shadow_crypt.compat import generate_ecdh_key
+    assert generate_ecdh_key is shadow_crypt.compat.generate_ecdh_key
+    dh_private_key, dh_public_key = shadow_crypt.compat.generate_dh_key()
+    assert isinstance(dh_private_key, list) and isinstance(dh_public_key, list)
+    assert isinstance(shadow_crypt.compat.derive_ecdh_shared_key(private_key, public_key), list)
+    print("Bytes API and compat shim work!")
+
+# Test the key handles against each other and against the string/bytes functions.
+def test_key_handles():
+    print("\nTesting key handles...")
+    message = "Hello, world!"
+
+    # RSA handles round-trip through PEM and DER and interoperate with rsa_encrypt/rsa_decrypt.
+    rsa_key = shadow_crypt.RsaKey.generate()
+    public_key = shadow_crypt.RsaKey.from_pem(rsa_key.public_pem())
+    assert rsa_key.has_private and not public_key.has_private
+    assert rsa_key.decrypt(public_key.encrypt(message)) == message
+    assert shadow_crypt.rsa_decrypt(rsa_key.private_pem(), rsa_key.public().encrypt(message)) == message
+    assert shadow_crypt.RsaKey.from_der(rsa_key.private_der()).decrypt(shadow_crypt.rsa_encrypt(rsa_key.public_pem(), message)) == message
+    assert shadow_crypt.RsaKey.from_der(rsa_key.public_der()).public_pem() == rsa_key.public_pem()
+
+    # X25519 handles derive the same secret as derive_ecdh_shared_key.
+    ecdh_key1, ecdh_key2 = shadow_crypt.EcdhKey.generate(), shadow_crypt.EcdhKey.generate()
+    shared_secret = ecdh_key1.derive(ecdh_key2.public_bytes())
+    assert shared_secret == ecdh_key2.derive(ecdh_key1.public_bytes())
+    assert shared_secret == shadow_crypt.derive_ecdh_shared_key(ecdh_key1.private_bytes(), ecdh_key2.public_bytes())
+    assert shadow_crypt.EcdhKey.from_bytes(ecdh_key1.private_bytes()).public_bytes() == ecdh_key1.public_bytes()
+
+    # KEM handles: a public-only handle encapsulates, the full one decapsulates.
+    kyber_key = shadow_crypt.KyberKey.generate()
+    ciphertext, kyber_secret = shadow_crypt.KyberKey.from_bytes(kyber_key.public_bytes()).encapsulate()
+    assert kyber_key.decapsulate(ciphertext) == kyber_secret
+    assert shadow_crypt.kyber_decapsulate(ciphertext, kyber_key.secret_bytes()) == kyber_secret
+
+    ntru_key = shadow_crypt.NtruKey.generate()
+    ciphertext, ntru_secret = shadow_crypt.NtruKey.from_bytes(ntru_key.public_bytes()).encapsulate()
+    assert ntru_key.decapsulate(ciphertext) == ntru_secret
+    assert shadow_crypt.ntru_decapsulate(ntru_key.private_bytes(), ciphertext) == ntru_secret
+    print("Key handles work!")
+
+# Test KEM + AEAD: a Kyber shared secret as ChaCha20-Poly1305 key, tampering is detected.
+def test_aead():
+    print("\nTesting ChaCha20-Poly1305 under a Kyber shared secret...")
+    public_key, secret_key = shadow_crypt.kyber_keygen()
+    ciphertext, shared_secret = shadow_crypt.kyber_encapsulate(public_key)
+    key = hashlib.sha256(shared_secret).digest()
+    nonce = os.urandom(shadow_crypt.AEAD_NONCE_BYTES)
+    message = b"Hello, world!"
+
+    encrypted = shadow_crypt.aead_encrypt(key, nonce, message, ciphertext)
+    assert len(encrypted) == len(message) + shadow_crypt.AEAD_TAG_BYTES, "Unexpected AEAD ciphertext size!"
+    receiver_key = hashlib.sha256(shadow_crypt.kyber_decapsulate(ciphertext, secret_key)).digest()
+    assert shadow_crypt.aead_decrypt(receiver_key, nonce, encrypted, ciphertext) == message
+
+    tampered = bytes([encrypted[0] ^ 1]) + encrypted[1:]
+    for bad_ciphertext, associated_data in ((tampered, ciphertext), (encrypted, b"other")):
+        try:
+            shadow_crypt.aead_decrypt(receiver_key, nonce, bad_ciphertext, associated_data)
+        except ValueError:
+            continue
+        raise AssertionError("Altered AEAD input was accepted!")
+    print("AEAD round trip works and rejects altered data!")
+
 # Run all the tests in sequence.
 def run_all_tests():
     test_dh()
+    test_dh_short_exponent()
     test_ecdh()
     test_rsa()
     test_kyber()
     test_kyber_full_exchange()
     test_ntru()
+    test_batch_buffers()
+    test_bytes_api()
+    test_key_handles()
+    test_aead()
 
 # When this script is executed directly, run all the tests.
 if __name__ == "__main__":
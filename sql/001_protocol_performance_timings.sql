@@ -0,0 +1,2 @@
+-- Per-phase timing breakdown of each test (keygen, remote call, derive, server 2 phases...)
+alter table protocol_performance add column if not exists timings jsonb;
@@ -0,0 +1,16 @@
+-- Repeated runs from the Test tab: one row per run with its summary statistics,
+-- the iterations themselves stay in protocol_performance and point back at their batch
+create table if not exists protocol_performance_batches (
+    id bigint generated by default as identity primary key,
+    protocol_name text not null,
+    mode text not null,
+    wire text not null,
+    iterations integer not null,
+    warmup integer not null,
+    summary jsonb not null,
+    created_at timestamptz not null default now()
+);
+
+alter table protocol_performance add column if not exists batch_id bigint references protocol_performance_batches (id);
+alter table protocol_performance add column if not exists cpu_seconds double precision;
+create index if not exists protocol_performance_batch_id_idx on protocol_performance (batch_id);
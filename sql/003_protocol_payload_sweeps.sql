@@ -0,0 +1,19 @@
+-- Payload-size sweeps from the Compare tab: one row per endpoint and message size of a sweep
+create table if not exists protocol_payload_sweeps (
+    id bigint generated by default as identity primary key,
+    sweep_id text not null,
+    endpoint text not null,
+    payload_bytes integer not null,
+    iterations integer not null,
+    mode text not null,
+    wire text not null,
+    median_seconds double precision,
+    mean_seconds double precision,
+    p95_seconds double precision,
+    ciphertext_bytes integer,
+    expansion_bytes integer,
+    payload_mbps double precision,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists protocol_payload_sweeps_sweep_id_idx on protocol_payload_sweeps (sweep_id);
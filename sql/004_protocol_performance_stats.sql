@@ -0,0 +1,55 @@
+-- Compare tab statistics computed where the rows are: for every endpoint one overall row (bucket_start
+-- is null) and one row per time bucket of bucket_seconds, optionally only over [since, until).
+-- Called as an RPC, e.g. select * from protocol_performance_stats(array['rsa', 'ecdh'], 86400);
+-- utils/performance_stats.aggregate_samples computes the same thing locally.
+create index if not exists protocol_performance_protocol_created_idx on protocol_performance (protocol_name, created_at);
+
+create or replace function protocol_performance_stats(
+    endpoints text[],
+    bucket_seconds integer default 86400,
+    since timestamptz default null,
+    until timestamptz default null
+) returns table (
+    protocol_name text,
+    bucket_start timestamptz,
+    samples bigint,
+    mean_seconds double precision,
+    stdev_seconds double precision,
+    min_seconds double precision,
+    p50_seconds double precision,
+    p90_seconds double precision,
+    p95_seconds double precision,
+    p99_seconds double precision,
+    max_seconds double precision,
+    mean_bandwidth double precision,
+    mean_encryption_overhead double precision
+) language sql stable as $$
+    select
+        p.protocol_name,
+        p.bucket,
+        count(p.time_seconds),
+        avg(p.time_seconds),
+        stddev_samp(p.time_seconds),
+        min(p.time_seconds),
+        percentile_cont(0.5) within group (order by p.time_seconds),
+        percentile_cont(0.9) within group (order by p.time_seconds),
+        percentile_cont(0.95) within group (order by p.time_seconds),
+        percentile_cont(0.99) within group (order by p.time_seconds),
+        max(p.time_seconds),
+        avg(p.bandwidth),
+        avg(p.encryption_overhead)
+    from (
+        select
+            pp.protocol_name,
+            pp.time_seconds,
+            pp.bandwidth,
+            pp.encryption_overhead,
+            to_timestamp(floor(extract(epoch from pp.created_at) / bucket_seconds) * bucket_seconds) as bucket
+        from protocol_performance pp
+        where pp.protocol_name = any(endpoints)
+          and (since is null or pp.created_at >= since)
+          and (until is null or pp.created_at < until)
+    ) p
+    group by grouping sets ((p.protocol_name), (p.protocol_name, p.bucket))
+    order by p.protocol_name, p.bucket nulls first
+$$;
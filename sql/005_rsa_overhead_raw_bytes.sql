@@ -0,0 +1,7 @@
+-- encryption_overhead of RSA rows was the length of the hex ciphertext minus the message bytes
+-- (512 - m for a 2048-bit key) until it became the raw expansion (256 - m, at most 255 as a message
+-- has at least one byte). Bring the old rows to raw bytes so both kinds can be compared; rows
+-- already in raw bytes never exceed 256, so running this again changes nothing.
+update protocol_performance
+set encryption_overhead = encryption_overhead - 256
+where protocol_name = 'rsa' and encryption_overhead > 256;
@@ -0,0 +1,41 @@
+-- Idempotent result writes: the results writer gives every row and batch a write_id of its own
+-- before the first attempt, so an insert retried after a timeout (that may have gone through)
+-- is skipped instead of written twice. Older rows keep a null write_id, which never conflicts.
+alter table protocol_performance add column if not exists write_id uuid;
+create unique index if not exists protocol_performance_write_id_idx on protocol_performance (write_id);
+
+alter table protocol_performance_batches add column if not exists write_id uuid;
+create unique index if not exists protocol_performance_batches_write_id_idx on protocol_performance_batches (write_id);
+
+-- A repeated run and its samples in one transaction, so a failure never leaves a batch without
+-- its samples. Called as an RPC with the batch row and the sample rows (each with its write_id);
+-- calling it again with the same batch write_id writes nothing. Returns the batch id.
+create or replace function save_performance_batch(batch jsonb, samples jsonb)
+returns bigint
+language plpgsql
+as $$
+declare
+    saved_id bigint;
+begin
+    insert into protocol_performance_batches (write_id, protocol_name, mode, wire, iterations, warmup, summary)
+    values ((batch->>'write_id')::uuid, batch->>'protocol_name', batch->>'mode', batch->>'wire',
+            (batch->>'iterations')::integer, (batch->>'warmup')::integer, batch->'summary')
+    on conflict (write_id) do nothing
+    returning id into saved_id;
+
+    -- Written by an earlier attempt, its samples went in with it
+    if saved_id is null then
+        select id into saved_id from protocol_performance_batches where write_id = (batch->>'write_id')::uuid;
+        return saved_id;
+    end if;
+
+    insert into protocol_performance (write_id, protocol_name, batch_id, time_seconds, cpu_seconds, bandwidth,
+                                      encryption_overhead, timings)
+    select sample.write_id, batch->>'protocol_name', saved_id, sample.time_seconds, sample.cpu_seconds, sample.bandwidth,
+           sample.encryption_overhead, sample.timings
+    from jsonb_to_recordset(samples) as sample (write_id uuid, time_seconds double precision, cpu_seconds double precision,
+                                                bandwidth double precision, encryption_overhead double precision,
+                                                timings jsonb);
+    return saved_id;
+end;
+$$;
@@ -1,62 +1,156 @@
+import os
 import streamlit as st
-from utils.database import load_test_results
-from utils.plotting import plot_interactive_chart
+from utils.database import load_comparison_frames, load_performance_stats, save_payload_sweep, load_payload_sweeps, get_protocol_catalog, get_local_results_store
+from utils.history_cache import HISTORY_MAX_ROWS
+from utils.local_results import LOCAL_RESULTS_DB
+from utils.performance_stats import BUCKETS, overall, by_bucket
+from utils.payload_sweep import SWEEP_ENDPOINTS, DEFAULT_SIZES, RSA_MAX_MESSAGE_BYTES, parse_sizes, run_sweep
+from utils.plotting import plot_interactive_chart, plot_payload_sweep, plot_bucket_chart
 import pandas as pd
 
+# Percentiles of a run written by utils/load_testing.py, for the Compare tab
+def load_test_summary(run_df):
+    summary = run_df.groupby("protocol_name").agg(requests=("success", "size"), errors=("success", lambda ok: int((~ok.astype(bool)).sum())))
+    latencies = run_df[run_df["success"].astype(bool)].groupby("protocol_name")["time_seconds"]
+    for label, quantile in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("p99.9", 0.999)):
+        summary[f"{label} (s)"] = latencies.quantile(quantile)
+    summary["error rate"] = summary["errors"] / summary["requests"]
+    return summary
+
+# Load test results uploaded as the CSV written by utils/load_testing.py
+def show_load_test_run():
+    with st.expander("📂 Load test results"):
+        uploaded = st.file_uploader("Results CSV written by utils/load_testing.py", type="csv")
+        if uploaded is None:
+            return
+        run_df = pd.read_csv(uploaded)
+        successful = run_df[run_df["success"].astype(bool)]
+        response_df = pd.DataFrame({
+            protocol: rows["time_seconds"].reset_index(drop=True) for protocol, rows in successful.groupby("protocol_name")
+        })
+        plot_interactive_chart(response_df)
+        st.write("🔶 Requests, errors and latency percentiles per protocol during the load test:")
+        st.dataframe(load_test_summary(run_df), use_container_width=True)
+
+# Latency, expansion and throughput of the message endpoints as the message grows
+def show_payload_sweep(conn):
+    with st.expander("📏 Cost by payload size"):
+        labels = st.multiselect("Endpoints", list(SWEEP_ENDPOINTS), default=list(SWEEP_ENDPOINTS))
+        sizes_text = st.text_input("Message sizes in bytes", ", ".join(str(size) for size in DEFAULT_SIZES),
+                                   help=f"RSA stops at {RSA_MAX_MESSAGE_BYTES} bytes, the PKCS#1 v1.5 limit of a 2048-bit key. "
+                                        "The KEM endpoints take any size.")
+        iterations = st.number_input("Iterations per size", min_value=1, max_value=200, value=10)
+        mode_labels = {"Full (HTTP) 🌐": "full", "Loopback 🔁": "loopback", "Direct ⚡": "direct"}
+        mode_label = st.radio("Sweep mode", list(mode_labels), horizontal=True)
+        wire_labels = {"JSON + hex 📝": "json", "Binary (raw bytes / CBOR) 📦": "binary"}
+        wire_label = st.radio("Server to server format", list(wire_labels), horizontal=True, key="sweep_wire")
+        mode, wire = mode_labels[mode_label], wire_labels[wire_label]
+
+        sweep_df = pd.DataFrame()
+        if st.button("Run payload sweep") and labels:
+            try:
+                sizes = parse_sizes(sizes_text)
+                progress = st.progress(0.0)
+                sweep_df = run_sweep([SWEEP_ENDPOINTS[label] for label in labels], sizes, int(iterations), wire=wire,
+                                     mode=mode, progress=lambda done, total: progress.progress(done / total))
+            except Exception as e:
+                st.error(f"Payload sweep failed: {e}")
+                return
+            # Only full runs are kept, like the single tests
+            if mode == "full":
+                save_payload_sweep(conn, sweep_df, mode, wire)
+        else:
+            saved = load_payload_sweeps(conn)
+            if not saved.empty:
+                # Latest saved sweep
+                sweep_df = saved[saved["sweep_id"] == saved["sweep_id"].iloc[-1]]
+
+        if sweep_df.empty:
+            st.write("No payload sweep yet, run one above.")
+            return
+        plot_payload_sweep(sweep_df, "median_seconds", "Median latency (seconds)")
+        plot_payload_sweep(sweep_df, "expansion_bytes", "Ciphertext expansion (raw bytes)")
+        plot_payload_sweep(sweep_df, "payload_mbps", "Payload throughput (Mbps)")
+        st.write("🔶 RSA carries the message inside its single 256 byte block, so its ciphertext stays the same size until the padding limit. "
+                 "The KEMs pay a fixed ciphertext, nonce and tag and then grow byte for byte with the message.")
+        st.dataframe(sweep_df, hide_index=True, use_container_width=True)
+
 # Protocol comparison tab
 def show_compare_protocols(conn, protocol_list):
+    show_load_test_run()
+    show_payload_sweep(conn)
     comparison_protocols = st.multiselect("Select protocols to compare", protocol_list)
+    # Runs stored offline with utils/local_results.py can be compared instead of the Supabase ones
+    source = "Supabase"
+    if os.path.exists(LOCAL_RESULTS_DB):
+        source = st.radio("Results from", ["Supabase", "Local store"], horizontal=True,
+                          help=f"Local store: {LOCAL_RESULTS_DB}, filled by utils/load_testing.py --store or utils/local_results.py ingest")
     if comparison_protocols:
-        comparison_data = {
-            protocol: {
-                "response_times": [r["time_seconds"] for r in load_test_results(conn, protocol)],
-                "bandwidth": [r["bandwidth"] for r in load_test_results(conn, protocol)],
-                "encryption_overhead": [r["encryption_overhead"] for r in load_test_results(conn, protocol)]
-            } for protocol in comparison_protocols
-        }
-
-        # Create DataFrames for each metric
-        response_df = pd.DataFrame({
-            protocol: pd.Series(data["response_times"]) for protocol, data in comparison_data.items()
-        })
-        bandwidth_df = pd.DataFrame({
-            protocol: pd.Series(data["bandwidth"]) for protocol, data in comparison_data.items()
-        })
-        encryption_df = pd.DataFrame({
-            protocol: pd.Series(data["encryption_overhead"]) for protocol, data in comparison_data.items()
-        })
+        bucket_label = st.selectbox("Time buckets", list(BUCKETS), index=list(BUCKETS).index("Day"))
+        # Statistics only, computed where the samples are; raw samples are loaded for a zoomed window
+        if source == "Local store":
+            store = get_local_results_store()
+            endpoints = get_protocol_catalog(conn).endpoints(comparison_protocols)
+            stats = store.performance_stats(endpoints, BUCKETS[bucket_label])
+        else:
+            stats = load_performance_stats(conn, comparison_protocols, BUCKETS[bucket_label])
+        totals = overall(stats)
 
         # Response time chart
         st.write("# Performance Over Time 📈")
-        plot_interactive_chart(response_df)
+        response_mode = st.radio("Response time per bucket", ["Mean", "p50", "p95", "p99"], horizontal=True)
+        response_column = {"Mean": "mean_seconds", "p50": "p50_seconds", "p95": "p95_seconds", "p99": "p99_seconds"}[response_mode]
+        plot_bucket_chart(by_bucket(stats, response_column), f"{response_mode} Response Time (seconds)")
         st.write("The chart above shows the performance of the selected protocols over time. In general, the lower the response time, the better the performance of the protocol, but there are more thigns to take into consideration\n\n"
             "ℹ️ All charts are interactive, so zoom, hover, and click to explore data! Move over the data points to see the exact response time for each protocol. These are the main metrics to determine the performance of the protocols, although not the only ones as we will see. \n ",
             "It is also updated in real-time as new tests are performed, so you can keep an eye on the performance of the protocols as you test them 📊 while also seeing in real time which protocol is the best given the selected above, and while different. It could help visualice each one of them in an easy and clicky way.")
-        
+
+        # Newest samples one by one, each rerun only fetches the rows added since the last one
+        if source == "Supabase" and st.toggle("⏱️ Follow the latest samples",
+                                              help=f"Up to the newest {HISTORY_MAX_ROWS} samples of each protocol"):
+            plot_interactive_chart(load_comparison_frames(conn, comparison_protocols)["time_seconds"])
+
+        # Every sample of a chosen window
+        buckets = stats["bucket_start"].dropna()
+        if not buckets.empty:
+            with st.expander("🔎 Zoom into a window"):
+                first, last = buckets.min().to_pydatetime(), (buckets.max() + pd.Timedelta(seconds=BUCKETS[bucket_label])).to_pydatetime()
+                since, until = st.slider("Window", min_value=first, max_value=last, value=(first, last),
+                                         step=pd.Timedelta(seconds=BUCKETS[bucket_label]).to_pytimedelta())
+                if st.button("Load samples of this window"):
+                    if source == "Local store":
+                        frames = store.comparison_frames(endpoints, since=since, until=until)
+                    else:
+                        frames = load_comparison_frames(conn, comparison_protocols, since=since, until=until)
+                    plot_interactive_chart(frames["time_seconds"])
+
         # Average Response Time
         st.write("## Protocol Analysis 🔍")
         st.write("### Average Response Time")
         st.write("🔶 The average response for each protocol is calculated as the sum of all response times divided by the number of tests performed:")
-        st.write(response_df.mean())
+        st.write(totals["mean_seconds"].rename("mean (s)"))
+        st.write("🔶 Samples and response time percentiles of each protocol:")
+        st.dataframe(totals[["samples", "min_seconds", "p50_seconds", "p90_seconds", "p95_seconds", "p99_seconds", "max_seconds"]],
+                     use_container_width=True)
 
         # Standard Deviation
         st.write("### Standard Deviation")
         st.write("🔶 The standard deviation for each protocol is a metric that indicates how much the response times vary from the average."
         "Higher deviation values indicate more variability in the response times, which isn't ideal for establishing a protocol that might need to secure many sessions at the same time or encrypt large amounts of data:")
-        st.write(response_df.std())
+        st.write(totals["stdev_seconds"].rename("stdev (s)"))
 
         # Bandwidth
         st.write("---")
         st.write("## Bandwidth Usage 📶")
         st.metric(label="Bandwidth measured in Mbps", value="Mbps")
-        st.line_chart(bandwidth_df)
+        st.line_chart(by_bucket(stats, "mean_bandwidth"))
         st.write("Bandwidth indicates how much data is transferred per second. 🧳 Lower values are better for network efficiency, meaning that the protocol is not requiring that many resources from the actual servers, "
         "giving us a great insight on hown different mathematical implementations can make different approaches work in an environment like this. It showcases how far we have come if protocols created 40 years ago match security"
         "and speed with newer ones, and on the contrary, it can show how efficient, newer protocols that are able to withdstand the quantum threat, can be 😵")
 
         # Average Bandwidth Usage
         st.write("## Average Bandwidth Usage")
-        avg_bandwidth = bandwidth_df.mean()
+        avg_bandwidth = totals["mean_bandwidth"].rename("mean (Mbps)")
         st.write("🔶 The average bandwidth usage for each protocol is calculated as the sum of all bandwidth values divided by the number of tests performed:")
         st.write(avg_bandwidth)
         st.write("---")
@@ -66,12 +160,12 @@ def show_compare_protocols(conn, protocol_list):
             
             st.write("## Encryption Overhead 🔐")
 
-            # Filter encryption_df for RSA (ensure the name matches exactly)
-            rsa_encryption_df = encryption_df[["RSA 📜"]].dropna()
+            # RSA buckets (ensure the name matches exactly)
+            rsa_encryption_df = by_bucket(stats, "mean_encryption_overhead").reindex(columns=["RSA 📜"]).dropna()
             if not rsa_encryption_df.empty:
 
-                # Calculate the average encryption overhead for RSA
-                rsa_avg_overhead = rsa_encryption_df.mean().iloc[0]
+                # Average encryption overhead for RSA over every sample
+                rsa_avg_overhead = totals.loc["RSA 📜", "mean_encryption_overhead"]
 
                 st.metric(label="Average Encryption Overhead for RSA protocol is", value=f"{rsa_avg_overhead:.2f} bytes")
 
@@ -86,8 +180,8 @@ def show_compare_protocols(conn, protocol_list):
 
         st.write("---")    
         st.write("🔶The best protocol in terms of performance is determined by the protocol with the lowest average response time in correlation with the lowest standard deviation:")
-        avg_series = response_df.mean().dropna()
-        std_series = response_df.std().dropna()
+        avg_series = totals["mean_seconds"].dropna()
+        std_series = totals["stdev_seconds"].dropna()
         if avg_series.empty:
             st.write("No valid data available to determine the best protocol.")
         else:
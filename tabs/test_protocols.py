@@ -1,7 +1,59 @@
+import pandas as pd
 import streamlit as st
-from utils.protocol_testing import test_protocol
+from utils.protocol_testing import test_protocol, run_repeated
 from utils.database import save_test_results, get_storage_path
 
+# Totals in the timings object that are not phases of their own
+SUMMARY_TIMINGS = {"total_seconds", "response_seconds", "client_overhead_seconds"}
+
+# Rows of (server, phase, milliseconds) from the timings returned by test_protocol
+def phase_breakdown(timings):
+    rows = []
+    for server, phases in (("Server A", timings), ("Server B", timings.get("server2", {}))):
+        for name, seconds in phases.items():
+            if name.endswith("_seconds") and name not in SUMMARY_TIMINGS and seconds is not None:
+                rows.append({"Server": server, "Phase": name[:-len("_seconds")], "Time (ms)": seconds * 1000})
+    if timings.get("client_overhead_seconds") is not None:
+        rows.append({"Server": "App ↔ Server A", "Phase": "network + framework", "Time (ms)": timings["client_overhead_seconds"] * 1000})
+    return pd.DataFrame(rows)
+
+# Latency and CPU statistics of a repeated run in milliseconds, one row per measure
+def run_summary_table(summary):
+    rows = []
+    for label, stats in (("Latency (outliers removed)", summary["latency_seconds"]), ("CPU time (this process)", summary["cpu_seconds"])):
+        row = {"Measure": label, "Samples": stats["count"]}
+        row.update({name: value * 1000 for name, value in stats.items() if name != "count"})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+# N iterations after a warmup, summarized instead of a single sample
+def show_repeated_run(conn, selected_protocol, endpoint, user_message, wire, mode, mode_label):
+    with st.expander("📊 Repeated run"):
+        iterations = st.number_input("Iterations", min_value=2, max_value=1000, value=30)
+        warmup = st.number_input("Warmup iterations (not measured)", min_value=0, max_value=100, value=3)
+        if st.button(f'Run {selected_protocol} {iterations} times'):
+            progress = st.progress(0.0)
+            try:
+                run = run_repeated(endpoint, user_message, wire, mode, int(iterations), int(warmup),
+                                   progress=lambda done, total: progress.progress(done / total))
+            except Exception as e:
+                st.error(f"Repeated run of {endpoint} failed: {e}")
+                return
+
+            summary = run["summary"]
+            latency = summary["latency_seconds"]
+            st.markdown(f"### ⏳ Latency: {latency['mean'] * 1000:.2f} ms mean, {latency['median'] * 1000:.2f} ms median "
+                        f"(95% CI {latency['ci95_low'] * 1000:.2f} to {latency['ci95_high'] * 1000:.2f} ms)")
+            st.markdown(f"### 🚀 Throughput: {summary['throughput']['requests_per_second']:.1f} exchanges/s, "
+                        f"{summary['throughput']['mbps']:.2f} Mbps")
+            st.caption(f"{summary['outliers']} outlier(s) out of {run['iterations']} left out of the latency statistics.")
+            st.dataframe(run_summary_table(summary), hide_index=True, use_container_width=True)
+
+            if mode == "full":
+                save_test_results(conn, selected_protocol, batch=run)
+            else:
+                st.info(f"{mode_label} results are not saved to the performance history.")
+
 # Testing protocol tab
 def show_test_protocols(conn, selected_protocol, protocol_details_df):
     st.write("⬇️ Here is the magic button... What does it do? Great question! In the left side 👀 you can see a deployable button followed by a short description of the current CHOSEN one. "
@@ -13,11 +65,26 @@ def show_test_protocols(conn, selected_protocol, protocol_details_df):
     if selected_protocol.lower().startswith('rsa'):
         user_message = st.text_area("Enter a message for the fun...", value="Hello, World!", placeholder="Hello, World!")
 
+    # Encoding used between server A and server B
+    wire_labels = {"JSON + hex 📝": "json", "Binary (raw bytes / CBOR) 📦": "binary"}
+    wire_label = st.radio("Server to server format", list(wire_labels), horizontal=True)
+
+    # How much of the stack the test goes through, the difference between modes is what HTTP and the
+    # handlers cost on top of the cryptography itself
+    mode_labels = {"Full (HTTP) 🌐": "full", "Loopback (in process handlers) 🔁": "loopback", "Direct (shadow_crypt only) ⚡": "direct"}
+    mode_label = st.radio("Test mode", list(mode_labels), horizontal=True,
+                          help="Loopback servers are shared by everyone using this app, their runs take turns.")
+    mode = mode_labels[mode_label]
+
+    if not protocol_details_df.empty:
+        show_repeated_run(conn, selected_protocol, protocol_details_df['endpoint'].iloc[0], user_message,
+                          wire_labels[wire_label], mode, mode_label)
+
     # Other protocol test
     if st.button(f'Test {selected_protocol}'):
         if not protocol_details_df.empty:
             endpoint = protocol_details_df['endpoint'].iloc[0]
-            result = test_protocol(endpoint, user_message)
+            result = test_protocol(endpoint, user_message, wire_labels[wire_label], mode)
 
             # If retrieval from operation is performed correctly then proceeds
             if result is not None:
@@ -26,8 +93,11 @@ def show_test_protocols(conn, selected_protocol, protocol_details_df):
                 encryption_overhead = result["encryption_overhead"]
                 response_json = result["response_json"]
                 
-                # Save results
-                save_test_results(conn, selected_protocol, response_time, bandwidth, encryption_overhead)
+                # Save results, only full runs go to the shared history so it keeps comparing like with like
+                if mode == "full":
+                    save_test_results(conn, selected_protocol, response_time, bandwidth, encryption_overhead, result["timings"])
+                else:
+                    st.info(f"{mode_label} results are not saved to the performance history.")
                 
                 # Display information
                 st.markdown(f"## 🎉 The protocol {selected_protocol} was tested successfully!\n\n"
@@ -38,6 +108,21 @@ def show_test_protocols(conn, selected_protocol, protocol_details_df):
                 if encryption_overhead is not None:
                     st.markdown(f"### 🔐 Encryption Overhead: {encryption_overhead} bytes")
 
+                # Where the time went, phase by phase on both servers
+                timings = result["timings"]
+                if timings:
+                    st.markdown("### ⏱️ Time per phase")
+                    st.dataframe(phase_breakdown(timings), hide_index=True, use_container_width=True)
+
+                # Bytes exchanged between both servers compared with plain JSON + hex
+                wire_stats = result["wire_stats"]
+                if wire_stats:
+                    wire_bytes = wire_stats["request_bytes"] + wire_stats["response_bytes"]
+                    json_bytes = wire_stats["json_request_bytes"] + wire_stats["json_response_bytes"]
+                    saved = 100 * (json_bytes - wire_bytes) / json_bytes if json_bytes else 0
+                    st.markdown(f"### 📦 Server A ↔ Server B traffic: {wire_bytes} bytes "
+                                f"({json_bytes} bytes as JSON + hex, {saved:.1f}% saved)")
+
                 # Retrieve the explanation template and resources from protocols table
                 explanation_template = protocol_details_df['protocol_explanation'].iloc[0]
                 explanation = explanation_template.format(**response_json)
@@ -0,0 +1,213 @@
+import itertools
+from datetime import datetime, timedelta, timezone
+
+# In-memory stand-in for the Supabase connection (st.connection("supabase") and its .client), with
+# the part of the query builder the utils use. Rows are dicts in tables; functions maps an RPC name
+# to a callable(connection, params) returning the response data.
+#
+# Failure injection: fail_next makes that many executes raise before anything happens, lose_next
+# makes them raise after the write went through (a response lost to a timeout). Every execute is
+# logged in calls as (table or function, operation, payload).
+
+class FakeError(ConnectionError):
+    pass
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+    def model_dump(self):
+        return {"data": self.data}
+
+# ISO timestamps are compared as times, whatever their precision or offset (none is UTC, the
+# database's time zone)
+def sort_key(value):
+    if isinstance(value, str) and "T" in value:
+        try:
+            moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+        return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    return value
+
+OPERATORS = {
+    "eq": lambda found, value: found == value,
+    "gt": lambda found, value: found > value,
+    "gte": lambda found, value: found >= value,
+    "lt": lambda found, value: found < value,
+    "lte": lambda found, value: found <= value
+}
+
+# Filter value of a PostgREST string as the type of the value it is compared to
+def coerce(found, value):
+    if isinstance(value, str) and isinstance(found, (int, float)) and not isinstance(found, bool):
+        return type(found)(value)
+    return sort_key(value)
+
+# Comma separated conditions at the top level of a PostgREST logic tree
+def split_conditions(text):
+    conditions, depth, start = [], 0, 0
+    for index, character in enumerate(text):
+        depth += {"(": 1, ")": -1}.get(character, 0)
+        if character == "," and depth == 0:
+            conditions.append(text[start:index])
+            start = index + 1
+    return conditions + [text[start:]]
+
+# Row test of one condition: column.operator.value, and(...) or or(...)
+def condition(text):
+    for group, combine in (("and(", all), ("or(", any)):
+        if text.startswith(group):
+            tests = [condition(part) for part in split_conditions(text[len(group):-1])]
+            return lambda row: combine(test(row) for test in tests)
+    column, operator, value = text.split(".", 2)
+    compare = OPERATORS[operator]
+    return lambda row: row.get(column) is not None and compare(sort_key(row[column]), coerce(row[column], value))
+
+class FakeQuery:
+    def __init__(self, connection, table):
+        self.connection = connection
+        self.table = table
+        self.operation = "select"
+        self.columns = None
+        self.filters = []
+        self.orders = []
+        self.limit_rows = None
+        self.offset = None
+        self.payload = None
+        self.on_conflict = None
+
+    def select(self, *columns, **options):
+        self.columns = columns
+        return self
+
+    def filter(self, column, test):
+        self.filters.append(lambda row: row.get(column) is not None and test(sort_key(row[column])))
+        return self
+
+    def eq(self, column, value):
+        return self.filter(column, lambda found: found == sort_key(value))
+
+    def in_(self, column, values):
+        values = [sort_key(value) for value in values]
+        return self.filter(column, lambda found: found in values)
+
+    def gt(self, column, value):
+        return self.filter(column, lambda found: found > sort_key(value))
+
+    def gte(self, column, value):
+        return self.filter(column, lambda found: found >= sort_key(value))
+
+    def lt(self, column, value):
+        return self.filter(column, lambda found: found < sort_key(value))
+
+    def lte(self, column, value):
+        return self.filter(column, lambda found: found <= sort_key(value))
+
+    # PostgREST logic tree, e.g. "created_at.gt.X,and(created_at.eq.X,id.gt.5)"
+    def or_(self, filters):
+        self.filters.append(condition(f"or({filters})"))
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, rows):
+        self.limit_rows = rows
+        return self
+
+    def range(self, start, end):
+        self.offset, self.limit_rows = start, end - start + 1
+        return self
+
+    def insert(self, rows):
+        self.operation, self.payload = "insert", rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict="", ignore_duplicates=False):
+        self.insert(rows)
+        self.operation, self.on_conflict = "upsert", on_conflict
+        return self
+
+    def execute(self):
+        return self.connection.execute(self.table, self.operation, self.payload, lambda: self.run())
+
+    def run(self):
+        table = self.connection.tables.setdefault(self.table, [])
+        if self.operation != "select":
+            return self.connection.insert(self.table, self.payload, self.on_conflict)
+        rows = [row for row in table if all(test(row) for test in self.filters)]
+        for column, desc in reversed(self.orders):
+            rows.sort(key=lambda row: sort_key(row.get(column)), reverse=desc)
+        start = self.offset or 0
+        rows = rows[start:] if self.limit_rows is None else rows[start:start + self.limit_rows]
+        if self.columns and self.columns != ("*",):
+            rows = [{column: row.get(column) for column in self.columns} for row in rows]
+        return [dict(row) for row in rows]
+
+class FakeRpc:
+    def __init__(self, connection, name, params):
+        self.connection = connection
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        function = self.connection.functions[self.name]
+        return self.connection.execute(self.name, "rpc", self.params, lambda: function(self.connection, self.params))
+
+class FakeConnection:
+    def __init__(self, tables=None, functions=None):
+        self.tables = {name: [dict(row) for row in rows] for name, rows in (tables or {}).items()}
+        self.functions = dict(functions or {})
+        self.calls = []
+        self.fail_next = 0
+        self.lose_next = 0
+        self.ids = itertools.count(1)
+        # created_at of the rows inserted without one, a second apart
+        self.clock = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    # The Supabase client itself, for rpc
+    @property
+    def client(self):
+        return self
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        return FakeRpc(self, name, params)
+
+    def execute(self, target, operation, payload, run):
+        self.calls.append((target, operation, payload))
+        if self.fail_next:
+            self.fail_next -= 1
+            raise FakeError(f"{target} {operation} failed")
+        data = run()
+        if self.lose_next:
+            self.lose_next -= 1
+            raise FakeError(f"{target} {operation} timed out")
+        return FakeResult(data)
+
+    # Appends rows with an id and a created_at; with on_conflict, rows whose value of that column
+    # is already there are skipped (an upsert ignoring duplicates)
+    def insert(self, table, rows, on_conflict=None):
+        stored = self.tables.setdefault(table, [])
+        taken = {row.get(on_conflict) for row in stored} if on_conflict else set()
+        written = []
+        for row in rows:
+            if on_conflict and row.get(on_conflict) in taken:
+                continue
+            row = dict(row)
+            row.setdefault("id", next(self.ids))
+            if "created_at" not in row:
+                self.clock += timedelta(seconds=1)
+                row["created_at"] = self.clock.isoformat()
+            stored.append(row)
+            written.append(dict(row))
+            if on_conflict:
+                taken.add(row.get(on_conflict))
+        return written
+
+    def rows(self, table):
+        return self.tables.get(table, [])
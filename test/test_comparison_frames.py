@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+import math
+import pytest
+from fake_supabase import FakeConnection
+from utils import paging
+
+pytest.importorskip("st_supabase_connection")
+from utils import database
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+# RSA and RSA-2048 share the rsa endpoint, the kyber endpoint has no samples yet
+PROTOCOLS = [
+    {"name": "RSA", "endpoint": "rsa"},
+    {"name": "ECDH", "endpoint": "ecdh"},
+    {"name": "RSA-2048", "endpoint": "rsa"},
+    {"name": "Kyber", "endpoint": "kyber"}
+]
+
+# One row per (seconds after START, time_seconds)
+def insert(conn, endpoint, *samples):
+    conn.insert("protocol_performance", [{"protocol_name": endpoint, "time_seconds": time_seconds,
+                                          "bandwidth": 2 * time_seconds, "encryption_overhead": None,
+                                          "created_at": (START + timedelta(seconds=seconds)).isoformat()}
+                                         for seconds, time_seconds in samples])
+
+@pytest.fixture(autouse=True)
+def small_pages(monkeypatch):
+    monkeypatch.setattr(paging, "PAGE_ROWS", 2)
+
+# The catalog and history cache are shared resources, every test starts with its own
+@pytest.fixture
+def conn():
+    database.get_protocol_catalog.clear()
+    database.get_history_cache.clear()
+    conn = FakeConnection({"protocols": PROTOCOLS, "protocol_visuals": []})
+    insert(conn, "rsa", (0, 1.0), (10, 2.0), (20, 3.0))
+    insert(conn, "ecdh", (5, 10.0), (15, 20.0))
+    yield conn
+    database.get_protocol_catalog.clear()
+    database.get_history_cache.clear()
+
+def column(frame, name):
+    return [None if math.isnan(value) else value for value in frame[name]]
+
+# A column per name in the order asked for, row i is the i-th oldest sample of each protocol,
+# shorter protocols are NaN padded
+def test_frames_from_history_cache(conn):
+    frames = database.load_comparison_frames(conn, ["RSA", "ECDH", "RSA-2048", "Kyber"])
+    assert list(frames) == list(database.COMPARISON_METRICS)
+    times = frames["time_seconds"]
+    assert list(times.columns) == ["RSA", "ECDH", "RSA-2048", "Kyber"]
+    assert column(times, "RSA") == [1.0, 2.0, 3.0]
+    assert column(times, "ECDH") == [10.0, 20.0, None]
+    # The shared endpoint is read once and shown under both names
+    assert column(times, "RSA-2048") == column(times, "RSA")
+    assert column(times, "Kyber") == [None, None, None]
+    assert column(frames["bandwidth"], "ECDH") == [20.0, 40.0, None]
+    assert frames["encryption_overhead"].isna().all().all()
+    assert database.get_history_cache(conn).stats()["endpoints"] == 3
+
+# Names without an endpoint are reported and left out
+def test_unknown_name(conn, monkeypatch):
+    errors = []
+    monkeypatch.setattr(database.st, "error", errors.append)
+    frames = database.load_comparison_frames(conn, ["Enigma", "ECDH"])
+    assert list(frames["time_seconds"].columns) == ["ECDH"]
+    assert errors == ["Protocol endpoint not found for loading test results: Enigma"]
+
+# Only endpoints without samples: empty columns
+def test_no_samples(conn):
+    frames = database.load_comparison_frames(conn, ["Kyber"])
+    assert list(frames["time_seconds"].columns) == ["Kyber"]
+    assert frames["time_seconds"].empty
+
+# A time window is read with one keyset paged query over every endpoint, [since, until), and
+# leaves the history cache alone
+def test_window(conn):
+    since, until = START + timedelta(seconds=5), START + timedelta(seconds=20)
+    frames = database.load_comparison_frames(conn, ["RSA", "ECDH", "RSA-2048", "Kyber"], since=since, until=until)
+    times = frames["time_seconds"]
+    assert column(times, "RSA") == [2.0, None]
+    assert column(times, "ECDH") == [10.0, 20.0]
+    assert column(times, "RSA-2048") == [2.0, None]
+    assert column(times, "Kyber") == [None, None]
+    # Three rows in pages of two
+    window_calls = [call for call in conn.calls if call[0] == "protocol_performance"]
+    assert len(window_calls) == 2
+    assert database.get_history_cache(conn).stats()["syncs"] == 0
@@ -0,0 +1,158 @@
+import os
+import sys
+import threading
+import time
+from functools import partial
+import pytest
+from flask import Flask, jsonify, request
+
+# The servers' helper modules, as the servers import them. The crypto calls are stubs, so the
+# executor imports without a built shadow_crypt
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "service", "common"))
+import executor
+import metrics
+
+PROTOCOLS = ("rsa", "ecdh")
+ROUTES = [(protocol, route) for route in ("single", "batch") for protocol in PROTOCOLS]
+
+# Stand-in for a slow shadow_crypt call: hold() runs until release
+class Gate:
+    def __init__(self):
+        self.released = threading.Event()
+
+    def hold(self):
+        self.released.wait(5)
+        return "held"
+
+def answer(protocol):
+    return f"{protocol} answer"
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+# One slot and one queue place for RSA, the defaults for ECDH; a thread pool as CRYPTO_EXECUTOR=thread
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv("CRYPTO_LIMITS", "rsa=1")
+    monkeypatch.setenv("CRYPTO_QUEUE", "rsa=1")
+    monkeypatch.setattr(metrics, "METRICS_DIR", "")
+    monkeypatch.setattr(executor, "CryptoExecutor", partial(executor.CryptoExecutor, mode="thread"))
+    app = Flask("test")
+    route_of = lambda request: (request.view_args["protocol"], request.endpoint) if request.view_args else None
+    app.metrics = metrics.init_app(app, ROUTES, ("queue",), route_of)
+    app.crypto = executor.init_app(app, PROTOCOLS, app.metrics)
+
+    # Errors caught by the route, as the servers do
+    @app.route('/single/<protocol>')
+    def single(protocol):
+        try:
+            return jsonify({'success': True, 'result': app.crypto.run(protocol, answer, protocol)})
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    # One item per protocol in ?items=, answered on its own as the batch routes do
+    @app.route('/batch/<protocol>')
+    def batch(protocol):
+        results = []
+        with app.crypto.handled():
+            for item in request.args['items'].split(','):
+                try:
+                    results.append({'success': True, 'result': app.crypto.run(item, answer, item)})
+                except executor.Overloaded as e:
+                    results.append({'success': False, 'error': str(e), 'overloaded': True})
+        return jsonify({'success': True, 'results': results})
+
+    return app
+
+# Calls of the protocol made from background threads, which take the slots and then the queue
+@pytest.fixture
+def busy(server):
+    gate = Gate()
+    threads = []
+
+    def occupy(protocol, calls):
+        lane = server.crypto.lanes[protocol]
+        for _ in range(calls):
+            thread = threading.Thread(target=server.crypto.run, args=(protocol, gate.hold))
+            thread.start()
+            threads.append(thread)
+            wait_until(lambda: lane.stats()['running'] + lane.stats()['waiting'] == len(threads))
+        return gate
+
+    yield occupy
+    gate.released.set()
+    for thread in threads:
+        thread.join()
+
+def executor_values(server, protocol):
+    base = server.metrics.layout.executor[protocol]
+    return list(server.metrics.values()[base:base + 3])
+
+# A full queue sheds the request as a 503 with Retry-After, though the route caught the error;
+# the other protocol's lane is not affected
+def test_shed_single_request(server, busy):
+    busy("rsa", 2)
+    response = server.test_client().get('/single/rsa')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(executor.CRYPTO_RETRY_AFTER)
+    assert response.get_json()['overloaded']
+    assert "queue of 1 is full" in response.get_json()['error']
+    assert server.test_client().get('/single/ecdh').get_json()['result'] == "ecdh answer"
+    values, layout = server.metrics.values(), server.metrics.layout
+    assert values[layout.errors[("rsa", "single")]] == 1
+    assert values[layout.errors[("ecdh", "single")]] == 0
+
+# Waiting longer than CRYPTO_QUEUE_TIMEOUT for a slot sheds too
+def test_shed_after_queue_timeout(server, busy, monkeypatch):
+    monkeypatch.setattr(executor, "CRYPTO_QUEUE_TIMEOUT", 0.01)
+    busy("rsa", 1)
+    response = server.test_client().get('/single/rsa')
+    assert response.status_code == 503
+    assert "no slot within 0.01 seconds" in response.get_json()['error']
+    stats = server.crypto.lanes["rsa"].stats()
+    assert (stats['waits'], stats['rejected'], stats['waiting']) == (1, 1, 0)
+
+# Inside handled() the shed items are answered in the batch and the others stand
+def test_batch_answers_shed_items(server, busy):
+    busy("rsa", 2)
+    response = server.test_client().get('/batch/ecdh?items=ecdh,rsa,ecdh')
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['success'] for result in results] == [True, False, True]
+    assert results[1]['overloaded']
+    assert "Retry-After" not in response.headers
+    # The flag does not outlive the block
+    assert server.test_client().get('/single/rsa').status_code == 503
+
+# Background work in bypass() runs in its own thread, without a slot or queue place, even with the
+# lane full; other threads still go through the lane
+def test_bypass(server, busy):
+    gate = busy("rsa", 2)
+    lane = server.crypto.lanes["rsa"]
+    with server.crypto.bypass():
+        assert server.crypto.run("rsa", answer, "rsa") == "rsa answer"
+    assert (lane.stats()['completed'], lane.stats()['rejected']) == (0, 0)
+    with pytest.raises(executor.Overloaded):
+        server.crypto.run("rsa", answer, "rsa")
+    gate.released.set()
+    wait_until(lambda: lane.stats()['completed'] == 2)
+
+# Lane statistics and executor gauges follow the calls waiting, running and shed, and come back to
+# zero once the lane drains
+def test_queue_depth_accounting(server, busy):
+    gate = busy("rsa", 2)
+    lane = server.crypto.lanes["rsa"]
+    assert (lane.stats()['running'], lane.stats()['waiting']) == (1, 1)
+    # The gauges are updated right after the lane's own counters
+    wait_until(lambda: executor_values(server, "rsa") == [1, 1, 0])
+    with pytest.raises(executor.Overloaded):
+        server.crypto.run("rsa", answer, "rsa")
+    assert executor_values(server, "rsa") == [1, 1, 1]
+    gate.released.set()
+    wait_until(lambda: executor_values(server, "rsa") == [0, 0, 1])
+    stats = lane.stats()
+    assert (stats['running'], stats['waiting'], stats['rejected'], stats['waits']) == (0, 0, 1, 1)
+    assert server.test_client().get('/executor').get_json()['lanes']['rsa']['completed'] == 2
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone
+import math
+import pytest
+from fake_supabase import FakeConnection
+from utils import paging
+from utils.history_cache import HistoryCache
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+# Rows of one insert, all created seconds after START
+def insert(conn, seconds, *times, endpoint="rsa"):
+    created_at = (START + timedelta(seconds=seconds)).isoformat()
+    return conn.insert("protocol_performance", [{"protocol_name": endpoint, "time_seconds": time_seconds, "bandwidth": 1.0,
+                                                 "encryption_overhead": None, "created_at": created_at}
+                                                for time_seconds in times])
+
+@pytest.fixture(autouse=True)
+def small_pages(monkeypatch):
+    monkeypatch.setattr(paging, "PAGE_ROWS", 3)
+
+@pytest.fixture
+def conn():
+    return FakeConnection()
+
+def times(cache, endpoint="rsa"):
+    return cache.load(endpoint)["time_seconds"].tolist()
+
+# The first sync reads only the newest max_rows rows, newest first, and holds them oldest first
+def test_first_sync_reads_newest_rows(conn):
+    for second in range(10):
+        insert(conn, second, float(second))
+    cache = HistoryCache(conn, max_rows=4)
+    assert times(cache) == [6.0, 7.0, 8.0, 9.0]
+    assert cache.stats()["fetched_rows"] == 4
+    # Two pages of 3, the second limited to what is left
+    assert len(conn.calls) == 2
+
+# Later syncs only read the overlap before the newest row held
+def test_sync_reads_new_rows(conn):
+    insert(conn, 0, 0.0)
+    insert(conn, 100, 1.0)
+    cache = HistoryCache(conn, overlap_seconds=10)
+    assert times(cache) == [0.0, 1.0]
+    insert(conn, 101, 2.0, 3.0)
+    assert cache.sync("rsa") == 2
+    assert cache.sync("rsa") == 0
+    assert times(cache) == [0.0, 1.0, 2.0, 3.0]
+    # The row at 0 seconds is outside every overlap, it was read once
+    assert cache.stats()["fetched_rows"] == 2 + 3 + 3 + 3
+
+# Rows sharing a created_at across page edges are all held, once
+def test_rows_sharing_created_at(conn):
+    insert(conn, 5, *[float(value) for value in range(7)])
+    cache = HistoryCache(conn)
+    assert times(cache) == [float(value) for value in range(7)]
+    insert(conn, 5, 7.0, 8.0)
+    assert cache.sync("rsa") == 2
+    assert times(cache) == [float(value) for value in range(9)]
+
+# A row committing after newer ones were read is picked up by the overlap and put in its place
+def test_late_commit_within_overlap(conn):
+    insert(conn, 100, 1.0)
+    insert(conn, 110, 3.0)
+    cache = HistoryCache(conn, overlap_seconds=30)
+    cache.sync("rsa")
+    insert(conn, 105, 2.0)
+    insert(conn, 50, 0.0)
+    assert cache.sync("rsa") == 1
+    frame = cache.load("rsa")
+    assert frame["time_seconds"].tolist() == [1.0, 2.0, 3.0]
+    assert frame["created_at"].is_monotonic_increasing
+    # Older than the overlap, seen after an invalidate
+    cache.invalidate("rsa")
+    assert times(cache) == [0.0, 1.0, 2.0, 3.0]
+
+# Over the cap the oldest rows go, late ones included, and evicted rows are not read back
+def test_cap(conn):
+    insert(conn, 100, 1.0)
+    insert(conn, 101, 2.0)
+    insert(conn, 102, 3.0)
+    cache = HistoryCache(conn, max_rows=2, overlap_seconds=30)
+    assert times(cache) == [2.0, 3.0]
+    insert(conn, 103, 4.0)
+    assert cache.sync("rsa") == 1
+    assert times(cache) == [3.0, 4.0]
+    assert cache.stats()["evicted_rows"] == 1
+    assert cache.stats()["new_rows"] == 3
+
+# NULL values are NaN, created_at is UTC
+def test_frame(conn):
+    insert(conn, 0, None)
+    frame = HistoryCache(conn).load("rsa")
+    assert math.isnan(frame["time_seconds"].iloc[0])
+    assert frame["created_at"].iloc[0] == START
+
+# Least recently used endpoints are dropped beyond max_endpoints
+def test_endpoint_eviction_and_invalidate(conn):
+    for endpoint in ("rsa", "ecdh", "kyber"):
+        insert(conn, 0, 1.0, endpoint=endpoint)
+    cache = HistoryCache(conn, max_endpoints=2)
+    cache.load("rsa")
+    cache.load("ecdh")
+    cache.load("rsa")
+    cache.load("kyber")
+    assert list(cache.histories) == ["rsa", "kyber"]
+    assert cache.stats()["evicted_endpoints"] == 1
+    cache.invalidate()
+    assert cache.stats()["endpoints"] == 0
@@ -0,0 +1,78 @@
+import io
+import os
+import sys
+import pytest
+
+# The servers' helper modules, as the servers import them; hybrid needs the built shadow_crypt
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "service", "common"))
+shadow_crypt = pytest.importorskip("shadow_crypt")
+if not hasattr(shadow_crypt, "aead_encrypt"):
+    pytest.skip("shadow_crypt is not built, only its source directory is importable", allow_module_level=True)
+import hybrid
+
+CHUNK = 16
+
+@pytest.fixture(scope="module")
+def recipient():
+    private_key, public_key = hybrid.generate_recipient_key("kyber")
+    return private_key, public_key
+
+# Header, then one item per frame
+def encrypt(recipient, payload, stats=None):
+    return list(hybrid.encrypt_stream("kyber", recipient[1], io.BytesIO(payload), chunk_bytes=CHUNK, stats=stats))
+
+def decrypt(recipient, parts):
+    return b"".join(hybrid.decrypt_stream(io.BytesIO(b"".join(parts)), lambda protocol: recipient[0]))
+
+# Empty, one byte, an exact multiple of the chunk size (the last frame is full size, decrypted on
+# the retry with the last-chunk flag) and one byte more
+@pytest.mark.parametrize("size, chunks", [(0, 1), (1, 1), (3 * CHUNK, 3), (3 * CHUNK + 1, 4)])
+def test_round_trip(recipient, size, chunks):
+    payload = os.urandom(size)
+    stats = {}
+    parts = encrypt(recipient, payload, stats)
+    assert len(parts) == 1 + chunks
+    assert stats["chunks"] == chunks
+    assert stats["plaintext_bytes"] == size
+    assert stats["stream_bytes"] == sum(len(part) for part in parts)
+    assert decrypt(recipient, parts) == payload
+
+# A source yielding pieces that do not line up with the chunks
+def test_round_trip_from_iterator(recipient):
+    payload = os.urandom(5 * CHUNK + 3)
+    pieces = [payload[start:start + 7] for start in range(0, len(payload), 7)]
+    parts = list(hybrid.encrypt_stream("kyber", recipient[1], pieces, chunk_bytes=CHUNK))
+    assert decrypt(recipient, parts) == payload
+
+# Dropping the last frames, full size or short, leaves a stream that ends at a frame boundary
+@pytest.mark.parametrize("size", [3 * CHUNK, 3 * CHUNK + 1])
+def test_cut_at_frame_boundary(recipient, size):
+    parts = encrypt(recipient, os.urandom(size))
+    for end in range(2, len(parts)):
+        with pytest.raises(ValueError):
+            decrypt(recipient, parts[:end])
+
+def test_swapped_frames(recipient):
+    header, first, second, *rest = encrypt(recipient, os.urandom(3 * CHUNK + 1))
+    with pytest.raises(ValueError):
+        decrypt(recipient, [header, second, first, *rest])
+
+# The header is the associated data of every chunk: a changed magic, chunk size or nonce prefix byte
+# fails, and a changed wrapped key gives another data key (Kyber rejects implicitly)
+def test_changed_header_byte(recipient):
+    header, *frames = encrypt(recipient, os.urandom(2 * CHUNK))
+    for index in [0, *range(5, 5 + 4 + hybrid.NONCE_PREFIX_BYTES), len(header) - 1]:
+        changed = header[:index] + bytes([header[index] ^ 1]) + header[index + 1:]
+        with pytest.raises(ValueError):
+            decrypt(recipient, [changed, *frames])
+
+@pytest.mark.parametrize("size", [0, 3 * CHUNK, 3 * CHUNK + 1])
+def test_trailing_data(recipient, size):
+    parts = encrypt(recipient, os.urandom(size))
+    with pytest.raises(ValueError, match="Data after the last hybrid chunk"):
+        decrypt(recipient, parts + [b"\0"])
+
+def test_truncated_header(recipient):
+    header = encrypt(recipient, b"")[0]
+    with pytest.raises(ValueError, match="header"):
+        decrypt(recipient, [header[:hybrid.HEADER.size - 1]])
@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+from utils.local_results import LocalResultsStore, epoch_seconds
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalResultsStore(str(tmp_path / "results.sqlite"))
+    yield store
+    store.close()
+
+def sample(protocol_name, time_seconds, created_at, **columns):
+    return {"protocol_name": protocol_name, "time_seconds": time_seconds, "bandwidth": 1.0,
+            "encryption_overhead": None, "created_at": created_at, **columns}
+
+# ISO strings (with Z or offset), naive datetimes as UTC, and numbers as they are
+def test_epoch_seconds():
+    assert epoch_seconds("1970-01-01T00:01:00Z") == 60.0
+    assert epoch_seconds("1970-01-01T01:00:00+01:00") == 0.0
+    assert epoch_seconds(pd.Timestamp("1970-01-01 00:00:10").to_pydatetime()) == 10.0
+    assert epoch_seconds(5) == 5.0
+
+# Rows come back per endpoint, oldest first, with UTC timestamps
+def test_append_and_load_results(store):
+    assert store.append([sample("rsa", 0.2, 20), sample("rsa", 0.1, 10), sample("ecdh", 0.3, 15)]) == 3
+    results = store.load_results("rsa")
+    assert list(results["time_seconds"]) == [0.1, 0.2]
+    assert list(results["created_at"]) == [pd.Timestamp(10, unit="s", tz="UTC"), pd.Timestamp(20, unit="s", tz="UTC")]
+
+# Failed requests stay out of the samples, rows without an outcome are kept; the export keeps everything
+def test_load_results_skips_failed_requests(store):
+    store.append([
+        sample("rsa", 0.1, 10, success=True, status=200),
+        sample("rsa", 5.0, 20, success=False, status=503, error="HTTP 503"),
+        sample("rsa", 0.3, 30)
+    ])
+    assert list(store.load_results("rsa")["time_seconds"]) == [0.1, 0.3]
+    assert store.summary()["samples"].tolist() == [3]
+
+def test_load_results_window(store):
+    store.append([sample("rsa", value, value * 10) for value in (1.0, 2.0, 3.0)])
+    assert list(store.load_results("rsa", since=10, until=30)["time_seconds"]) == [1.0, 2.0]
+
+# One column per label, the Compare tab's shape
+def test_comparison_frames(store):
+    store.append([sample("rsa", 0.1, 10), sample("rsa", 0.2, 20), sample("kem/kyber", 0.05, 10)])
+    frames = store.comparison_frames({"RSA": "rsa", "Kyber KEM": "kem/kyber"})
+    assert set(frames) == {"time_seconds", "bandwidth", "encryption_overhead"}
+    assert frames["time_seconds"]["RSA"].tolist() == [0.1, 0.2]
+    assert frames["time_seconds"]["Kyber KEM"].iloc[0] == 0.05
+
+# Statistics per label from the local samples, overall row first
+def test_performance_stats(store):
+    store.append([sample("rsa", 0.1, 10), sample("rsa", 0.3, 20), sample("rsa", 9.0, 30, success=False)])
+    stats = store.performance_stats({"RSA": "rsa"}, bucket_seconds=3600)
+    assert stats["protocol_name"].tolist() == ["RSA", "RSA"]
+    assert stats["samples"].tolist() == [2, 2]
+    assert stats["mean_seconds"].iloc[0] == pytest.approx(0.2)
+
+# Load test CSVs are appended chunk by chunk
+def test_ingest_csv(store, tmp_path):
+    path = tmp_path / "run.csv"
+    pd.DataFrame([sample("ecdh", 0.1, "1970-01-01T00:00:10+00:00", status=200, success=True)] * 3).to_csv(path, index=False)
+    assert store.ingest_csv(path) == 3
+    assert len(store.load_results("ecdh")) == 3
+
+# RSA overhead written as hex text length is brought to raw bytes when the file is opened
+def test_rsa_overhead_migrated(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    store = LocalResultsStore(path)
+    store.append([sample("rsa", 0.1, 10, encryption_overhead=499), sample("rsa", 0.1, 20, encryption_overhead=243)])
+    store.close()
+    store = LocalResultsStore(path)
+    assert store.load_results("rsa")["encryption_overhead"].tolist() == [243.0, 243.0]
+    store.close()
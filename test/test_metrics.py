@@ -0,0 +1,77 @@
+import os
+import sys
+import threading
+import time
+import pytest
+
+# The servers' helper modules, as the servers import them
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "service", "common"))
+import metrics
+
+THREADS = 8
+REQUESTS = 500
+KEY = ("rsa", "single")
+
+@pytest.fixture
+def worker_metrics(monkeypatch):
+    # In memory, no file in METRICS_DIR
+    monkeypatch.setattr(metrics, "METRICS_DIR", "")
+    return metrics.Metrics("test", [KEY, ("rsa", "batch")], ("keygen",))
+
+# The worker's values, giving the other threads a turn between the read and the write of every
+# addition, where a free-threaded build or an unlucky switch would
+class YieldingValues:
+    def __init__(self, values):
+        self.values = values
+
+    def __getitem__(self, slot):
+        value = self.values[slot]
+        time.sleep(0)
+        return value
+
+    def __setitem__(self, slot, value):
+        self.values[slot] = value
+
+@pytest.fixture
+def racy_values(worker_metrics):
+    worker = worker_metrics.current()
+    worker.values = YieldingValues(worker.values)
+
+def hammer(target):
+    threads = [threading.Thread(target=target) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+# Every thread's requests are counted and in-flight comes back to zero
+def test_concurrent_recording_is_exact(worker_metrics, racy_values):
+    def serve():
+        for index in range(REQUESTS):
+            worker_metrics.request_started(KEY)
+            worker_metrics.record(KEY, 500 if index % 5 == 0 else 200, {"keygen": 0.002, "total": 0.004})
+            worker_metrics.executor_changed("rsa", queued=1, rejected=1)
+            worker_metrics.executor_changed("rsa", queued=-1)
+            worker_metrics.request_finished(KEY)
+
+    hammer(serve)
+    values, layout = worker_metrics.values(), worker_metrics.layout
+    total = THREADS * REQUESTS
+    assert values[layout.requests[KEY]] == total
+    assert values[layout.errors[KEY]] == total // 5
+    assert values[layout.in_flight[KEY]] == 0
+    assert values[layout.executor["rsa"]] == 0
+    assert values[layout.executor["rsa"] + 2] == total
+    keygen = layout.histograms[(*KEY, "keygen")]
+    assert sum(values[keygen:keygen + len(metrics.LATENCY_BUCKETS) + 1]) == total
+
+def test_exposition(worker_metrics):
+    worker_metrics.request_started(KEY)
+    worker_metrics.record(KEY, 200, {"keygen": 0.002})
+    worker_metrics.record(("rsa", "batch"), 503, {})
+    text = worker_metrics.exposition()
+    assert 'http_requests_total{protocol="rsa",route="single"} 1.0' in text
+    assert 'http_request_errors_total{protocol="rsa",route="batch"} 1.0' in text
+    assert 'http_requests_in_flight{protocol="rsa",route="single"} 1.0' in text
+    assert 'protocol_phase_seconds_bucket{protocol="rsa",route="single",phase="keygen",le="0.0025"} 1.0' in text
+    assert 'protocol_phase_seconds_count{protocol="rsa",route="single",phase="keygen"} 1.0' in text
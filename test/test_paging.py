@@ -0,0 +1,56 @@
+import pytest
+from fake_supabase import FakeConnection
+from utils import paging
+from utils.paging import keyset_rows
+
+# A bulk insert: every row gets the same created_at
+def bulk(conn, count, created_at, **row):
+    return conn.insert("protocol_performance", [{"protocol_name": "rsa", "created_at": created_at, **row}] * count)
+
+@pytest.fixture(autouse=True)
+def small_pages(monkeypatch):
+    monkeypatch.setattr(paging, "PAGE_ROWS", 3)
+
+def rsa_query(conn):
+    return lambda: conn.table("protocol_performance").select("id", "created_at").eq("protocol_name", "rsa")
+
+# Pages end in the middle of rows sharing a created_at, none is skipped or read twice
+def test_ties_across_pages():
+    conn = FakeConnection()
+    written = bulk(conn, 4, "2026-01-01T00:00:01+00:00") + bulk(conn, 3, "2026-01-01T00:00:02+00:00")
+    bulk(conn, 2, "2026-01-01T00:00:01+00:00", protocol_name="ecdh")
+    rows = keyset_rows(rsa_query(conn))
+    assert [row["id"] for row in rows] == [row["id"] for row in written]
+    # 7 rows in pages of 3, the last one short
+    assert len(conn.calls) == 3
+
+# Rows added past the cursor while paging are read once; the ones behind it are not (the history
+# cache re-reads an overlap for those)
+def test_rows_added_while_paging():
+    conn = FakeConnection()
+    bulk(conn, 3, "2026-01-01T00:00:01+00:00")
+    query = rsa_query(conn)
+
+    def query_adding_rows():
+        if len(conn.calls) == 1:
+            bulk(conn, 2, "2026-01-01T00:00:00+00:00")
+            bulk(conn, 2, "2026-01-01T00:00:03+00:00")
+        return query()
+
+    rows = keyset_rows(query_adding_rows)
+    assert [row["created_at"][17:19] for row in rows] == ["01", "01", "01", "03", "03"]
+    assert len({row["id"] for row in rows}) == 5
+
+# Newest first from a cursor, stopping at the limit
+def test_descending_with_limit_and_cursor():
+    conn = FakeConnection()
+    written = bulk(conn, 5, "2026-01-01T00:00:01+00:00") + bulk(conn, 2, "2026-01-01T00:00:02+00:00")
+    rows = keyset_rows(rsa_query(conn), descending=True, limit=4)
+    assert [row["id"] for row in rows] == [row["id"] for row in reversed(written)][:4]
+
+    cursor = (written[2]["created_at"], written[2]["id"])
+    assert [row["id"] for row in keyset_rows(rsa_query(conn), cursor=cursor)] == [row["id"] for row in written[3:]]
+    assert [row["id"] for row in keyset_rows(rsa_query(conn), cursor=cursor, descending=True)] == [written[1]["id"], written[0]["id"]]
+
+def test_no_rows():
+    assert keyset_rows(rsa_query(FakeConnection())) == []
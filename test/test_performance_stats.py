@@ -0,0 +1,83 @@
+import math
+import pandas as pd
+import pytest
+from utils.performance_stats import STATS_COLUMNS, aggregate_samples, by_bucket, overall, stats_frame
+
+NAN = float("nan")
+
+# Two protocols over two hourly buckets; the NULL time is left out of the time statistics but not
+# of the bandwidth mean, as the SQL aggregates do
+SAMPLES = pd.DataFrame({
+    "protocol_name": ["rsa", "rsa", "rsa", "rsa", "ecdh"],
+    "time_seconds": [0.1, 0.3, 0.5, None, 0.2],
+    "bandwidth": [1.0, 2.0, 3.0, 9.0, 4.0],
+    "encryption_overhead": [243.0, None, 243.0, None, None],
+    "created_at": pd.to_datetime(["2026-01-01T00:10:00Z", "2026-01-01T00:50:00Z", "2026-01-01T01:20:00Z",
+                                  "2026-01-01T00:20:00Z", "2026-01-01T00:30:00Z"], utc=True)
+})
+
+HOUR_0 = pd.Timestamp("2026-01-01T00:00:00Z")
+HOUR_1 = pd.Timestamp("2026-01-01T01:00:00Z")
+
+# protocol_name, bucket_start, samples, mean, stdev, min, p50, p90, p95, p99, max, bandwidth, overhead
+EXPECTED = [
+    ("ecdh", pd.NaT, 1, 0.2, NAN, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 4.0, NAN),
+    ("ecdh", HOUR_0, 1, 0.2, NAN, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 4.0, NAN),
+    ("rsa", pd.NaT, 3, 0.3, 0.2, 0.1, 0.3, 0.46, 0.48, 0.496, 0.5, 3.75, 243.0),
+    ("rsa", HOUR_0, 2, 0.2, math.sqrt(0.02), 0.1, 0.2, 0.28, 0.29, 0.298, 0.3, 4.0, 243.0),
+    ("rsa", HOUR_1, 1, 0.5, NAN, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 3.0, 243.0)
+]
+
+def assert_rows(stats, expected):
+    assert list(stats.columns) == list(STATS_COLUMNS)
+    assert len(stats) == len(expected)
+    for (_, row), values in zip(stats.iterrows(), expected):
+        assert row["protocol_name"] == values[0]
+        assert (pd.isna(row["bucket_start"]) and pd.isna(values[1])) or row["bucket_start"] == values[1]
+        assert row["samples"] == values[2]
+        assert list(row[list(STATS_COLUMNS[3:])]) == pytest.approx(list(values[3:]), nan_ok=True)
+
+# One overall row per protocol, then its buckets in time order
+def test_aggregate_samples():
+    stats = aggregate_samples(SAMPLES, bucket_seconds=3600)
+    assert_rows(stats, EXPECTED)
+    assert stats["samples"].dtype == int
+
+# A day bucket holds every sample of the day
+def test_aggregate_samples_day_buckets():
+    stats = aggregate_samples(SAMPLES[SAMPLES["protocol_name"] == "rsa"], bucket_seconds=86400)
+    assert list(stats["samples"]) == [3, 3]
+    assert stats["bucket_start"].iloc[1] == HOUR_0
+
+def test_aggregate_no_samples():
+    stats = aggregate_samples(pd.DataFrame())
+    assert stats.empty
+    assert list(stats.columns) == list(STATS_COLUMNS)
+
+# Rows as the RPC returns them: ISO strings, nulls and samples as a float
+def test_stats_frame_from_rpc_rows():
+    rows = [dict(zip(STATS_COLUMNS, values)) for values in [
+        ("rsa", None, 3.0, 0.3, 0.2, 0.1, 0.3, 0.46, 0.48, 0.496, 0.5, 3.0, 243),
+        ("rsa", "2026-01-01T00:00:00+00:00", 2.0, 0.2, None, 0.1, 0.2, 0.28, 0.29, 0.298, 0.3, 3.0, None)
+    ]]
+    stats = stats_frame(rows)
+    assert stats["samples"].tolist() == [3, 2]
+    assert pd.isna(stats["bucket_start"].iloc[0])
+    assert stats["bucket_start"].iloc[1] == HOUR_0
+    assert math.isnan(stats["stdev_seconds"].iloc[1])
+    assert stats["mean_encryption_overhead"].iloc[0] == 243.0
+
+def test_overall():
+    totals = overall(aggregate_samples(SAMPLES, bucket_seconds=3600))
+    assert list(totals.index) == ["ecdh", "rsa"]
+    assert totals.loc["rsa", "samples"] == 3
+    assert totals.loc["rsa", "p95_seconds"] == pytest.approx(0.48)
+
+# A column per protocol, a row per bucket, NaN where a protocol has no sample in the bucket
+def test_by_bucket():
+    means = by_bucket(aggregate_samples(SAMPLES, bucket_seconds=3600), "mean_seconds")
+    assert list(means.index) == [HOUR_0, HOUR_1]
+    assert list(means.columns) == ["ecdh", "rsa"]
+    assert means.loc[HOUR_0].tolist() == pytest.approx([0.2, 0.2])
+    assert means.loc[HOUR_1, "rsa"] == pytest.approx(0.5)
+    assert math.isnan(means.loc[HOUR_1, "ecdh"])
@@ -0,0 +1,70 @@
+import pytest
+from fake_supabase import FakeConnection, FakeError
+from utils.protocol_catalog import ProtocolCatalog
+
+TABLES = {
+    "protocols": [
+        {"name": "RSA", "endpoint": "rsa", "protocol_explanation": "RSA explained"},
+        {"name": "ECDH", "endpoint": "ecdh", "protocol_explanation": None}
+    ],
+    "protocol_visuals": [{"protocol_endpoint": "rsa", "storage_path": "visuals/rsa.png"}]
+}
+
+@pytest.fixture
+def conn():
+    return FakeConnection(TABLES)
+
+def test_lookups(conn):
+    catalog = ProtocolCatalog(conn)
+    assert catalog.endpoint("RSA") == "rsa"
+    assert catalog.endpoint("Enigma") is None
+    assert catalog.endpoints(["ECDH", "Enigma", "RSA"]) == {"ECDH": "ecdh", "RSA": "rsa"}
+    assert catalog.explanation_template("RSA") == "RSA explained"
+    assert catalog.visuals_path("rsa") == "visuals/rsa.png"
+    assert catalog.entry("ECDH") == {"name": "ECDH", "endpoint": "ecdh", "explanation_template": None, "visuals_path": None}
+    assert catalog.entry("Enigma") is None
+    assert list(catalog.protocols()["name"]) == ["RSA", "ECDH"]
+    assert list(catalog.details("ECDH")["endpoint"]) == ["ecdh"]
+    assert catalog.details("Enigma").empty
+
+# Two queries on first use, none while the copy is fresh
+def test_loaded_once_within_ttl(conn):
+    catalog = ProtocolCatalog(conn, ttl=300)
+    for _ in range(3):
+        catalog.endpoint("RSA")
+        catalog.protocols()
+    assert catalog.loads == 1
+    assert [call[0] for call in conn.calls] == ["protocols", "protocol_visuals"]
+
+def test_reloaded_when_expired_or_invalidated(conn):
+    catalog = ProtocolCatalog(conn, ttl=300)
+    catalog.endpoint("RSA")
+    conn.tables["protocols"].append({"name": "Kyber", "endpoint": "kyber"})
+    assert catalog.endpoint("Kyber") is None
+    catalog.invalidate()
+    assert catalog.endpoint("Kyber") == "kyber"
+    assert catalog.loads == 2
+
+    expired = ProtocolCatalog(conn, ttl=0)
+    expired.endpoint("RSA")
+    expired.endpoint("RSA")
+    assert expired.loads == 2
+
+# A failed refresh keeps the copy already loaded, a failed first load raises
+def test_failed_refresh_keeps_stale_copy(conn):
+    catalog = ProtocolCatalog(conn, ttl=300)
+    catalog.endpoint("RSA")
+    catalog.invalidate()
+    conn.fail_next = 1
+    assert catalog.endpoint("RSA") == "rsa"
+    assert catalog.loads == 1
+
+    conn.fail_next = 1
+    with pytest.raises(FakeError):
+        ProtocolCatalog(conn).endpoint("RSA")
+
+def test_empty_table():
+    catalog = ProtocolCatalog(FakeConnection())
+    assert catalog.protocols().empty
+    assert catalog.details("RSA").empty
+    assert catalog.endpoints(["RSA"]) == {}
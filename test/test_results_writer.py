@@ -0,0 +1,100 @@
+import pytest
+from fake_supabase import FakeConnection
+from utils import results_writer
+from utils.results_writer import BATCH_FUNCTION, ResultsWriter
+
+ENDPOINTS = {"RSA": "rsa", "ECDH": "ecdh"}
+
+# What sql/006_idempotent_result_writes.sql's save_performance_batch does
+def save_performance_batch(connection, params):
+    batch = params["batch"]
+    written = connection.insert("protocol_performance_batches", [batch], on_conflict="write_id")
+    if not written:
+        return next(row["id"] for row in connection.rows("protocol_performance_batches")
+                    if row["write_id"] == batch["write_id"])
+    connection.insert("protocol_performance", [{**sample, "protocol_name": batch["protocol_name"], "batch_id": written[0]["id"]}
+                                               for sample in params["samples"]], on_conflict="write_id")
+    return written[0]["id"]
+
+@pytest.fixture
+def conn():
+    return FakeConnection(functions={BATCH_FUNCTION: save_performance_batch})
+
+# Backoff delays instead of sleeping through them
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(results_writer.time, "sleep", delays.append)
+    return delays
+
+# Writes only on flush(), so what is added before it goes in one write
+@pytest.fixture
+def writer(conn, sleeps):
+    writer = ResultsWriter(conn, flush_seconds=30, max_retries=3, retry_seconds=0.1,
+                           resolve=lambda names: {name: ENDPOINTS[name] for name in names if name in ENDPOINTS})
+    yield writer
+    writer.close()
+
+def test_rows_written_with_one_upsert(conn, writer):
+    writer.add("RSA", {"time_seconds": 0.1})
+    writer.add("ECDH", {"time_seconds": 0.2})
+    assert writer.flush(timeout=5)
+    rows = conn.rows("protocol_performance")
+    assert sorted((row["protocol_name"], row["time_seconds"]) for row in rows) == [("ecdh", 0.2), ("rsa", 0.1)]
+    assert len({row["write_id"] for row in rows}) == 2
+    assert [call[:2] for call in conn.calls] == [("protocol_performance", "upsert")]
+    assert writer.stats()["written_rows"] == 2
+
+# A retry resends the same write_ids, so a write whose response was lost is not written twice
+def test_retry_after_lost_response_writes_once(conn, writer, sleeps):
+    conn.lose_next = 1
+    writer.add("RSA", {"time_seconds": 0.1})
+    assert writer.flush(timeout=5)
+    assert len(conn.rows("protocol_performance")) == 1
+    first, second = conn.calls
+    assert first == second
+    assert sleeps == [0.1]
+    assert writer.stats()["retries"] == 1
+    assert writer.take_failures() == (0, None)
+
+# Exponential backoff between attempts, the write goes through on the last one
+def test_backoff(conn, writer, sleeps):
+    conn.fail_next = 3
+    writer.add("RSA", {"time_seconds": 0.1})
+    assert writer.flush(timeout=5)
+    assert sleeps == pytest.approx([0.1, 0.2, 0.4])
+    assert len(conn.rows("protocol_performance")) == 1
+    assert writer.stats()["retries"] == 3
+
+# Rows that still fail after the retries are reported once by take_failures
+def test_take_failures(conn, writer):
+    conn.fail_next = 100
+    writer.add("RSA", {"time_seconds": 0.1})
+    writer.add("RSA", {"time_seconds": 0.2})
+    assert writer.flush(timeout=5)
+    failures, error = writer.take_failures()
+    assert failures == 2
+    assert error.startswith("Error saving to protocol_performance")
+    assert writer.take_failures() == (0, error)
+    assert writer.stats()["failed_rows"] == 2
+    assert conn.rows("protocol_performance") == []
+
+def test_unknown_protocol_fails(conn, writer):
+    writer.add("Enigma", {"time_seconds": 0.1})
+    assert writer.flush(timeout=5)
+    assert writer.take_failures() == (1, "Protocol endpoint not found: Enigma")
+
+# A batch and its samples go in with one call, a retry of it writes nothing more
+def test_batch_written_once_with_its_samples(conn, writer):
+    conn.lose_next = 1
+    writer.add_batch("RSA", {"mode": "full", "wire": "json", "iterations": 2, "warmup": 0, "summary": {}},
+                     [{"time_seconds": 0.1}, {"time_seconds": 0.3}])
+    assert writer.flush(timeout=5)
+    batches = conn.rows("protocol_performance_batches")
+    assert len(batches) == 1
+    assert batches[0]["protocol_name"] == "rsa"
+    samples = conn.rows("protocol_performance")
+    assert [row["time_seconds"] for row in samples] == [0.1, 0.3]
+    assert {row["batch_id"] for row in samples} == {batches[0]["id"]}
+    assert [call[:2] for call in conn.calls] == [(BATCH_FUNCTION, "rpc")] * 2
+    assert writer.take_failures() == (0, None)
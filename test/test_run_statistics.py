@@ -0,0 +1,52 @@
+import math
+import pytest
+from utils.run_statistics import percentile, remove_outliers, summarize, t_quantile
+
+# Linear interpolation between closest ranks, the ends are the extremes
+def test_percentile():
+    values = [1.0, 2.0, 3.0, 4.0]
+    assert percentile(values, 0) == 1.0
+    assert percentile(values, 100) == 4.0
+    assert percentile(values, 50) == pytest.approx(2.5)
+    assert percentile(values, 90) == pytest.approx(3.7)
+    assert percentile([5.0], 99) == 5.0
+    assert percentile([], 50) is None
+
+# Degrees of freedom between table entries use the next smaller one, beyond 30 the normal quantile
+def test_t_quantile():
+    assert t_quantile(1) == 12.706
+    assert t_quantile(11) == 2.228
+    assert t_quantile(30) == 2.042
+    assert t_quantile(31) == 1.960
+
+# A value far beyond Tukey's fences goes, the rest keep their order
+def test_remove_outliers():
+    kept, outliers = remove_outliers([3.0, 1.0, 2.0, 2.0, 50.0, 1.5])
+    assert kept == [3.0, 1.0, 2.0, 2.0, 1.5]
+    assert outliers == [50.0]
+
+# Too few values for quartiles are all kept
+def test_remove_outliers_few_values():
+    assert remove_outliers([1.0, 100.0, 1000.0]) == ([1.0, 100.0, 1000.0], [])
+
+def test_summarize():
+    summary = summarize([4.0, 2.0, 3.0, 1.0])
+    assert summary["count"] == 4
+    assert summary["mean"] == pytest.approx(2.5)
+    assert summary["median"] == pytest.approx(2.5)
+    assert summary["min"] == 1.0
+    assert summary["max"] == 4.0
+    assert summary["p25"] == pytest.approx(1.75)
+    stdev = math.sqrt(5 / 3)
+    assert summary["stdev"] == pytest.approx(stdev)
+    # t quantile for 3 degrees of freedom
+    half_width = 3.182 * stdev / 2
+    assert summary["ci95_low"] == pytest.approx(2.5 - half_width)
+    assert summary["ci95_high"] == pytest.approx(2.5 + half_width)
+
+# A single value has no spread, an empty run only a count
+def test_summarize_edge_cases():
+    summary = summarize([0.5])
+    assert summary["stdev"] == 0.0
+    assert summary["ci95_low"] == summary["ci95_high"] == 0.5
+    assert summarize([]) == {"count": 0}
@@ -1,6 +1,14 @@
 import streamlit as st
 from st_supabase_connection import SupabaseConnection
 import pandas as pd
+import queue
+import uuid
+from utils.history_cache import HistoryCache
+from utils.local_results import LOCAL_RESULTS_DB, LocalResultsStore
+from utils.paging import keyset_rows
+from utils.performance_stats import STATS_FUNCTION, STATS_BUCKET_SECONDS, stats_frame
+from utils.protocol_catalog import ProtocolCatalog
+from utils.results_writer import ResultsWriter
 
 # Supobase connection
 def get_connection():
@@ -15,56 +23,172 @@ def get_page_content(conn, section_key):
         return result.data[0]["content"]
     return None
 
+# Protocols table and visuals paths kept in memory for every session, reruns make no catalog query
+@st.cache_resource
+def get_protocol_catalog(_conn):
+    return ProtocolCatalog(_conn)
+
+# Reload the catalog on next use, e.g. after editing the protocols table
+def invalidate_protocol_catalog(conn):
+    get_protocol_catalog(conn).invalidate()
+
 # Obtain protocol data
 def get_protocols(conn):
-    protocols_result = conn.table("protocols").select("*").execute()
-    return pd.DataFrame(protocols_result.data) if protocols_result.data else pd.DataFrame()
+    return get_protocol_catalog(conn).protocols()
 
 # Obtain protocol details
 def get_protocol_details(conn, protocol_name):
-    protocol_details_res = conn.table("protocols").select("*").eq("name", protocol_name).execute()
-    return pd.DataFrame(protocol_details_res.data) if protocol_details_res.data else pd.DataFrame()
-
-# Save test results of test conducted into DB
-def save_test_results(conn, protocol_name, time_seconds, bandwidth, encryption_overhead):
-    res = conn.table("protocols").select("endpoint").eq("name", protocol_name).execute()
-    if res.data and len(res.data) > 0:
-        endpoint_value = res.data[0]['endpoint']
-        insert_res = conn.table("protocol_performance").insert({
-            "protocol_name": endpoint_value,
-            "time_seconds": time_seconds,
-            "bandwidth": bandwidth,
-            "encryption_overhead": encryption_overhead
-        }).execute()
-        insert_res_dict = insert_res.model_dump()
-        if insert_res_dict.get("error"):
-            st.error(f"Error saving test results: {insert_res_dict['error'].message}")
+    return get_protocol_catalog(conn).details(protocol_name)
+
+# Samples of the protocols kept in memory for every session, reruns only fetch the rows added since
+@st.cache_resource
+def get_history_cache(_conn):
+    return HistoryCache(_conn)
+
+# Fetch the whole history again on next use, e.g. after deleting results
+def invalidate_history_cache(conn):
+    get_history_cache(conn).invalidate()
+
+# Local results store opened once per file and shared by every session, instead of a new SQLite
+# connection on each rerun
+@st.cache_resource
+def get_local_results_store(path=LOCAL_RESULTS_DB):
+    return LocalResultsStore(path)
+
+# Write-behind writer of the test results, one per Supabase connection and shared by every session
+@st.cache_resource
+def get_results_writer(_conn):
+    return ResultsWriter(_conn, resolve=get_protocol_catalog(_conn).endpoints)
+
+# Save test results of test conducted into DB, timings is the optional per-phase breakdown (jsonb column).
+# A repeated run (see run_repeated) is passed as batch: its summary goes to protocol_performance_batches
+# and every iteration to protocol_performance tagged with the batch id, the single values are then unused.
+# The rows are only queued here, the results writer inserts them in bulk in the background.
+def save_test_results(conn, protocol_name, time_seconds=None, bandwidth=None, encryption_overhead=None, timings=None, batch=None):
+    writer = get_results_writer(conn)
+    try:
+        if batch is None:
+            row = {
+                "time_seconds": time_seconds,
+                "bandwidth": bandwidth,
+                "encryption_overhead": encryption_overhead
+            }
+            if timings is not None:
+                row["timings"] = timings
+            writer.add(protocol_name, row)
         else:
-            st.success("Test results saved successfully.")
-    else:
-        st.error("Protocol endpoint not found.")
+            writer.add_batch(protocol_name, {
+                "mode": batch["mode"],
+                "wire": batch["wire"],
+                "iterations": batch["iterations"],
+                "warmup": batch["warmup"],
+                "summary": batch["summary"]
+            }, [{
+                "time_seconds": sample["response_time"],
+                "cpu_seconds": sample["cpu_time"],
+                "bandwidth": sample["bandwidth"],
+                "encryption_overhead": sample["encryption_overhead"],
+                "timings": sample["timings"]
+            } for sample in batch["samples"]])
+    except (queue.Full, RuntimeError) as e:
+        st.error(f"Error saving test results: {e}")
+        return
+    # Earlier writes that failed for good are reported on the next save
+    failures, last_error = writer.take_failures()
+    if failures:
+        st.error(f"{failures} earlier result row(s) could not be saved: {last_error}")
+    st.success(f"Test results queued for saving ({writer.depth()} row(s) waiting).")
 
-# Load test results from DB
+# Load test results from DB, only the rows added since the last load are fetched
 def load_test_results(conn, protocol_name):
-    res = conn.table("protocols").select("endpoint").eq("name", protocol_name).execute()
-    if res.data and len(res.data) > 0:
-        endpoint_value = res.data[0]['endpoint']
-        results = conn.table("protocol_performance") \
-                     .select("time_seconds", "bandwidth", "encryption_overhead") \
-                     .eq("protocol_name", endpoint_value) \
-                     .order("created_at") \
-                     .execute()
-        return results.data if results.data else []
+    endpoint_value = get_protocol_catalog(conn).endpoint(protocol_name)
+    if endpoint_value is not None:
+        history = get_history_cache(conn).load(endpoint_value)
+        return history.drop(columns="created_at").astype(object).where(history.notna(), None).to_dict("records")
     else:
         st.error("Protocol endpoint not found for loading test results.")
         return []
 
+# Metric columns of the Compare tab
+COMPARISON_METRICS = ("time_seconds", "bandwidth", "encryption_overhead")
+
+# {name: endpoint} of the selected protocols, the ones without an endpoint reported
+def comparison_endpoints(conn, protocol_names):
+    endpoints = get_protocol_catalog(conn).endpoints(protocol_names)
+    missing = [name for name in protocol_names if name not in endpoints]
+    if missing:
+        st.error(f"Protocol endpoint not found for loading test results: {', '.join(missing)}")
+    return endpoints
+
+# Samples of every selected protocol with one filtered query (keyset paged, see utils/paging.py), oldest first,
+# as one wide DataFrame per metric with a column per protocol name, NaN padded like load_test_results
+# turned into Series would give. since / until limit it to the samples of a time window; without
+# them the samples come from the history cache, which holds the newest HISTORY_MAX_ROWS per endpoint.
+def load_comparison_frames(conn, protocol_names, metrics=COMPARISON_METRICS, since=None, until=None):
+    endpoints = comparison_endpoints(conn, protocol_names)
+    if endpoints and since is None and until is None:
+        cache = get_history_cache(conn)
+        samples = pd.concat([cache.load(endpoint)[list(metrics)].assign(protocol_name=endpoint)
+                             for endpoint in sorted(set(endpoints.values()))], ignore_index=True)
+    else:
+        def window_query():
+            query = conn.table("protocol_performance") \
+                        .select("id", "created_at", "protocol_name", *metrics) \
+                        .in_("protocol_name", sorted(set(endpoints.values())))
+            if since is not None:
+                query = query.gte("created_at", pd.Timestamp(since).isoformat())
+            if until is not None:
+                query = query.lt("created_at", pd.Timestamp(until).isoformat())
+            return query
+
+        rows = keyset_rows(window_query) if endpoints else []
+        samples = pd.DataFrame.from_records(rows, columns=["id", "created_at", "protocol_name", *metrics])
+
+    # Position of every sample within its protocol is the row index of the wide frames
+    samples["position"] = samples.groupby("protocol_name").cumcount()
+    frames = {}
+    for metric in metrics:
+        wide = samples.pivot(index="position", columns="protocol_name", values=metric)
+        frames[metric] = pd.DataFrame({
+            name: wide[endpoint].astype(float) if endpoint in wide else pd.Series(dtype=float)
+            for name, endpoint in endpoints.items()
+        }).reset_index(drop=True)
+    return frames
+
+# Count, mean, stdev and percentiles of the selected protocols, overall and per bucket_seconds bucket,
+# computed by the database (see utils/performance_stats.py). protocol_name holds the protocol names.
+def load_performance_stats(conn, protocol_names, bucket_seconds=STATS_BUCKET_SECONDS, since=None, until=None):
+    endpoints = comparison_endpoints(conn, protocol_names)
+    rows = []
+    if endpoints:
+        stats_res = conn.client.rpc(STATS_FUNCTION, {
+            "endpoints": sorted(set(endpoints.values())),
+            "bucket_seconds": int(bucket_seconds),
+            "since": None if since is None else pd.Timestamp(since).isoformat(),
+            "until": None if until is None else pd.Timestamp(until).isoformat()
+        }).execute()
+        # Endpoints back to the names shown, a shared endpoint is shown under every name
+        rows = [{**row, "protocol_name": name} for name, endpoint in endpoints.items()
+                for row in stats_res.data or [] if row["protocol_name"] == endpoint]
+    return stats_frame(rows)
+
+# Save a payload-size sweep (DataFrame from run_sweep), its rows share one sweep_id
+def save_payload_sweep(conn, sweep_df, mode, wire):
+    sweep_id = uuid.uuid4().hex
+    rows = [{**row, "sweep_id": sweep_id, "mode": mode, "wire": wire} for row in sweep_df.to_dict("records")]
+    insert_res = conn.table("protocol_payload_sweeps").insert(rows).execute()
+    insert_res_dict = insert_res.model_dump()
+    if insert_res_dict.get("error"):
+        st.error(f"Error saving payload sweep: {insert_res_dict['error'].message}")
+        return None
+    st.success("Payload sweep saved successfully.")
+    return sweep_id
+
+# Load every saved payload-size sweep, oldest first
+def load_payload_sweeps(conn):
+    res = conn.table("protocol_payload_sweeps").select("*").order("created_at").execute()
+    return pd.DataFrame(res.data) if res.data else pd.DataFrame()
+
 # Get storage url for supabase bucket
 def get_storage_path(conn, endpoint):
-    res = conn.table("protocol_visuals") \
-              .select("storage_path") \
-              .eq("protocol_endpoint", endpoint) \
-              .execute()
-    if res.data and len(res.data) > 0:
-        return res.data[0]["storage_path"]
-    return None
\ No newline at end of file
+    return get_protocol_catalog(conn).visuals_path(endpoint)
@@ -0,0 +1,159 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.paging import keyset_rows
+
+# Client-side copy of the protocol_performance samples of each endpoint, shared by every session
+# (see utils.database.get_history_cache). The first sync reads the newest HISTORY_MAX_ROWS rows of
+# the endpoint, newest first; later syncs only ask for the rows from HISTORY_OVERLAP_SECONDS before
+# the newest one held, so a rerun after a few new tests downloads a few rows instead of the whole
+# history. Both are keyset paged by (created_at, id) (see utils/paging.py). The samples are kept
+# as one numpy array per column, oldest first; the least recently used endpoints are dropped
+# beyond HISTORY_MAX_ENDPOINTS.
+HISTORY_MAX_ROWS = int(os.environ.get("HISTORY_MAX_ROWS", "50000"))
+HISTORY_MAX_ENDPOINTS = int(os.environ.get("HISTORY_MAX_ENDPOINTS", "16"))
+# created_at is when a row's transaction started, not when it committed: a slow or retried write
+# can become visible after rows with a later created_at were read. Each sync reads this far back
+# again and keeps the rows it does not hold yet (by id); rows committing later still than that are
+# only seen after invalidate().
+HISTORY_OVERLAP_SECONDS = float(os.environ.get("HISTORY_OVERLAP_SECONDS", "60"))
+
+HISTORY_COLUMNS = ("time_seconds", "bandwidth", "encryption_overhead")
+
+# Newest samples of one endpoint, a numpy array per column, oldest first by (created_at, id)
+class EndpointHistory:
+    def __init__(self, columns, max_rows):
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.created_at = np.array([], dtype="datetime64[us]")
+        self.ids = np.array([], dtype=np.int64)
+        self.columns = {column: np.array([], dtype=float) for column in columns}
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.created_at)
+
+    # Newest created_at held, None before the first sync
+    def newest(self):
+        return self.created_at[-1] if len(self.created_at) else None
+
+    # Adds the rows whose id is not held yet, in their place in the order; returns how many
+    def merge(self, rows):
+        created_at = pd.to_datetime([row["created_at"] for row in rows], utc=True, format="ISO8601") \
+                       .tz_localize(None).to_numpy(dtype="datetime64[us]")
+        ids = np.array([row["id"] for row in rows], dtype=np.int64)
+        new = ~np.isin(ids, self.ids)
+        # Once full, rows older than the oldest held were evicted (or would be at once)
+        if len(self.created_at) >= self.max_rows:
+            new &= created_at >= self.created_at[0]
+        if not new.any():
+            return 0
+        rows = [row for row, keep in zip(rows, new) if keep]
+        late = len(self.created_at) and created_at[new].min() < self.created_at[-1]
+        self.created_at = np.concatenate((self.created_at, created_at[new]))
+        self.ids = np.concatenate((self.ids, ids[new]))
+        for column in self.columns:
+            values = np.array([np.nan if row.get(column) is None else row[column] for row in rows], dtype=float)
+            self.columns[column] = np.concatenate((self.columns[column], values))
+        # Rows that committed late go back in order, so the oldest are the ones evicted
+        if late:
+            order = np.lexsort((self.ids, self.created_at))
+            self.created_at, self.ids = self.created_at[order], self.ids[order]
+            self.columns = {column: values[order] for column, values in self.columns.items()}
+        excess = len(self.created_at) - self.max_rows
+        if excess > 0:
+            self.created_at, self.ids = self.created_at[excess:], self.ids[excess:]
+            self.columns = {column: values[excess:] for column, values in self.columns.items()}
+            self.evicted += excess
+        return len(rows)
+
+    # Copy of the held samples, created_at as UTC timestamps
+    def frame(self):
+        with self.lock:
+            frame = pd.DataFrame({column: values.copy() for column, values in self.columns.items()})
+            frame["created_at"] = pd.to_datetime(self.created_at).tz_localize("UTC")
+        return frame
+
+class HistoryCache:
+    def __init__(self, conn, columns=HISTORY_COLUMNS, max_rows=HISTORY_MAX_ROWS, max_endpoints=HISTORY_MAX_ENDPOINTS,
+                 overlap_seconds=HISTORY_OVERLAP_SECONDS):
+        self.conn = conn
+        self.columns = tuple(columns)
+        self.max_rows = max_rows
+        self.max_endpoints = max_endpoints
+        self.overlap = np.timedelta64(int(overlap_seconds * 1e6), "us")
+        self.lock = threading.Lock()
+        self.histories = OrderedDict()
+        self.syncs = 0
+        self.fetched_rows = 0
+        self.new_rows = 0
+        self.evicted_endpoints = 0
+
+    # History of the endpoint, created empty, marked as the most recently used one
+    def history(self, endpoint):
+        with self.lock:
+            history = self.histories.get(endpoint)
+            if history is None:
+                history = self.histories[endpoint] = EndpointHistory(self.columns, self.max_rows)
+                while len(self.histories) > self.max_endpoints:
+                    self.histories.popitem(last=False)
+                    self.evicted_endpoints += 1
+            self.histories.move_to_end(endpoint)
+            return history
+
+    # The newest max_rows rows of the endpoint the first time (newest is None), then the rows from
+    # the overlap before newest on; oldest first either way
+    def fetch(self, endpoint, newest):
+        def endpoint_query():
+            query = self.conn.table("protocol_performance") \
+                        .select("id", "created_at", *self.columns) \
+                        .eq("protocol_name", endpoint)
+            if newest is not None:
+                query = query.gte("created_at", pd.Timestamp(newest - self.overlap, tz="UTC").isoformat())
+            return query
+
+        if newest is None:
+            return keyset_rows(endpoint_query, descending=True, limit=self.max_rows)[::-1]
+        return keyset_rows(endpoint_query)
+
+    # Brings the endpoint's history up to date with the rows added since the last sync, returns
+    # the number of new rows
+    def sync(self, endpoint):
+        history = self.history(endpoint)
+        with history.lock:
+            rows = self.fetch(endpoint, history.newest())
+            added = history.merge(rows) if rows else 0
+        with self.lock:
+            self.syncs += 1
+            self.fetched_rows += len(rows)
+            self.new_rows += added
+        return added
+
+    # Synced samples of the endpoint (the newest max_rows), created_at as UTC timestamps
+    def load(self, endpoint):
+        self.sync(endpoint)
+        return self.history(endpoint).frame()
+
+    # Forget the endpoint, or everything, e.g. after rows were deleted; the next sync starts over
+    def invalidate(self, endpoint=None):
+        with self.lock:
+            if endpoint is None:
+                self.histories.clear()
+            else:
+                self.histories.pop(endpoint, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'endpoints': len(self.histories),
+                'held_rows': sum(len(history) for history in self.histories.values()),
+                'evicted_rows': sum(history.evicted for history in self.histories.values()),
+                'evicted_endpoints': self.evicted_endpoints,
+                'syncs': self.syncs,
+                'fetched_rows': self.fetched_rows,
+                'new_rows': self.new_rows
+            }
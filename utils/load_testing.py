@@ -0,0 +1,252 @@
+import argparse
+import csv
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+# Load generator for server 1's protocol endpoints. Workers share an open-loop schedule when a
+# rate is given (latency counts from the planned start, so a stalled server is not hidden by
+# workers simply sending less) and run back to back otherwise.
+#
+# Usage: python -m utils.load_testing --url http://localhost:5000 --concurrency 16 --rate 50 \
+#            --duration 30 --mix ecdh=3,rsa=1,kyber=1 --output load_run.csv --store local_results.sqlite
+
+DEFAULT_MESSAGE = "Hello, World!"
+
+# Columns written per request, the first ones match protocol_performance so the Compare tab can load them
+CSV_COLUMNS = ["protocol_name", "time_seconds", "bandwidth", "encryption_overhead", "created_at", "status", "success", "error"]
+
+# Latency histogram in the spirit of HdrHistogram: every power of two is split in 2^SUB_BUCKET_BITS
+# linear buckets, so any recorded value is kept with under 1/2^SUB_BUCKET_BITS relative error
+# in constant memory, and histograms from several workers or runs simply add up
+class LatencyHistogram:
+    SUB_BUCKET_BITS = 7
+    UNIT = 1e-6  # values are recorded in whole microseconds
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.total = 0
+        self.min = math.inf
+        self.max = 0.0
+        self.sum = 0.0
+
+    def _index(self, units):
+        if units < (1 << self.SUB_BUCKET_BITS):
+            return units
+        shift = units.bit_length() - self.SUB_BUCKET_BITS - 1
+        return ((shift + 1) << self.SUB_BUCKET_BITS) + (units >> shift) - (1 << self.SUB_BUCKET_BITS)
+
+    def _value(self, index):
+        if index < (1 << self.SUB_BUCKET_BITS):
+            return index * self.UNIT
+        shift = (index >> self.SUB_BUCKET_BITS) - 1
+        mantissa = (index & ((1 << self.SUB_BUCKET_BITS) - 1)) + (1 << self.SUB_BUCKET_BITS)
+        # Middle of the bucket
+        return ((mantissa << shift) + (1 << shift) / 2) * self.UNIT
+
+    def record(self, seconds):
+        self.counts[self._index(max(0, int(seconds / self.UNIT)))] += 1
+        self.total += 1
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.sum += seconds
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] += count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sum += other.sum
+
+    # Value at the given percentile (0-100), clamped to the exact min and max seen
+    def percentile(self, percent):
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(percent / 100 * self.total))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.sum / self.total if self.total else None
+
+# Protocol weights from "ecdh=3,rsa=1" (a bare name counts as weight 1)
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.strip().partition("=")
+        if name:
+            mix[name] = float(weight) if weight else 1.0
+    if not mix or any(weight <= 0 for weight in mix.values()):
+        raise ValueError(f"Invalid protocol mix: {text}")
+    return mix
+
+# Hands out planned start times at the target rate, or "now" when the run is closed-loop
+class Schedule:
+    def __init__(self, rate, duration, max_requests):
+        self.rate = rate
+        self.max_requests = max_requests
+        self.start = time.perf_counter()
+        self.deadline = self.start + duration if duration else math.inf
+        self.issued = 0
+        self.lock = threading.Lock()
+
+    # Planned start of the next request, None once the run is over
+    def next(self):
+        with self.lock:
+            if self.max_requests is not None and self.issued >= self.max_requests:
+                return None
+            planned = self.start + self.issued / self.rate if self.rate else time.perf_counter()
+            if planned >= self.deadline:
+                return None
+            self.issued += 1
+            return planned
+
+# One request against server 1, returns the row written to the results file
+def call_endpoint(session, base_url, protocol, message, wire, planned):
+    delay = planned - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+
+    row = {"protocol_name": protocol, "encryption_overhead": None, "error": None}
+    request_size = 0
+    try:
+        if protocol == "rsa":
+            body = json.dumps({"message": message})
+            request_size = len(body.encode("utf-8"))
+            response = session.post(f"{base_url}/{protocol}", data=body, params={"wire": wire},
+                                    headers={"Content-Type": "application/json"})
+        else:
+            response = session.get(f"{base_url}/{protocol}", params={"wire": wire})
+        elapsed = time.perf_counter() - planned
+
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        row["status"] = response.status_code
+        row["success"] = response.status_code == 200 and payload.get("success", True)
+        if not row["success"]:
+            row["error"] = payload.get("error", f"HTTP {response.status_code}")
+        # In raw bytes, as test_protocol records it (the hex text would count every byte twice)
+        if protocol == "rsa" and row["success"]:
+            row["encryption_overhead"] = payload.get("expansion_bytes")
+            if row["encryption_overhead"] is None:
+                row["encryption_overhead"] = len(bytes.fromhex(payload.get("encrypted_message", ""))) - len(message.encode("utf-8"))
+        row["bandwidth"] = (request_size + len(response.content)) * 8 / (elapsed * 1e6) if elapsed > 0 else 0
+    except Exception as e:
+        elapsed = time.perf_counter() - planned
+        row.update({"status": None, "success": False, "error": str(e), "bandwidth": None})
+
+    row["time_seconds"] = elapsed
+    row["created_at"] = datetime.now(timezone.utc).isoformat()
+    return row
+
+# Runs the load and returns (rows, per protocol histograms, wall seconds)
+def run_load(base_url, mix, concurrency=8, rate=None, duration=10.0, max_requests=None,
+             message=DEFAULT_MESSAGE, wire="json", seed=None):
+    names, weights = list(mix), list(mix.values())
+    schedule = Schedule(rate, duration, max_requests)
+    rows, rows_lock = [], threading.Lock()
+
+    def worker(worker_id):
+        chooser = random.Random(None if seed is None else seed + worker_id)
+        session = requests.Session()
+        local_rows = []
+        while (planned := schedule.next()) is not None:
+            protocol = chooser.choices(names, weights)[0]
+            local_rows.append(call_endpoint(session, base_url, protocol, message, wire, planned))
+        with rows_lock:
+            rows.extend(local_rows)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker, worker_id) for worker_id in range(concurrency)]:
+            future.result()
+    wall_seconds = time.perf_counter() - schedule.start
+
+    histograms = defaultdict(LatencyHistogram)
+    for row in rows:
+        if row["success"]:
+            histograms[row["protocol_name"]].record(row["time_seconds"])
+    return rows, histograms, wall_seconds
+
+# Throughput, error rate and latency percentiles per protocol, plus an "all" line
+def summarize(rows, histograms, wall_seconds):
+    summary = {}
+    overall = LatencyHistogram()
+    for protocol in sorted({row["protocol_name"] for row in rows}):
+        protocol_rows = [row for row in rows if row["protocol_name"] == protocol]
+        histogram = histograms.get(protocol, LatencyHistogram())
+        overall.merge(histogram)
+        summary[protocol] = summary_line(len(protocol_rows), histogram, wall_seconds)
+    summary["all"] = summary_line(len(rows), overall, wall_seconds)
+    return summary
+
+def summary_line(requests_sent, histogram, wall_seconds):
+    errors = requests_sent - histogram.total
+    return {
+        "requests": requests_sent,
+        "errors": errors,
+        "error_rate": errors / requests_sent if requests_sent else 0.0,
+        "throughput_rps": histogram.total / wall_seconds if wall_seconds > 0 else 0.0,
+        "mean_seconds": histogram.mean(),
+        **{f"p{label}_seconds": histogram.percentile(percent)
+           for label, percent in (("50", 50), ("90", 90), ("99", 99), ("99_9", 99.9))},
+        "max_seconds": histogram.max if histogram.total else None
+    }
+
+def write_rows(path, rows):
+    with open(path, "w", newline="") as output:
+        writer = csv.DictWriter(output, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        for row in sorted(rows, key=lambda row: row["created_at"]):
+            writer.writerow({column: row.get(column) for column in CSV_COLUMNS})
+
+def print_summary(summary):
+    print(f"{'protocol':16}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'p99.9 ms':>10}")
+    for protocol, line in summary.items():
+        cells = [line[f"p{label}_seconds"] for label in ("50", "90", "99", "99_9")]
+        latencies = "".join(f"{cell * 1000:>9.2f}" if cell is not None else f"{'-':>9}" for cell in cells)
+        print(f"{protocol:16}{line['requests']:>9}{line['errors']:>8}{line['throughput_rps']:>9.1f}{latencies}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load test of server 1's protocol endpoints")
+    parser.add_argument("--url", default="http://localhost:5000", help="server 1 base URL (docker-compose default)")
+    parser.add_argument("--mix", default="diffie_hellman,ecdh,rsa,kyber,ntru", help="endpoints with optional weights, e.g. ecdh=3,rsa=1")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=None, help="target requests per second over all workers (default: as fast as possible)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=None, help="stop after this many requests")
+    parser.add_argument("--message", default=DEFAULT_MESSAGE, help="message sent to /rsa")
+    parser.add_argument("--wire", default="json", choices=["json", "binary"])
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="CSV with one row per request, loadable in the Compare tab")
+    parser.add_argument("--summary", help="JSON file for the per-protocol summary")
+    parser.add_argument("--store", help="SQLite file of utils/local_results.py to append the rows to")
+    args = parser.parse_args()
+
+    rows, histograms, wall_seconds = run_load(args.url.rstrip("/"), parse_mix(args.mix), args.concurrency, args.rate,
+                                              args.duration, args.requests, args.message, args.wire, args.seed)
+    summary = summarize(rows, histograms, wall_seconds)
+    print_summary(summary)
+    if args.output:
+        write_rows(args.output, rows)
+    if args.store:
+        from utils.local_results import LocalResultsStore
+        store = LocalResultsStore(args.store)
+        print(f"{store.append(sorted(rows, key=lambda row: row['created_at']))} rows appended to {args.store}")
+        store.close()
+    if args.summary:
+        with open(args.summary, "w") as output:
+            json.dump({"settings": vars(args), "wall_seconds": wall_seconds, "protocols": summary}, output, indent=2)
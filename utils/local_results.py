@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from utils.performance_stats import STATS_BUCKET_SECONDS, aggregate_samples
+
+# Local results backend for runs too big, or too offline, for Supabase: an SQLite file with the
+# columns of protocol_performance, filled with batched appends (one transaction per batch, WAL
+# journal) and indexed on protocol and time, so the Compare tab can read millions of samples
+# without a network round trip per row. Exports to Parquet in row groups, the whole table never
+# has to fit in memory. pyarrow is only needed for the export.
+#
+# Usage: python -m utils.local_results ingest load_run.csv
+#        python -m utils.local_results export results.parquet --protocol rsa
+#        python -m utils.local_results summary
+LOCAL_RESULTS_DB = os.environ.get("LOCAL_RESULTS_DB", "local_results.sqlite")
+
+# Rows per executemany call and per Parquet row group
+APPEND_BATCH_ROWS = 10_000
+EXPORT_BATCH_ROWS = 100_000
+
+# Same names as protocol_performance, plus the outcome columns the load test writes.
+# protocol_name holds the endpoint, as in Supabase; created_at is in seconds since the epoch.
+COLUMNS = ("protocol_name", "time_seconds", "cpu_seconds", "bandwidth", "encryption_overhead", "timings",
+           "batch_id", "status", "success", "error", "created_at")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS protocol_performance (
+    id INTEGER PRIMARY KEY,
+    protocol_name TEXT NOT NULL,
+    time_seconds REAL,
+    cpu_seconds REAL,
+    bandwidth REAL,
+    encryption_overhead REAL,
+    timings TEXT,
+    batch_id TEXT,
+    status INTEGER,
+    success INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS protocol_performance_protocol_created ON protocol_performance (protocol_name, created_at);
+CREATE INDEX IF NOT EXISTS protocol_performance_created ON protocol_performance (created_at);
+-- RSA overhead recorded as hex text length before it was raw bytes, see sql/005_rsa_overhead_raw_bytes.sql
+UPDATE protocol_performance SET encryption_overhead = encryption_overhead - 256
+    WHERE protocol_name = 'rsa' AND encryption_overhead > 256;
+"""
+
+# Metric columns of the Compare tab
+METRICS = ("time_seconds", "bandwidth", "encryption_overhead")
+
+# Seconds since the epoch from an ISO string (as written by Supabase or the load test), a datetime or a number
+def epoch_seconds(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return time.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+# Missing values (None, NaN, pandas NA) as None, what sqlite3 stores as NULL
+def cell(value):
+    return None if value is None or value is pd.NA or (isinstance(value, float) and value != value) else value
+
+def row_values(row):
+    timings = cell(row.get("timings"))
+    success = cell(row.get("success"))
+    return (
+        row["protocol_name"],
+        cell(row.get("time_seconds")),
+        cell(row.get("cpu_seconds")),
+        cell(row.get("bandwidth")),
+        cell(row.get("encryption_overhead")),
+        json.dumps(timings) if isinstance(timings, dict) else timings,
+        cell(row.get("batch_id")),
+        cell(row.get("status")),
+        None if success is None else int(success in (True, 1, "True", "true")),
+        cell(row.get("error")),
+        epoch_seconds(cell(row.get("created_at")))
+    )
+
+class LocalResultsStore:
+    def __init__(self, path=LOCAL_RESULTS_DB):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    # Appends rows (dicts with the COLUMNS, missing ones are NULL) in batches, all or nothing.
+    # Returns the number of rows written.
+    def append(self, rows):
+        insert = f"INSERT INTO protocol_performance ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        written = 0
+        batch = []
+        with self.lock, self.connection:
+            for row in rows:
+                batch.append(row_values(row))
+                if len(batch) == APPEND_BATCH_ROWS:
+                    self.connection.executemany(insert, batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                self.connection.executemany(insert, batch)
+                written += len(batch)
+        return written
+
+    def append_frame(self, frame):
+        return self.append(frame.to_dict("records"))
+
+    # A results CSV (utils/load_testing.py --output) read and appended chunk by chunk
+    def ingest_csv(self, path):
+        written = 0
+        for chunk in pd.read_csv(path, chunksize=APPEND_BATCH_ROWS):
+            written += self.append_frame(chunk)
+        return written
+
+    def query(self, sql, parameters=()):
+        with self.lock:
+            return pd.read_sql_query(sql, self.connection, params=parameters)
+
+    # successful leaves out the requests that failed; rows without an outcome (success is NULL, as
+    # in protocol_performance, which only ever holds successful tests) are kept
+    def where(self, protocol_name=None, since=None, until=None, successful=False):
+        clauses, parameters = [], []
+        if successful:
+            clauses.append("success IS NOT 0")
+        if protocol_name is not None:
+            clauses.append("protocol_name = ?")
+            parameters.append(protocol_name)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            parameters.append(epoch_seconds(since))
+        if until is not None:
+            clauses.append("created_at < ?")
+            parameters.append(epoch_seconds(until))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), parameters
+
+    # Samples of the successful requests of one endpoint, oldest first, created_at as UTC timestamps.
+    # A failed request's time is how long it took to fail, not a measurement of the protocol.
+    def load_results(self, protocol_name, columns=METRICS, since=None, until=None):
+        where, parameters = self.where(protocol_name, since, until, successful=True)
+        frame = self.query(f"SELECT {', '.join(columns)}, created_at FROM protocol_performance{where} ORDER BY created_at",
+                           parameters)
+        frame["created_at"] = pd.to_datetime(frame["created_at"], unit="s", utc=True)
+        return frame
+
+    # Same list of dicts as utils.database.load_test_results, for an endpoint
+    def load_test_results(self, protocol_name):
+        return self.load_results(protocol_name).drop(columns="created_at").to_dict("records")
+
+    # One wide DataFrame per metric, a column per protocol label, as the Compare tab builds them.
+    # endpoints maps the label shown to the endpoint the samples are stored under.
+    def comparison_frames(self, endpoints, since=None, until=None):
+        samples = {label: self.load_results(endpoint, since=since, until=until) for label, endpoint in endpoints.items()}
+        return {
+            metric: pd.DataFrame({label: frame[metric] for label, frame in samples.items()})
+            for metric in METRICS
+        }
+
+    # Same statistics as utils.database.load_performance_stats, computed from the local samples,
+    # under the labels of endpoints ({label: endpoint})
+    def performance_stats(self, endpoints, bucket_seconds=STATS_BUCKET_SECONDS, since=None, until=None):
+        frames = [self.load_results(endpoint, since=since, until=until).assign(protocol_name=label)
+                  for label, endpoint in endpoints.items()]
+        return aggregate_samples(pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(), bucket_seconds)
+
+    # Rows and time span per endpoint
+    def summary(self):
+        frame = self.query("SELECT protocol_name, COUNT(*) AS samples, MIN(created_at) AS first, MAX(created_at) AS last "
+                           "FROM protocol_performance GROUP BY protocol_name ORDER BY protocol_name")
+        for column in ("first", "last"):
+            frame[column] = pd.to_datetime(frame[column], unit="s", utc=True)
+        return frame
+
+    # Parquet file of the (filtered) table, written EXPORT_BATCH_ROWS rows at a time. Returns the row count.
+    def export_parquet(self, path, protocol_name=None, since=None, until=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow") from e
+
+        schema = pa.schema([
+            ("id", pa.int64()), ("protocol_name", pa.string()), ("time_seconds", pa.float64()),
+            ("cpu_seconds", pa.float64()), ("bandwidth", pa.float64()), ("encryption_overhead", pa.float64()),
+            ("timings", pa.string()), ("batch_id", pa.string()), ("status", pa.int64()), ("success", pa.bool_()),
+            ("error", pa.string()), ("created_at", pa.timestamp("us", tz="UTC"))
+        ])
+        where, parameters = self.where(protocol_name, since, until)
+        written = 0
+        with self.lock, pq.ParquetWriter(path, schema) as writer:
+            cursor = self.connection.execute(f"SELECT id, {', '.join(COLUMNS)} FROM protocol_performance{where} ORDER BY id",
+                                             parameters)
+            while rows := cursor.fetchmany(EXPORT_BATCH_ROWS):
+                columns = dict(zip(schema.names, zip(*rows)))
+                columns["success"] = [None if value is None else bool(value) for value in columns["success"]]
+                columns["created_at"] = [int(value * 1e6) for value in columns["created_at"]]
+                writer.write_batch(pa.record_batch([pa.array(columns[name], type=field.type) for name, field in
+                                                    zip(schema.names, schema)], schema=schema))
+                written += len(rows)
+        return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local results store for offline and high volume benchmark runs")
+    parser.add_argument("--db", default=LOCAL_RESULTS_DB, help="SQLite file (LOCAL_RESULTS_DB)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="append a results CSV written by utils/load_testing.py")
+    ingest.add_argument("csv", nargs="+")
+    export = commands.add_parser("export", help="write the results to a Parquet file")
+    export.add_argument("parquet")
+    export.add_argument("--protocol", help="only this endpoint")
+    export.add_argument("--since", help="ISO timestamp, only samples from then on")
+    export.add_argument("--until", help="ISO timestamp, only samples before then")
+    commands.add_parser("summary", help="samples and time span per endpoint")
+    args = parser.parse_args()
+
+    store = LocalResultsStore(args.db)
+    if args.command == "ingest":
+        for path in args.csv:
+            print(f"{path}: {store.ingest_csv(path)} rows")
+    elif args.command == "export":
+        print(f"{store.export_parquet(args.parquet, args.protocol, args.since, args.until)} rows written to {args.parquet}")
+    else:
+        print(store.summary().to_string(index=False))
+    store.close()
@@ -0,0 +1,34 @@
+# protocol_performance rows read PAGE_ROWS at a time by keyset instead of offset: ordered by
+# (created_at, id), each page asks for the rows past the last one of the page before. created_at
+# is not unique (the rows of one bulk insert share it), id breaks the ties, so rows are neither
+# skipped nor read twice when rows are added while paging.
+
+# Rows per request, what the API returns at most
+PAGE_ROWS = 1000
+
+# PostgREST filter of the rows after the (created_at, id) cursor, before it when descending.
+# created_at is the string the API returned, so no precision is lost.
+def past(cursor, descending=False):
+    created_at, row_id = cursor
+    operator = "lt" if descending else "gt"
+    return f"created_at.{operator}.{created_at},and(created_at.eq.{created_at},id.{operator}.{row_id})"
+
+def cursor_of(row):
+    return row["created_at"], row["id"]
+
+# make_query returns a new filtered select of the rows, created_at and id among its columns. Rows
+# past cursor, oldest first (newest first when descending), at most limit of them.
+def keyset_rows(make_query, cursor=None, descending=False, limit=None):
+    rows = []
+    while limit is None or len(rows) < limit:
+        query = make_query()
+        if cursor is not None:
+            query = query.or_(past(cursor, descending))
+        page_rows = PAGE_ROWS if limit is None else min(PAGE_ROWS, limit - len(rows))
+        page = query.order("created_at", desc=descending).order("id", desc=descending) \
+                    .limit(page_rows).execute().data or []
+        rows += page
+        if len(page) < page_rows:
+            break
+        cursor = cursor_of(page[-1])
+    return rows
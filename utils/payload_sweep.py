@@ -0,0 +1,54 @@
+import pandas as pd
+from utils.protocol_testing import run_repeated
+
+# Payload-size sweep: the message endpoints run over a range of message sizes, so the cost of each
+# protocol can be read as a function of how much data it carries instead of a single point.
+
+# Longest message PKCS#1 v1.5 fits in a 2048-bit RSA key: 256 byte modulus minus 11 bytes of padding
+RSA_MAX_MESSAGE_BYTES = 2048 // 8 - 11
+
+DEFAULT_SIZES = (1, 16, 32, 64, 128, 192, RSA_MAX_MESSAGE_BYTES)
+
+# Label shown in the Compare tab for each message endpoint of server 1
+SWEEP_ENDPOINTS = {
+    "RSA (PKCS#1 v1.5)": "rsa",
+    "Kyber + ChaCha20-Poly1305": "kem/kyber",
+    "NTRU + ChaCha20-Poly1305": "kem/ntru"
+}
+
+# Sizes from "1, 16, 64-245" style text, only RSA is held to its padding limit
+def parse_sizes(text):
+    sizes = set()
+    for item in text.split(","):
+        first, _, last = item.strip().partition("-")
+        if first:
+            sizes.update(range(int(first), int(last) + 1) if last else [int(first)])
+    if not sizes or min(sizes) < 1:
+        raise ValueError(f"Invalid payload sizes: {text}")
+    return sorted(sizes)
+
+# One row per (endpoint, size): latency statistics, ciphertext expansion in raw bytes and
+# throughput of payload data over the whole measured loop
+def run_sweep(endpoints, sizes, iterations=10, warmup=2, wire="json", mode="full", progress=None):
+    points = [(endpoint, size) for endpoint in endpoints for size in sizes
+              if endpoint != "rsa" or size <= RSA_MAX_MESSAGE_BYTES]
+    rows = []
+    for done, (endpoint, size) in enumerate(points):
+        run = run_repeated(endpoint, "a" * size, wire, mode, iterations, warmup)
+        latency = run["summary"]["latency_seconds"]
+        loop_seconds = run["summary"]["throughput"]["loop_seconds"]
+        last = run["samples"][-1]["response_json"]
+        rows.append({
+            "endpoint": endpoint,
+            "payload_bytes": size,
+            "iterations": iterations,
+            "median_seconds": latency["median"],
+            "mean_seconds": latency["mean"],
+            "p95_seconds": latency["p95"],
+            "ciphertext_bytes": last.get("ciphertext_bytes"),
+            "expansion_bytes": last.get("expansion_bytes"),
+            "payload_mbps": size * iterations * 8 / (loop_seconds * 1e6) if loop_seconds > 0 else 0
+        })
+        if progress:
+            progress(done + 1, len(points))
+    return pd.DataFrame(rows)
@@ -0,0 +1,80 @@
+import os
+
+import pandas as pd
+
+from utils.run_statistics import percentile
+
+# Statistics the Compare tab is drawn from, computed by the database with the
+# protocol_performance_stats function of sql/004_protocol_performance_stats.sql: per endpoint one
+# overall row (bucket_start is NaT) and one row per time bucket, so the tab no longer downloads every
+# sample. aggregate_samples is the same computation in pandas, for the local results store and to
+# check the SQL against.
+STATS_FUNCTION = "protocol_performance_stats"
+
+# Bucket widths offered by the tab, in seconds
+BUCKETS = {"Hour": 3600, "Day": 86400, "Week": 604800}
+STATS_BUCKET_SECONDS = int(os.environ.get("STATS_BUCKET_SECONDS", str(BUCKETS["Day"])))
+
+# Columns returned by protocol_performance_stats, in its order
+STATS_COLUMNS = ("protocol_name", "bucket_start", "samples", "mean_seconds", "stdev_seconds", "min_seconds",
+                 "p50_seconds", "p90_seconds", "p95_seconds", "p99_seconds", "max_seconds", "mean_bandwidth",
+                 "mean_encryption_overhead")
+
+# Statistics of the time_seconds values of one group, NULLs ignored as SQL aggregates do
+def time_statistics(values):
+    ordered = sorted(values.dropna().astype(float))
+    count = len(ordered)
+    mean = sum(ordered) / count if count else None
+    return {
+        "samples": count,
+        "mean_seconds": mean,
+        # stddev_samp is NULL for fewer than two values
+        "stdev_seconds": (sum((value - mean) ** 2 for value in ordered) / (count - 1)) ** 0.5 if count > 1 else None,
+        "min_seconds": ordered[0] if count else None,
+        "p50_seconds": percentile(ordered, 50),
+        "p90_seconds": percentile(ordered, 90),
+        "p95_seconds": percentile(ordered, 95),
+        "p99_seconds": percentile(ordered, 99),
+        "max_seconds": ordered[-1] if count else None
+    }
+
+def group_statistics(protocol_name, bucket_start, group):
+    return {
+        "protocol_name": protocol_name,
+        "bucket_start": bucket_start,
+        **time_statistics(group["time_seconds"]),
+        "mean_bandwidth": group["bandwidth"].astype(float).mean(),
+        "mean_encryption_overhead": group["encryption_overhead"].astype(float).mean()
+    }
+
+# What protocol_performance_stats returns, from samples with protocol_name, time_seconds, bandwidth,
+# encryption_overhead and created_at (UTC timestamps). Buckets start at multiples of bucket_seconds
+# since the epoch, like the SQL.
+def aggregate_samples(samples, bucket_seconds=STATS_BUCKET_SECONDS):
+    rows = []
+    if not samples.empty:
+        created_at = pd.to_datetime(samples["created_at"], utc=True)
+        samples = samples.assign(bucket_start=created_at.dt.floor(pd.Timedelta(seconds=bucket_seconds)))
+        for protocol_name, protocol_samples in samples.groupby("protocol_name", sort=True):
+            rows.append(group_statistics(protocol_name, pd.NaT, protocol_samples))
+            for bucket_start, bucket in protocol_samples.groupby("bucket_start", sort=True):
+                rows.append(group_statistics(protocol_name, bucket_start, bucket))
+    return stats_frame(rows)
+
+# Statistics rows (from the RPC or aggregate_samples) as a DataFrame with the STATS_COLUMNS
+def stats_frame(rows):
+    stats = pd.DataFrame.from_records(rows, columns=list(STATS_COLUMNS))
+    stats["bucket_start"] = pd.to_datetime(stats["bucket_start"], utc=True)
+    numeric = [column for column in STATS_COLUMNS if column not in ("protocol_name", "bucket_start", "samples")]
+    stats[numeric] = stats[numeric].astype(float)
+    stats["samples"] = stats["samples"].astype(int)
+    return stats
+
+# The overall row of every protocol, indexed by protocol
+def overall(stats):
+    return stats[stats["bucket_start"].isna()].set_index("protocol_name")
+
+# One column per protocol, one row per bucket, of the given statistic
+def by_bucket(stats, column):
+    buckets = stats[stats["bucket_start"].notna()]
+    return buckets.pivot(index="bucket_start", columns="protocol_name", values=column)
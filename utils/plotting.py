@@ -9,4 +9,25 @@ def plot_interactive_chart(data_frame):
         fig.update_yaxes(title_text='Response Time (seconds)', tickformat=".5f")
         st.plotly_chart(fig)
     else:
-        st.write("Ooops...\n\nThere is no data available to plot, sorry 😢")
\ No newline at end of file
+        st.write("Ooops...\n\nThere is no data available to plot, sorry 😢")
+
+# One line per endpoint of a payload-size sweep, the given column against the message size
+def plot_payload_sweep(sweep_df, column, y_title):
+    if sweep_df.empty:
+        st.write("Ooops...\n\nThere is no data available to plot, sorry 😢")
+        return
+    fig = px.line(sweep_df.sort_values("payload_bytes"), x="payload_bytes", y=column, color="endpoint", markers=True,
+                  title=f"{y_title} by payload size 📏")
+    fig.update_xaxes(title_text='Message size (bytes)')
+    fig.update_yaxes(title_text=y_title)
+    st.plotly_chart(fig)
+
+# One line per protocol of a per-bucket statistic (utils.performance_stats.by_bucket)
+def plot_bucket_chart(bucket_df, y_title):
+    if bucket_df.empty:
+        st.write("Ooops...\n\nThere is no data available to plot, sorry 😢")
+        return
+    fig = px.line(bucket_df, markers=True, title="Protocol Performance Over Time 🎨")
+    fig.update_xaxes(title_text='Time')
+    fig.update_yaxes(title_text=y_title, tickformat=".5f")
+    st.plotly_chart(fig)
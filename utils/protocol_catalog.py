@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+# In-memory copy of the protocols table and the protocol_visuals paths. It is shared by every
+# session and rerun (see get_protocol_catalog) and loaded with two queries, again once it is
+# PROTOCOL_CATALOG_TTL seconds old or after invalidate(). When a refresh fails, the copy it
+# already has keeps being used.
+PROTOCOL_CATALOG_TTL = float(os.environ.get("PROTOCOL_CATALOG_TTL", "300"))
+
+class ProtocolCatalog:
+    def __init__(self, conn, ttl=PROTOCOL_CATALOG_TTL):
+        self.conn = conn
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.loads = 0
+        self.protocols_df = pd.DataFrame()
+        self.by_name = {}
+        self.visuals = {}
+
+    def load(self):
+        protocols_res = self.conn.table("protocols").select("*").execute()
+        visuals_res = self.conn.table("protocol_visuals").select("protocol_endpoint", "storage_path").execute()
+        protocols_df = pd.DataFrame(protocols_res.data) if protocols_res.data else pd.DataFrame()
+        self.by_name = {row["name"]: row for row in protocols_res.data or []}
+        self.visuals = {row["protocol_endpoint"]: row["storage_path"] for row in visuals_res.data or []}
+        self.protocols_df = protocols_df
+        self.loaded_at = time.monotonic()
+        self.loads += 1
+
+    # Loads the catalog when it was never loaded, has expired or was invalidated
+    def fresh(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+            return self
+        with self.lock:
+            if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.ttl:
+                try:
+                    self.load()
+                except Exception:
+                    if not self.by_name:
+                        raise
+                    # Stale beats nothing, try again after another TTL
+                    self.loaded_at = time.monotonic()
+        return self
+
+    # Next lookup reloads, e.g. after the protocols table was edited
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    # Every protocol, as the protocols table (callers filter it, they do not modify it)
+    def protocols(self):
+        return self.fresh().protocols_df
+
+    # Row of the protocol as a one-row DataFrame, empty when there is no such protocol
+    def details(self, protocol_name):
+        protocols_df = self.protocols()
+        if protocols_df.empty:
+            return protocols_df
+        return protocols_df[protocols_df["name"] == protocol_name].reset_index(drop=True)
+
+    def endpoint(self, protocol_name):
+        row = self.fresh().by_name.get(protocol_name)
+        return row["endpoint"] if row else None
+
+    # {name: endpoint} of the names that exist
+    def endpoints(self, protocol_names):
+        by_name = self.fresh().by_name
+        return {name: by_name[name]["endpoint"] for name in protocol_names if name in by_name}
+
+    def explanation_template(self, protocol_name):
+        row = self.fresh().by_name.get(protocol_name)
+        return row.get("protocol_explanation") if row else None
+
+    def visuals_path(self, endpoint):
+        return self.fresh().visuals.get(endpoint)
+
+    # Name, endpoint, explanation template and visuals path of one protocol, None when unknown
+    def entry(self, protocol_name):
+        row = self.fresh().by_name.get(protocol_name)
+        if row is None:
+            return None
+        return {
+            "name": protocol_name,
+            "endpoint": row["endpoint"],
+            "explanation_template": row.get("protocol_explanation"),
+            "visuals_path": self.visuals.get(row["endpoint"])
+        }
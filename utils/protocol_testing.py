@@ -1,62 +1,339 @@
+import hashlib
+import importlib
+import os
+import sys
+import threading
 import requests
 import time
 import json
+from contextlib import contextmanager, nullcontext
 import streamlit as st
+from utils import run_statistics
 
-# Function to call service side of the app and retrieve the information
-def test_protocol(endpoint, user_message):
-    simulate = False
+# Ways of running a test, from the most to the least overhead:
+#   full      Streamlit -> server 1 over HTTP -> server 2 over HTTP
+#   loopback  server 1 and server 2 handlers in this process, no sockets in between
+#   direct    both sides of the exchange calling shadow_crypt in this process
+TEST_MODES = ("full", "loopback", "direct")
+
+# Endpoints that take the user's message in a POST body
+MESSAGE_ENDPOINTS = ("rsa", "kem/kyber", "kem/ntru")
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "service")
+
+# Per-phase breakdown reported by server 1 (server 2 phases nested under "server2"), plus the time
+# left for the Streamlit to server 1 hop once server 1's own total is taken out
+def phase_timings(server_timings, response_time):
+    if not server_timings:
+        return None
+    timings = dict(server_timings)
+    server_total = timings.get('total_seconds')
+    if server_total is not None:
+        timings['client_overhead_seconds'] = max(response_time - server_total, 0.0)
+    timings['response_seconds'] = response_time
+    return timings
+
+# Phases of a direct run in the same shape as server 1's timings object
+class DirectTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.server2 = {}
+
+    @contextmanager
+    def phase(self, name, server2=False):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases = self.server2 if server2 else self.phases
+            phases[f"{name}_seconds"] = phases.get(f"{name}_seconds", 0.0) + time.perf_counter() - start
+
+    def as_dict(self):
+        return {**self.phases, 'server2': dict(self.server2), 'total_seconds': time.perf_counter() - self.start}
+
+# Both sides of each exchange in this process, answering with the same fields as server 1
+def direct_diffie_hellman(shadow_crypt, message, timer):
+    with timer.phase('keygen'):
+        private_key1, public_key1 = shadow_crypt.generate_dh_key()
+    with timer.phase('keygen', server2=True):
+        private_key2, public_key2 = shadow_crypt.generate_dh_key()
+    with timer.phase('derive', server2=True):
+        shadow_crypt.derive_dh_shared_key(private_key2, public_key1)
+    with timer.phase('derive'):
+        final_key = hashlib.sha256(shadow_crypt.derive_dh_shared_key(private_key1, public_key2)).hexdigest()
+    return {
+        'server1_private_key': private_key1.hex(),
+        'server1_public_key': public_key1.hex(),
+        'server2_public_key': public_key2.hex(),
+        'final_key': final_key
+    }
+
+def direct_ecdh(shadow_crypt, message, timer):
+    with timer.phase('keygen'):
+        private_key1, public_key1 = shadow_crypt.generate_ecdh_key()
+    with timer.phase('keygen', server2=True):
+        private_key2, public_key2 = shadow_crypt.generate_ecdh_key()
+    with timer.phase('derive', server2=True):
+        shadow_crypt.derive_ecdh_shared_key(private_key2, public_key1)
+    with timer.phase('derive'):
+        final_key = hashlib.sha256(shadow_crypt.derive_ecdh_shared_key(private_key1, public_key2)).hexdigest()
+    return {
+        'server1_private_key': private_key1.hex(),
+        'server1_public_key': public_key1.hex(),
+        'server2_public_key': public_key2.hex(),
+        'final_key': final_key
+    }
+
+def direct_rsa(shadow_crypt, message, timer):
+    with timer.phase('keygen'):
+        rsa_key = shadow_crypt.RsaKey.generate()
+        public_pem = rsa_key.public_pem()
+    with timer.phase('encrypt', server2=True):
+        encrypted_message = shadow_crypt.RsaKey.from_pem(public_pem).encrypt(message)
+    with timer.phase('decrypt'):
+        decrypted_message = rsa_key.decrypt(encrypted_message)
+    message_bytes = len(message.encode('utf-8'))
+    return {
+        'encrypted_message': encrypted_message.hex(),
+        'decrypted_message': decrypted_message,
+        'message_bytes': message_bytes,
+        'ciphertext_bytes': len(encrypted_message),
+        'expansion_bytes': len(encrypted_message) - message_bytes,
+        'server1_public_key': public_pem,
+        'server1_private_key': rsa_key.private_pem()
+    }
+
+def direct_kyber(shadow_crypt, message, timer):
+    with timer.phase('keygen'):
+        public_key, secret_key = shadow_crypt.kyber_keygen()
+    with timer.phase('encapsulate', server2=True):
+        ciphertext, _ = shadow_crypt.kyber_encapsulate(public_key)
+    with timer.phase('decapsulate'):
+        shared_secret = shadow_crypt.kyber_decapsulate(ciphertext, secret_key)
+    return {
+        'server1_public_key': public_key.hex(),
+        'server1_secret_key': secret_key.hex(),
+        'server2_ciphertext': ciphertext.hex(),
+        'shared_secret': shared_secret.hex()
+    }
+
+def direct_ntru(shadow_crypt, message, timer):
+    with timer.phase('keygen'):
+        public_key, private_key = shadow_crypt.ntru_generate_keypair()
+    with timer.phase('encapsulate', server2=True):
+        ciphertext, _ = shadow_crypt.ntru_encapsulate(public_key)
+    with timer.phase('decapsulate'):
+        shared_secret = shadow_crypt.ntru_decapsulate(private_key, ciphertext)
+        final_key = hashlib.sha256(shared_secret).hexdigest()
+    return {
+        'server1_public_key': public_key.hex(),
+        'server1_private_key': private_key.hex(),
+        'server2_ciphertext': ciphertext.hex(),
+        'shared_secret': shared_secret.hex(),
+        'final_key': final_key
+    }
+
+# Message through a KEM and ChaCha20-Poly1305, as server 1's /kem/<protocol> route does it
+def direct_kem(shadow_crypt, message, timer, keygen, encapsulate, decapsulate):
+    with timer.phase('keygen'):
+        public_key, secret_key = keygen()
+    with timer.phase('encapsulate', server2=True):
+        ciphertext, shared_secret = encapsulate(public_key)
+    with timer.phase('encrypt', server2=True):
+        nonce = os.urandom(shadow_crypt.AEAD_NONCE_BYTES)
+        encrypted_message = shadow_crypt.aead_encrypt(hashlib.sha256(shared_secret).digest(), nonce, message.encode('utf-8'), ciphertext)
+    with timer.phase('decapsulate'):
+        shared_secret = decapsulate(secret_key, ciphertext)
+    with timer.phase('decrypt'):
+        decrypted_message = shadow_crypt.aead_decrypt(hashlib.sha256(shared_secret).digest(), nonce, encrypted_message, ciphertext).decode('utf-8')
+    message_bytes = len(message.encode('utf-8'))
+    ciphertext_bytes = len(ciphertext) + len(nonce) + len(encrypted_message)
+    return {
+        'encrypted_message': encrypted_message.hex(),
+        'decrypted_message': decrypted_message,
+        'kem_ciphertext': ciphertext.hex(),
+        'nonce': nonce.hex(),
+        'message_bytes': message_bytes,
+        'ciphertext_bytes': ciphertext_bytes,
+        'expansion_bytes': ciphertext_bytes - message_bytes
+    }
+
+def direct_kem_kyber(shadow_crypt, message, timer):
+    return direct_kem(shadow_crypt, message, timer, shadow_crypt.kyber_keygen, shadow_crypt.kyber_encapsulate,
+                      lambda secret_key, ciphertext: shadow_crypt.kyber_decapsulate(ciphertext, secret_key))
+
+def direct_kem_ntru(shadow_crypt, message, timer):
+    return direct_kem(shadow_crypt, message, timer, shadow_crypt.ntru_generate_keypair, shadow_crypt.ntru_encapsulate,
+                      shadow_crypt.ntru_decapsulate)
+
+DIRECT_EXCHANGES = {
+    'diffie_hellman': direct_diffie_hellman,
+    'ecdh': direct_ecdh,
+    'rsa': direct_rsa,
+    'kyber': direct_kyber,
+    'ntru': direct_ntru,
+    'kem/kyber': direct_kem_kyber,
+    'kem/ntru': direct_kem_ntru
+}
+
+# Server module imported from its service directory. The server's own modules are dropped from
+# sys.modules once it holds them, so each server gets its own copy; the helpers in service/common
+# (executor, metrics, timing, ...) are the same modules for both.
+def load_server(directory, module_name):
+    directory = os.path.abspath(directory)
+    before = set(sys.modules)
+    sys.path.insert(0, directory)
     try:
+        return importlib.import_module(module_name)
+    finally:
+        sys.path.remove(directory)
+        for name in set(sys.modules) - before:
+            module_file = getattr(sys.modules[name], '__file__', None) or ''
+            if os.path.dirname(os.path.abspath(module_file)) == directory:
+                del sys.modules[name]
+
+# Loopback runs one copy of each server per Streamlit process, shared by every session: the test
+# client, server 1's transport, key pools and crypto executor are module globals. Sessions take
+# turns on it, one timed exchange at a time, so they neither race on that state nor count each
+# other's work in a measurement (process_time is per process). Concurrent loopback runs of two
+# sessions are therefore serialized; use full mode to load the servers from several clients.
+LOOPBACK_LOCK = threading.Lock()
+
+# Server 1 test client whose calls to server 2 go to server 2's test client, built once per process.
+# Call with LOOPBACK_LOCK held.
+@st.cache_resource
+def get_loopback_client():
+    server2 = load_server(os.path.join(SERVICE_DIR, "server2"), "f_server_2")
+    server1 = load_server(os.path.join(SERVICE_DIR, "server1"), "f_server_1")
+    server1.transport.use_loopback(server2.app.test_client())
+    return server1.app.test_client()
 
-        BACKEND_URL = st.secrets.get("SERVER1_URL", "http://localhost:5000")
-        
-        start_time = time.time()
-        
-        # Track request size
-        request_size = 0
-        if endpoint == 'rsa' and user_message:
-            # FPOST requests
-            request_body = json.dumps({'message': user_message})
-            request_size = len(request_body.encode('utf-8'))
-            response = requests.post(f"{BACKEND_URL}/{endpoint}", json={'message': user_message})
+# One call to server 1 (over HTTP or in process), returns (status code, body bytes, JSON)
+def call_server1(endpoint, user_message, wire, mode):
+    if mode == "loopback":
+        client = get_loopback_client()
+        if endpoint in MESSAGE_ENDPOINTS and user_message:
+            response = client.post(f"/{endpoint}", json={'message': user_message}, query_string={'wire': wire})
         else:
-            # GET requests
-            response = requests.get(f"{BACKEND_URL}/{endpoint}")
-        
-        end_time = time.time()
-        response_time = end_time - start_time
-        
-        # Response size
-        response_size = len(response.content)
-        
-        # Bandwidth in Mbps
-        bandwidth = (request_size + response_size) * 8 / (response_time * 1e6) if response_time > 0 else 0
-        
-        # Encryption overhead
-        encryption_overhead = None
-        if endpoint == 'rsa' and user_message:
-            encrypted_message = response.json().get('encrypted_message', '')
-            original_size = len(user_message.encode('utf-8'))
-            encrypted_size = len(encrypted_message.encode('utf-8'))
-            encryption_overhead = encrypted_size - original_size
-        
-        response_json = response.json()
-        st.write(response_json)
-        
-        if response.status_code == 200 and response_json.get('success', True):
-            if not simulate:
-                return {
-                    "response_time": response_time,
-                    "bandwidth": bandwidth,
-                    "encryption_overhead": encryption_overhead,
-                    "response_json": response_json
-                }
+            response = client.get(f"/{endpoint}", query_string={'wire': wire})
+        return response.status_code, response.get_data(), response.get_json(silent=True) or {}
+
+    BACKEND_URL = st.secrets.get("SERVER1_URL", "http://localhost:5000")
+    if endpoint in MESSAGE_ENDPOINTS and user_message:
+        # FPOST requests
+        response = requests.post(f"{BACKEND_URL}/{endpoint}", json={'message': user_message}, params={'wire': wire})
+    else:
+        # GET requests
+        response = requests.get(f"{BACKEND_URL}/{endpoint}", params={'wire': wire})
+    return response.status_code, response.content, response.json()
+
+# Both sides in this process, the answer is what server 1 would have sent back
+def run_direct(endpoint, user_message):
+    import shadow_crypt
+
+    timer = DirectTimer()
+    response_json = {'success': True, **DIRECT_EXCHANGES[endpoint](shadow_crypt, user_message or "Hello, world!", timer)}
+    response_json['timings'] = timer.as_dict()
+    return 200, json.dumps(response_json).encode('utf-8'), response_json
+
+# One timed exchange, returns the measurements and the response or raises when the exchange failed.
+# cpu_seconds is the CPU time spent in this process, which covers the crypto only in direct and
+# loopback mode (in full mode the servers' CPU is their own).
+def measure_once(endpoint, user_message, wire="json", mode="full"):
+    # Track request size
+    request_size = 0
+    if endpoint in MESSAGE_ENDPOINTS and user_message:
+        request_body = json.dumps({'message': user_message})
+        request_size = len(request_body.encode('utf-8'))
+
+    with LOOPBACK_LOCK if mode == "loopback" else nullcontext():
+        # Monotonic high resolution clock, wall-clock time can jump mid request
+        start_time = time.perf_counter()
+        start_cpu = time.process_time()
+
+        if mode == "direct":
+            status_code, content, response_json = run_direct(endpoint, user_message)
         else:
-            if not simulate:
-                st.error(f"Failed to test {endpoint}: Server responded with status code {response.status_code}")
-                return None
-            
+            status_code, content, response_json = call_server1(endpoint, user_message, wire, mode)
+
+        response_time = time.perf_counter() - start_time
+        cpu_time = time.process_time() - start_cpu
+
+    if status_code != 200 or not response_json.get('success', True):
+        raise RuntimeError(f"Server responded with status code {status_code}")
+
+    # Response size
+    response_size = len(content)
+
+    # Bytes over latency of a single request, throughput of a run is measured separately
+    bandwidth = (request_size + response_size) * 8 / (response_time * 1e6) if response_time > 0 else 0
+
+    # Encryption overhead in raw bytes (the hex text on the wire would count every byte twice)
+    encryption_overhead = None
+    if endpoint in MESSAGE_ENDPOINTS and user_message:
+        encryption_overhead = response_json.get('expansion_bytes')
+        if encryption_overhead is None:
+            encrypted_size = len(bytes.fromhex(response_json.get('encrypted_message', '')))
+            encryption_overhead = encrypted_size - len(user_message.encode('utf-8'))
+
+    return {
+        "mode": mode,
+        "response_time": response_time,
+        "cpu_time": cpu_time,
+        "bytes": request_size + response_size,
+        "bandwidth": bandwidth,
+        "encryption_overhead": encryption_overhead,
+        "wire_stats": response_json.get('wire'),
+        "timings": phase_timings(response_json.get('timings'), response_time),
+        "response_json": response_json
+    }
+
+# Function to call service side of the app and retrieve the information,
+# wire picks how server 1 and server 2 encode keys between them ("json" or "binary")
+# and mode how much of the stack the test goes through (see TEST_MODES)
+def test_protocol(endpoint, user_message, wire="json", mode="full"):
+    try:
+        result = measure_once(endpoint, user_message, wire, mode)
+        st.write(result["response_json"])
+        return result
     except Exception as e:
-        if not simulate:
-            st.error(f"Failed to test {endpoint}: {e}")
-            return None
\ No newline at end of file
+        st.error(f"Failed to test {endpoint}: {e}")
+        return None
+
+# Repeated run: warmup exchanges are thrown away, then every iteration records its wall and CPU
+# time. Outliers (Tukey's fences on the wall time) are left out of the latency statistics but kept
+# in the samples. Throughput is completed exchanges and bytes over the wall time of the whole
+# measured loop, not derived from single request latencies.
+def run_repeated(endpoint, user_message, wire="json", mode="full", iterations=30, warmup=3, progress=None):
+    for _ in range(warmup):
+        measure_once(endpoint, user_message, wire, mode)
+
+    samples = []
+    loop_start = time.perf_counter()
+    for iteration in range(iterations):
+        samples.append(measure_once(endpoint, user_message, wire, mode))
+        if progress:
+            progress(iteration + 1, iterations)
+    loop_seconds = time.perf_counter() - loop_start
+
+    latencies = [sample["response_time"] for sample in samples]
+    kept, outliers = run_statistics.remove_outliers(latencies)
+    total_bytes = sum(sample["bytes"] for sample in samples)
+    return {
+        "mode": mode,
+        "wire": wire,
+        "iterations": iterations,
+        "warmup": warmup,
+        "samples": samples,
+        "summary": {
+            "latency_seconds": run_statistics.summarize(kept),
+            "cpu_seconds": run_statistics.summarize([sample["cpu_time"] for sample in samples]),
+            "outliers": len(outliers),
+            "throughput": {
+                "loop_seconds": loop_seconds,
+                "requests_per_second": iterations / loop_seconds if loop_seconds > 0 else 0,
+                "mbps": total_bytes * 8 / (loop_seconds * 1e6) if loop_seconds > 0 else 0
+            }
+        }
+    }
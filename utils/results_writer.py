@@ -0,0 +1,231 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import uuid
+
+# Write-behind writer of the test results: save_test_results only queues the rows, a background
+# thread gathers them for up to RESULTS_FLUSH_SECONDS or RESULTS_FLUSH_ROWS rows and writes them
+# with one multi-row insert, the protocol names resolved to endpoints with resolve (one query per
+# flush when none is given). Failed writes are retried with exponential backoff, what is still
+# queued is written when the process exits.
+#
+# Every row and batch gets a write_id when it is queued (see sql/006_idempotent_result_writes.sql):
+# rows are upserted on it, ignoring the ones already there, and a batch is written together with
+# its samples by BATCH_FUNCTION, so a retry of a write that did go through
+# (e.g. the response timed out) neither duplicates rows nor leaves a batch without its samples.
+RESULTS_FLUSH_ROWS = int(os.environ.get("RESULTS_FLUSH_ROWS", "500"))
+RESULTS_FLUSH_SECONDS = float(os.environ.get("RESULTS_FLUSH_SECONDS", "2"))
+RESULTS_MAX_RETRIES = int(os.environ.get("RESULTS_MAX_RETRIES", "5"))
+RESULTS_RETRY_SECONDS = float(os.environ.get("RESULTS_RETRY_SECONDS", "0.5"))
+# Rows allowed to wait in memory, adding more raises queue.Full
+RESULTS_QUEUE_ROWS = int(os.environ.get("RESULTS_QUEUE_ROWS", "100000"))
+
+# Queue markers: write what has been gathered right away / write it and stop
+FLUSH = object()
+STOP = object()
+
+# Database function writing a batch and its samples in one transaction
+BATCH_FUNCTION = "save_performance_batch"
+
+# Raised for an insert the API answered with an error instead of raising itself
+class WriteError(Exception):
+    pass
+
+def execute(query):
+    result = query.execute()
+    error = result.model_dump().get("error")
+    if error:
+        raise WriteError(getattr(error, "message", str(error)))
+    return result
+
+# Copy of the row with a new write_id, kept by every attempt to write it
+def with_write_id(row):
+    return {**row, "write_id": str(uuid.uuid4())}
+
+class ResultsWriter:
+    def __init__(self, conn, flush_rows=RESULTS_FLUSH_ROWS, flush_seconds=RESULTS_FLUSH_SECONDS,
+                 max_retries=RESULTS_MAX_RETRIES, retry_seconds=RESULTS_RETRY_SECONDS, max_rows=RESULTS_QUEUE_ROWS,
+                 resolve=None):
+        self.conn = conn
+        # {name: endpoint} of a list of protocol names
+        self.resolve = resolve or self.query_endpoints
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.retry_seconds = retry_seconds
+        self.max_rows = max_rows
+        self.items = queue.Queue()
+        self.lock = threading.Lock()
+        self.drained = threading.Condition(self.lock)
+        # Rows queued or being written
+        self.pending = 0
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.flushes = 0
+        self.last_error = None
+        # Failures since take_failures() was last called
+        self.unreported = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="results-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, item, rows):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("The results writer is closed")
+            if self.pending + rows > self.max_rows:
+                raise queue.Full(f"{self.pending} result rows are already waiting to be written")
+            self.pending += rows
+        self.items.put(item)
+
+    # One protocol_performance row of the protocol called protocol_name
+    def add(self, protocol_name, row):
+        self.enqueue({"protocol": protocol_name, "rows": [with_write_id(row)]}, 1)
+
+    # A protocol_performance_batches row and its samples, which get its id as batch_id
+    def add_batch(self, protocol_name, batch_row, rows):
+        self.enqueue({"protocol": protocol_name, "batch": with_write_id(batch_row),
+                      "rows": [with_write_id(row) for row in rows]}, len(rows))
+
+    # Rows waiting to be written
+    def depth(self):
+        with self.lock:
+            return self.pending
+
+    # Writes what is queued now and waits until the queue is empty, False on timeout
+    def flush(self, timeout=None):
+        self.items.put(FLUSH)
+        with self.lock:
+            return self.drained.wait_for(lambda: self.pending == 0, timeout)
+
+    # Writes what is left and stops the thread, safe to call more than once
+    def close(self, timeout=30):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.items.put(STOP)
+        self.thread.join(timeout)
+
+    # (rows that failed since the last call, last error), for the UI to report
+    def take_failures(self):
+        with self.lock:
+            failures, self.unreported = self.unreported, 0
+            return failures, self.last_error
+
+    def stats(self):
+        with self.lock:
+            return {
+                'queued_rows': self.pending,
+                'written_rows': self.written,
+                'failed_rows': self.failed,
+                'retries': self.retries,
+                'flushes': self.flushes,
+                'last_error': self.last_error
+            }
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            item = self.items.get()
+            items, rows = [], 0
+            deadline = time.monotonic() + self.flush_seconds
+            # Gather until the flush size, the flush delay or a marker
+            while True:
+                if item is STOP:
+                    stopping = True
+                    break
+                if item is not FLUSH:
+                    items.append(item)
+                    rows += len(item["rows"])
+                if item is FLUSH or rows >= self.flush_rows:
+                    break
+                try:
+                    item = self.items.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            # A stop writes everything still queued behind it
+            while stopping:
+                try:
+                    item = self.items.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not FLUSH and item is not STOP:
+                    items.append(item)
+            if items:
+                self.write(items)
+
+    # Calls write() until it works or the retries are used up, backing off exponentially
+    def attempt(self, write):
+        for retry in range(self.max_retries + 1):
+            try:
+                return write()
+            except Exception:
+                if retry == self.max_retries:
+                    raise
+                with self.lock:
+                    self.retries += 1
+                time.sleep(self.retry_seconds * 2 ** retry)
+
+    def query_endpoints(self, names):
+        found = execute(self.conn.table("protocols").select("name", "endpoint").in_("name", names))
+        return {row["name"]: row["endpoint"] for row in found.data or []}
+
+    def write(self, items):
+        outcomes = []
+        try:
+            names = sorted({item["protocol"] for item in items})
+            endpoints = self.attempt(lambda: self.resolve(names))
+        except Exception as e:
+            self.finished([(len(item["rows"]), f"Protocol lookup failed: {e}") for item in items])
+            return
+
+        # Every single row goes in with one upsert, each batch with one call of BATCH_FUNCTION
+        singles = [item for item in items if "batch" not in item and item["protocol"] in endpoints]
+        outcomes += [(len(item["rows"]), f"Protocol endpoint not found: {item['protocol']}")
+                     for item in items if item["protocol"] not in endpoints]
+        if singles:
+            rows = [{**row, "protocol_name": endpoints[item["protocol"]]} for item in singles for row in item["rows"]]
+            outcomes.append((len(rows), self.insert("protocol_performance", rows)))
+        for item in items:
+            if "batch" in item and item["protocol"] in endpoints:
+                outcomes.append((len(item["rows"]), self.write_batch(endpoints[item["protocol"]], item)))
+        self.finished(outcomes)
+
+    # None when written, the error otherwise. Rows an earlier attempt already wrote are skipped.
+    def insert(self, table, rows):
+        try:
+            self.attempt(lambda: execute(self.conn.table(table).upsert(rows, on_conflict="write_id",
+                                                                       ignore_duplicates=True)))
+            return None
+        except Exception as e:
+            return f"Error saving to {table}: {e}"
+
+    def write_batch(self, endpoint, item):
+        try:
+            self.attempt(lambda: execute(self.conn.client.rpc(BATCH_FUNCTION, {
+                "batch": {**item["batch"], "protocol_name": endpoint},
+                "samples": item["rows"]
+            })))
+            return None
+        except Exception as e:
+            return f"Error saving test batch: {e}"
+
+    # outcomes: (rows, None or error) per write
+    def finished(self, outcomes):
+        with self.lock:
+            self.flushes += 1
+            for rows, error in outcomes:
+                self.pending -= rows
+                if error is None:
+                    self.written += rows
+                else:
+                    self.failed += rows
+                    self.unreported += rows
+                    self.last_error = error
+            if self.pending == 0:
+                self.drained.notify_all()
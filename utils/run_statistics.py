@@ -0,0 +1,55 @@
+import math
+import statistics
+
+# Summary statistics of repeated measurements (latencies in seconds)
+
+# Two-sided 95% Student t quantiles by degrees of freedom, normal quantile beyond the table
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+        10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042}
+
+PERCENTILES = (5, 25, 75, 90, 95, 99)
+
+def t_quantile(degrees):
+    known = [d for d in T_95 if d <= degrees]
+    return T_95[max(known)] if degrees <= 30 else 1.960
+
+# Percentile (0-100) of already sorted values, linear interpolation between closest ranks
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+# Values inside Tukey's fences (1.5 interquartile ranges beyond the quartiles) and the ones outside.
+# Fewer than four values have no meaningful quartiles and are all kept.
+def remove_outliers(values, fence=1.5):
+    if len(values) < 4:
+        return list(values), []
+    ordered = sorted(values)
+    q1, q3 = percentile(ordered, 25), percentile(ordered, 75)
+    low, high = q1 - fence * (q3 - q1), q3 + fence * (q3 - q1)
+    kept = [value for value in values if low <= value <= high]
+    return kept, [value for value in values if not low <= value <= high]
+
+# Mean, median, stdev, percentiles and the 95% confidence interval of the mean
+def summarize(values):
+    ordered = sorted(values)
+    count = len(ordered)
+    if not count:
+        return {"count": 0}
+    mean = statistics.fmean(ordered)
+    stdev = statistics.stdev(ordered) if count > 1 else 0.0
+    half_width = t_quantile(count - 1) * stdev / math.sqrt(count) if count > 1 else 0.0
+    return {
+        "count": count,
+        "mean": mean,
+        "median": percentile(ordered, 50),
+        "stdev": stdev,
+        "min": ordered[0],
+        "max": ordered[-1],
+        **{f"p{p}": percentile(ordered, p) for p in PERCENTILES},
+        "ci95_low": mean - half_width,
+        "ci95_high": mean + half_width
+    }